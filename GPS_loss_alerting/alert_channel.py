@@ -0,0 +1,215 @@
+"""Local delivery of alerts from diff_starlink_gps.py to starlink_gps_alert.py.
+
+Alerts are still appended to $HOME/logs/starlink_gps_alerts.txt, so other
+programs can watch that file. On top of that:
+
+- The writer sends a wake-up datagram to a Unix socket after each append, so
+  the sender reacts immediately instead of polling once a minute.
+- The sender never truncates the file while the writer may be appending.
+  It remembers how far it has delivered (the acknowledged offset) in
+  starlink_gps_alerts.ack, and only advances it after an alert was sent.
+  Delivery is therefore at-least-once: a crash between sending and
+  acknowledging sends the alert again on restart, but nothing is lost.
+- Once everything is delivered, the sender renames the file out of the way
+  (the writer then starts a new one) and deletes the renamed file after a
+  grace period, picking up anything written to it in the meantime.
+- Offsets are kept per inode, together with the first HEAD_BYTES of the
+  file. Once a file is deleted its inode can be reused by a new alerts file;
+  a different start, or a file shorter than the offset, shows that the
+  offset belongs to the old file, and the new file is read from the start.
+"""
+
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+ALERTS_FILENAME = "starlink_gps_alerts.txt"
+ACK_FILENAME = "starlink_gps_alerts.ack"
+NOTIFY_SOCKET_FILENAME = "starlink_gps_alerts.sock"
+# Suffix of a fully delivered alerts file that has been moved aside
+DRAIN_SUFFIX = ".drain"
+# A moved-aside file is only deleted once it has been quiet this long
+DRAIN_GRACE_S = 2.0
+# Bytes at the start of each file kept with its offset, to tell a reused inode
+HEAD_BYTES = 64
+
+
+class AlertNotifier:
+    """Writer side: wakes up the alert sender after an alert was appended."""
+
+    def __init__(self, socket_path):
+        self.socket_path = str(socket_path)
+        try:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        except (AttributeError, OSError):
+            # No Unix datagram sockets (e.g. Windows): the sender polls instead
+            self._sock = None
+
+    def notify(self):
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendto(b'1', self.socket_path)
+        except OSError:
+            # The sender isn't running or its queue is full; it will catch up
+            pass
+
+
+class AlertListener:
+    """Sender side: waits for wake-up datagrams from AlertNotifier."""
+
+    def __init__(self, socket_path):
+        self.socket_path = str(socket_path)
+        try:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+            self._sock.bind(self.socket_path)
+        except (AttributeError, OSError):
+            self._sock = None
+
+    @property
+    def push_enabled(self):
+        return self._sock is not None
+
+    def wait(self, timeout):
+        """Returns when notified or after `timeout` seconds, whichever is first."""
+        if self._sock is None:
+            time.sleep(timeout)
+            return
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.recv(16)
+        except socket.timeout:
+            return
+        # Several alerts may have been written; one wake-up covers them all
+        self._sock.setblocking(False)
+        try:
+            while True:
+                self._sock.recv(16)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
+class AlertFileReader:
+    """Reads undelivered alerts and tracks the acknowledged offsets.
+
+    Offsets are kept per inode, so they stay valid when the alerts file is
+    moved aside and the writer starts a new one, and are checked against the
+    start of the file in case the inode was reused.
+    """
+
+    def __init__(self, alerts_file, ack_file):
+        self.alerts_file = Path(alerts_file)
+        self.drain_file = self.alerts_file.with_name(self.alerts_file.name + DRAIN_SUFFIX)
+        self.ack_file = Path(ack_file)
+        # Acknowledged offset and first HEAD_BYTES bytes of each file, keyed by inode
+        self.offsets = {}
+        self.heads = {}
+        # How far each file has been read, which may be ahead of the
+        # acknowledged offset while alerts are waiting to be sent
+        self._read = {}
+        # When the alerts file was last moved aside (rename keeps its mtime)
+        self._drained_at = time.monotonic()
+        try:
+            state = json.loads(self.ack_file.read_text())
+            self.offsets = {int(inode): offset for inode, offset in state["offsets"].items()}
+            # Ack files written before heads were kept have none; their offsets are trusted
+            self.heads = {int(inode): bytes.fromhex(head) for inode, head in state.get("heads", {}).items()}
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def _files(self):
+        """Returns (path, stat) for the moved-aside file and the alerts file, oldest first.
+
+        Forgets the offsets of an inode that now belongs to a different file.
+        """
+        files = []
+        for path in (self.drain_file, self.alerts_file):
+            try:
+                st = os.stat(path)
+                with open(path, 'rb') as f:
+                    head = f.read(HEAD_BYTES)
+            except FileNotFoundError:
+                continue
+            inode = st.st_ino
+            known = self.heads.get(inode)
+            # A file only grows, so its start stays the same
+            if st.st_size < self.offsets.get(inode, 0) or (known is not None and head[:len(known)] != known):
+                self.offsets.pop(inode, None)
+                self._read.pop(inode, None)
+            self.heads[inode] = head
+            files.append((path, st))
+        return files
+
+    def read_pending(self):
+        """Returns (text, token) for complete alert lines not read before.
+
+        text is empty when there is nothing new. Pass token to ack() once the
+        text has been delivered. Unacknowledged alerts are read again only
+        after a restart, so the caller must hold on to them until delivered.
+        """
+        for path, st in self._files():
+            offset = max(self.offsets.get(st.st_ino, 0), self._read.get(st.st_ino, 0))
+            if st.st_size <= offset:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # Only deliver whole lines; a partially written line waits for the next read
+            end = data.rfind(b'\n') + 1
+            if end:
+                self._read[st.st_ino] = offset + end
+                return data[:end].decode('utf-8', errors='replace'), (st.st_ino, offset + end)
+        return '', None
+
+    def ack(self, *tokens):
+        """Records that the text returned with each token has been delivered."""
+        if not tokens:
+            return
+        for inode, offset in tokens:
+            self.offsets[inode] = max(offset, self.offsets.get(inode, 0))
+        self._save()
+
+    def _save(self):
+        live = {st.st_ino for _, st in self._files()}
+        self.offsets = {inode: offset for inode, offset in self.offsets.items() if inode in live}
+        self.heads = {inode: head for inode, head in self.heads.items() if inode in live}
+        self._read = {inode: offset for inode, offset in self._read.items() if inode in live}
+        tmp = self.ack_file.with_name(self.ack_file.name + '.tmp')
+        tmp.write_text(json.dumps({"offsets": {str(i): o for i, o in self.offsets.items()},
+                                   "heads": {str(i): h.hex() for i, h in self.heads.items()}}))
+        os.replace(tmp, self.ack_file)
+
+    def compact(self):
+        """Moves fully delivered alerts out of the way so the file doesn't grow forever.
+
+        Call this only when read_pending() returned nothing.
+        """
+        for path, st in self._files():
+            if st.st_size != self.offsets.get(st.st_ino, 0):
+                continue
+            if path == self.drain_file:
+                # Delete the moved-aside file once no writer that opened it
+                # before the rename can still append to it.
+                if (time.monotonic() - self._drained_at >= DRAIN_GRACE_S
+                        and time.time() - st.st_mtime >= DRAIN_GRACE_S):
+                    os.unlink(path)
+                    self._save()
+            elif st.st_size > 0 and not self.drain_file.exists():
+                # The offset follows the inode, so late writes are still read
+                os.replace(self.alerts_file, self.drain_file)
+                self._drained_at = time.monotonic()
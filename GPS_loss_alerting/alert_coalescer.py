@@ -0,0 +1,255 @@
+"""Coalescing and per-channel rate limiting of alerts before they are sent.
+
+When the GPS/Starlink difference hovers around the threshold, or a jammer
+comes and goes, diff_starlink_gps.py can write alerts far faster than anyone
+wants to read them. The sender hands every new alert line to an
+AlertCoalescer instead of sending it straight away. Each channel then gets:
+
+- the first alert after a quiet period immediately;
+- nothing more for at least COALESCE_WINDOW_S, and never more than its rate
+  limit allows (a burst of messages, then one per interval);
+- everything that arrived meanwhile as one summary message, with a count of
+  each kind of alert and its latest instance.
+
+Channels are limited independently, so a slow email limit doesn't hold back
+Telegram. Alerts are only acknowledged in the alerts file once every channel
+has delivered them, so delivery is still at-least-once across restarts.
+"""
+
+import re
+import time
+from collections import deque
+
+from alert_dispatcher import PermanentDeliveryError
+
+# Shortest time between two messages to the same channel. Alerts arriving
+# within it are merged into the next message.
+COALESCE_WINDOW_S = 30.0
+# Wait this long before trying a channel again after a failed send
+COALESCE_RETRY_S = 30.0
+# Most kinds of alert listed in one summary; the rest are only counted
+SUMMARY_MAX_KINDS = 10
+# Rate limit of channels that don't define one: (burst, interval_s)
+DEFAULT_RATE_LIMIT = (5, 300.0)
+
+# Decimal numbers (positions, distances, percentiles) don't make a different
+# kind of alert; "Zone 3" or "2 minutes" do.
+_DECIMAL = re.compile(r'-?\d+\.\d+')
+
+
+class RateLimit:
+    """Token bucket: up to `burst` messages at once, then one every `interval_s`."""
+    __slots__ = ('burst', 'interval_s', 'tokens', 'updated')
+
+    def __init__(self, burst, interval_s, now):
+        self.burst = burst
+        self.interval_s = interval_s
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now):
+        if self.interval_s > 0:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated) / self.interval_s)
+        else:
+            self.tokens = float(self.burst)
+        self.updated = now
+
+    def ready_at(self, now):
+        """Earliest time at which a message may be sent."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return now
+        return now + (1.0 - self.tokens) * self.interval_s
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+def _split(line):
+    """Splits a '<timestamp> - <message>' alert line."""
+    timestamp, sep, text = line.partition(' - ')
+    return (timestamp, text) if sep else ('', line)
+
+
+def summarize(lines):
+    """Merges alert lines into one message: a count per kind of alert and its latest instance."""
+    if len(lines) == 1:
+        return lines[0]
+    # kind -> [count, latest line]; dicts keep the order of first occurrence
+    kinds = {}
+    for line in lines:
+        key = _DECIMAL.sub('#', _split(line)[1])
+        entry = kinds.get(key)
+        if entry is None:
+            kinds[key] = [1, line]
+        else:
+            entry[0] += 1
+            entry[1] = line
+    first, last = _split(lines[0])[0], _split(lines[-1])[0]
+    out = [f"{len(lines)} alerts from {first} to {last}:"]
+    for count, line in list(kinds.values())[:SUMMARY_MAX_KINDS]:
+        timestamp, text = _split(line)
+        out.append(f"{count} x {text}" + (f" (last at {timestamp})" if count > 1 else ""))
+    if len(kinds) > SUMMARY_MAX_KINDS:
+        out.append(f"... and {len(kinds) - SUMMARY_MAX_KINDS} more kinds of alert.")
+    out.append(f"Latest: {lines[-1]}")
+    return "\n".join(out)
+
+
+class _ChannelState:
+    __slots__ = ('name', 'limit', 'delivered_seq', 'last_sent', 'retry_at', 'messages', 'alerts')
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        # Sequence number of the last alert delivered to this channel
+        self.delivered_seq = 0
+        self.last_sent = None
+        self.retry_at = None
+        # Messages sent, and the alerts they contained
+        self.messages = 0
+        self.alerts = 0
+
+
+class AlertCoalescer:
+    """Holds alerts until each channel may send again, then sends them as one message.
+
+    `dispatcher` is an AlertDispatcher. The rate limit of a channel is its
+    `rate_limit` attribute, a (burst, interval_s) pair. `on_sent` is called
+    with the channel name and the text of every message delivered.
+    """
+
+    def __init__(self, dispatcher, window_s=COALESCE_WINDOW_S, retry_s=COALESCE_RETRY_S,
+                 clock=time.monotonic, on_sent=None):
+        self.dispatcher = dispatcher
+        self.on_sent = on_sent
+        self.window_s = window_s
+        self.retry_s = retry_s
+        self.clock = clock
+        now = clock()
+        self.channels = [_ChannelState(channel.name,
+                                       RateLimit(*getattr(channel, 'rate_limit', DEFAULT_RATE_LIMIT), now))
+                         for channel in dispatcher.channels]
+        # Alerts not yet delivered to every channel, as (seq, line)
+        self._pending = deque()
+        # (seq of the last alert read with it, reader token), oldest first
+        self._tokens = deque()
+        self._seq = 0
+        # Alerts received, and messages sent to all channels
+        self.received = 0
+        self.sent = 0
+
+    def add(self, text, token):
+        """Queues the alert lines read from the alerts file with `token`."""
+        for line in text.splitlines():
+            if line.strip():
+                self._seq += 1
+                self._pending.append((self._seq, line))
+                self.received += 1
+        self._tokens.append((self._seq, token))
+
+    def _due_at(self, state, now):
+        """When the channel may next send, or None if it has nothing to send."""
+        if not self._pending or self._pending[-1][0] <= state.delivered_seq:
+            return None
+        due = state.limit.ready_at(now)
+        if state.last_sent is not None:
+            due = max(due, state.last_sent + self.window_s)
+        if state.retry_at is not None:
+            due = max(due, state.retry_at)
+        return due
+
+    def next_due(self):
+        """Monotonic time at which flush() has something to send, or None."""
+        now = self.clock()
+        times = [t for t in (self._due_at(state, now) for state in self.channels) if t is not None]
+        return min(times) if times else None
+
+    def flush(self):
+        """Sends to every channel that is due. Returns the reader tokens that can
+        now be acknowledged, oldest first."""
+        batches = self.prepare()
+        results = self.dispatcher.deliver({name: batch[2] for name, batch in batches.items()}) if batches else {}
+        return self.complete(batches, results)
+
+    def prepare(self):
+        """Returns {channel name: (seq, alert count, message)} for the channels that are due.
+
+        Deliver the messages, e.g. with dispatcher.deliver() in a worker
+        thread, then pass the batches and results to complete().
+        """
+        now = self.clock()
+        batches = {}
+        for state in self.channels:
+            due = self._due_at(state, now)
+            if due is None or due > now:
+                continue
+            batch = [line for seq, line in self._pending if seq > state.delivered_seq]
+            batches[state.name] = (self._seq, len(batch), summarize(batch))
+        return batches
+
+    def complete(self, batches, results):
+        """Records the results ({channel name: error or None}) of delivering the
+        batches from prepare(). Returns the reader tokens that can now be
+        acknowledged, oldest first."""
+        now = self.clock()
+        for state in self.channels:
+            if state.name not in results:
+                continue
+            error = results[state.name]
+            seq, count, message = batches[state.name]
+            if isinstance(error, PermanentDeliveryError):
+                # Retrying won't help; don't hold up the other channels
+                state.delivered_seq = seq
+                print(f"{state.name}: dropped {count} alerts: {error}")
+            elif error is None:
+                state.delivered_seq = seq
+                state.limit.take(now)
+                state.last_sent = now
+                state.retry_at = None
+                state.messages += 1
+                self.sent += 1
+                state.alerts += count
+                if count > 1:
+                    print(f"{state.name}: sent {count} alerts as one message")
+                if self.on_sent is not None:
+                    self.on_sent(state.name, message)
+            else:
+                state.retry_at = now + self.retry_s
+        return self._release()
+
+    def state(self):
+        """Returns the rate limit state of each channel for a checkpoint, times as ages in seconds."""
+        now = self.clock()
+        result = {}
+        for state in self.channels:
+            state.limit.ready_at(now)  # Brings the token count up to date
+            result[state.name] = {
+                "tokens": state.limit.tokens,
+                "last_sent_age_s": None if state.last_sent is None else now - state.last_sent,
+            }
+        return result
+
+    def restore(self, saved, age):
+        """Restores state() saved `age` seconds ago, so a restart doesn't reset the rate limits."""
+        now = self.clock()
+        for state in self.channels:
+            channel = saved.get(state.name)
+            if channel is None:
+                continue
+            state.limit.tokens = min(float(channel["tokens"]), float(state.limit.burst))
+            # Tokens keep refilling over the time the sender was down
+            state.limit.updated = now - age
+            if channel["last_sent_age_s"] is not None:
+                state.last_sent = now - age - channel["last_sent_age_s"]
+
+    def _release(self):
+        """Forgets alerts delivered everywhere and returns the tokens covering them."""
+        delivered = min((state.delivered_seq for state in self.channels), default=self._seq)
+        while self._pending and self._pending[0][0] <= delivered:
+            self._pending.popleft()
+        tokens = []
+        while self._tokens and self._tokens[0][0] <= delivered:
+            tokens.append(self._tokens.popleft()[1])
+        return tokens
@@ -0,0 +1,167 @@
+"""Concurrent delivery of alert messages to all configured channels.
+
+Each channel (the Gmail account, each Telegram bot) is sent to from its own
+worker thread, so a slow or hung endpoint can't hold up the others. Every
+attempt has a timeout, failed attempts are retried with exponential backoff,
+and the delivery latency of each channel is recorded.
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-attempt timeout for a channel, in seconds
+CHANNEL_TIMEOUT_S = 15.0
+# Attempts per channel before giving up on a message
+CHANNEL_MAX_ATTEMPTS = 3
+# Backoff before the first retry; doubled for each further retry
+CHANNEL_BACKOFF_S = 2.0
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+# Per-channel rate limits as (burst, interval_s): up to `burst` messages at
+# once, then one every `interval_s` seconds. Alerts that arrive in between are
+# merged into one summary (see alert_coalescer.py).
+GMAIL_RATE_LIMIT = (4, 900.0)
+TELEGRAM_RATE_LIMIT = (6, 120.0)
+
+
+class PermanentDeliveryError(Exception):
+    """A failure that retrying won't fix, e.g. a rejected bot token."""
+
+
+class AlertDeliveryError(Exception):
+    """Raised when a message could not be delivered to any channel."""
+
+
+class GmailChannel:
+    """Sends alerts as email through an SMTP server (Gmail by default)."""
+
+    def __init__(self, username, password, receivers, subject,
+                 host="smtp.gmail.com", port=587, use_starttls=True, timeout=CHANNEL_TIMEOUT_S,
+                 rate_limit=GMAIL_RATE_LIMIT):
+        # Imported here so the dependency is only needed when email is enabled
+        from redmail import EmailSender
+        self.name = "gmail"
+        self.rate_limit = rate_limit
+        self.receivers = receivers
+        self.subject = subject
+        self.sender = EmailSender(host=host, port=port, username=username, password=password,
+                                  use_starttls=use_starttls, timeout=timeout)
+
+    def send(self, message):
+        import smtplib
+        try:
+            self.sender.send(subject=self.subject, receivers=self.receivers, text=message)
+        except smtplib.SMTPAuthenticationError as e:
+            raise PermanentDeliveryError(f"SMTP login rejected: {e}") from e
+
+
+class TelegramChannel:
+    """Sends alerts to one Telegram chat through a bot."""
+
+    def __init__(self, session, bot_token, chat_id, api_url=TELEGRAM_API_URL, timeout=CHANNEL_TIMEOUT_S,
+                 rate_limit=TELEGRAM_RATE_LIMIT):
+        self.name = f"telegram:{chat_id}"
+        self.rate_limit = rate_limit
+        self.session = session
+        self.url = f"{api_url}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.timeout = timeout
+
+    def send(self, message):
+        response = self.session.post(self.url, json={'chat_id': self.chat_id, 'text': message},
+                                     timeout=self.timeout)
+        # 429 (rate limited) and server errors are worth retrying, other 4xx are not
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentDeliveryError(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+
+
+def make_http_session(pool_size):
+    """Returns a requests Session that keeps up to pool_size connections per host alive."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ChannelStats:
+    """Delivery counters and latency for one channel."""
+
+    def __init__(self):
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.last_latency_s = None
+        self.total_latency_s = 0.0
+
+    @property
+    def mean_latency_s(self):
+        return self.total_latency_s / self.delivered if self.delivered else None
+
+
+class AlertDispatcher:
+    """Sends each message to every channel concurrently, with retry and backoff."""
+
+    def __init__(self, channels, max_attempts=CHANNEL_MAX_ATTEMPTS, backoff_s=CHANNEL_BACKOFF_S):
+        self.channels = list(channels)
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.stats = {channel.name: ChannelStats() for channel in self.channels}
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.channels), 1),
+                                        thread_name_prefix="alert-channel")
+
+    def send(self, message):
+        """Delivers message to all channels and returns {channel name: error or None}.
+
+        Raises AlertDeliveryError if no channel could deliver it, so the caller
+        can keep the alert and try again later.
+        """
+        results = self.deliver({channel.name: message for channel in self.channels})
+        if self.channels and all(error is not None for error in results.values()):
+            raise AlertDeliveryError("; ".join(f"{name}: {error}" for name, error in results.items()))
+        return results
+
+    def deliver(self, messages):
+        """Sends each channel its own message concurrently.
+
+        `messages` maps channel names to text; channels not in it are skipped.
+        Returns {channel name: error or None}.
+        """
+        futures = {channel.name: self._pool.submit(self._send_one, channel, messages[channel.name])
+                   for channel in self.channels if channel.name in messages}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _send_one(self, channel, message):
+        """Sends to one channel with retries. Returns None on success, else the last error."""
+        stats = self.stats[channel.name]
+        start = time.monotonic()
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                channel.send(message)
+            except PermanentDeliveryError as e:
+                error = e
+                break
+            except Exception as e:
+                error = e
+                if attempt < self.max_attempts:
+                    stats.retries += 1
+                    delay = self.backoff_s * 2 ** (attempt - 1)
+                    time.sleep(delay * random.uniform(0.8, 1.2))
+                continue
+            latency = time.monotonic() - start
+            stats.delivered += 1
+            stats.last_latency_s = latency
+            stats.total_latency_s += latency
+            print(f"{channel.name}: alert delivered in {latency:.2f} s (attempt {attempt})")
+            return None
+        stats.failed += 1
+        print(f"{channel.name}: alert delivery failed: {error}")
+        return error
+
+    def close(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,181 @@
+"""YAML configuration of diff_starlink_gps.py, reloaded while it runs.
+
+Settings left out of the file keep the defaults from the constants at the top
+of diff_starlink_gps.py, except that distance_clear_nm left out scales with
+distance_threshold_nm (0.8 of it with the defaults). An example with every
+setting:
+
+    signalk_uri: ws://192.168.1.116:80/signalk/v1/stream?subscribe=none
+    distance_threshold_nm: 1.0
+    distance_clear_nm: 0.8
+    alert_raise_dwell_s: 10
+    alert_clear_dwell_s: 60
+    # One timeout for every source, or per source; 0 stops watching a source
+    data_loss_timeout_s: {gps: 60, starlink: 60, sog: 120}
+    # Replaces the default routes: which $source or source.type supplies what
+    routes:
+      - {source: NMEA2000, path: navigation.position, target: gps_position}
+      - {source: NMEA2000, path: navigation.speedOverGround, target: sog}
+      - {source: signalk-starlink, path: navigation.position, target: starlink_position}
+
+ConfigWatcher checks the file every CONFIG_POLL_S. A changed file is loaded
+and validated as a whole, then handed over as one new AlerterConfig. An
+invalid file never takes effect: the running settings are kept and the error
+is logged.
+"""
+
+import asyncio
+import logging
+import os
+from collections import namedtuple
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import yaml
+
+# Default config file, used if it exists or once it is created
+CONFIG_PATH = Path.home() / "diff_starlink_gps.yaml"
+# How often the config file is checked for changes, in seconds
+CONFIG_POLL_S = 2.0
+
+# One consistent set of settings. source_timeouts_s is {source: seconds} and
+# routes is {(source, path): target}; treat both as read-only.
+AlerterConfig = namedtuple('AlerterConfig', 'signalk_uri distance_threshold_nm distance_clear_nm '
+                                            'alert_raise_dwell_s alert_clear_dwell_s source_timeouts_s routes')
+
+# Settings that are a single number: distances in NM and dwell times in seconds
+_NUMBERS = ("distance_threshold_nm", "distance_clear_nm", "alert_raise_dwell_s", "alert_clear_dwell_s")
+_KEYS = {"signalk_uri", "data_loss_timeout_s", "routes", *_NUMBERS}
+
+
+class ConfigError(ValueError):
+    """The config file can't be read or has an invalid setting."""
+
+
+def _number(key, value, minimum=0.0):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value >= minimum:
+        raise ConfigError(f"{key} must be a number of at least {minimum:g}, not {value!r}")
+    return float(value)
+
+
+def parse_config(data, defaults, route_targets, source_names):
+    """Returns an AlerterConfig from the parsed YAML `data`, or raises ConfigError.
+
+    `route_targets` and `source_names` are the valid route targets and
+    watched source names.
+    """
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ConfigError("the config must be a mapping of settings")
+    unknown = sorted(str(key) for key in data.keys() - _KEYS)
+    if unknown:
+        raise ConfigError(f"unknown setting {', '.join(unknown)}")
+    changes = {}
+    for key in _NUMBERS:
+        if key in data:
+            changes[key] = _number(key, data[key])
+    if "distance_threshold_nm" in changes and "distance_clear_nm" not in changes:
+        # Keep the default hysteresis, in proportion to the new threshold
+        ratio = defaults.distance_clear_nm / defaults.distance_threshold_nm
+        changes["distance_clear_nm"] = changes["distance_threshold_nm"] * ratio
+    config = defaults._replace(**changes)
+    if config.distance_threshold_nm <= 0:
+        raise ConfigError("distance_threshold_nm must be more than 0")
+    if config.distance_clear_nm > config.distance_threshold_nm:
+        raise ConfigError(f"distance_clear_nm ({config.distance_clear_nm:g}) must not be more than "
+                          f"distance_threshold_nm ({config.distance_threshold_nm:g})")
+
+    if "signalk_uri" in data:
+        uri = data["signalk_uri"]
+        if not isinstance(uri, str) or urlsplit(uri).scheme not in ("ws", "wss") or not urlsplit(uri).netloc:
+            raise ConfigError(f"signalk_uri must be a ws:// or wss:// URI, not {uri!r}")
+        config = config._replace(signalk_uri=uri)
+
+    if "data_loss_timeout_s" in data:
+        value = data["data_loss_timeout_s"]
+        if isinstance(value, dict):
+            timeouts = dict(defaults.source_timeouts_s)
+            for source, timeout in value.items():
+                if source not in source_names:
+                    raise ConfigError(f"data_loss_timeout_s: unknown source {source!r} "
+                                      f"(use {', '.join(source_names)})")
+                timeouts[source] = _number(f"data_loss_timeout_s.{source}", timeout or 0)
+        else:
+            timeout = _number("data_loss_timeout_s", value)
+            timeouts = {source: timeout for source in defaults.source_timeouts_s}
+        config = config._replace(source_timeouts_s={s: t for s, t in timeouts.items() if t > 0})
+
+    if "routes" in data:
+        if not isinstance(data["routes"], list):
+            raise ConfigError("routes must be a list of {source, path, target} mappings")
+        routes = {}
+        for n, route in enumerate(data["routes"], 1):
+            if not isinstance(route, dict) or set(route) != {"source", "path", "target"}:
+                raise ConfigError(f"route {n} must have exactly source, path and target")
+            if route["target"] not in route_targets:
+                raise ConfigError(f"route {n}: unknown target {route['target']!r} "
+                                  f"(use {', '.join(route_targets)})")
+            routes[(str(route["source"]), str(route["path"]))] = route["target"]
+        config = config._replace(routes=routes)
+    return config
+
+
+def load_config(path, defaults, route_targets, source_names):
+    """Reads and validates the YAML config file `path`, see parse_config()."""
+    try:
+        with open(path) as f:
+            data = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise ConfigError(f"{path}: {e}") from e
+    except OSError as e:
+        raise ConfigError(f"{path}: {e.strerror}") from e
+    try:
+        return parse_config(data, defaults, route_targets, source_names)
+    except ConfigError as e:
+        raise ConfigError(f"{path}: {e}") from e
+
+
+class ConfigWatcher:
+    """Calls on_change(config) whenever the config file changes to a valid config.
+
+    `load` reads the file and returns an AlerterConfig or raises ConfigError.
+    """
+
+    def __init__(self, path, load, on_change, clock, interval_s=CONFIG_POLL_S):
+        self.path = Path(path)
+        self.load = load
+        self.on_change = on_change
+        self.clock = clock
+        self.interval_s = interval_s
+        self.logger = logging.getLogger(__name__)
+        self._signature = self._stat()
+        # Reloads applied, and changed files rejected as invalid
+        self.reloads = 0
+        self.errors = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    async def run(self):
+        while True:
+            await self.clock.sleep(self.interval_s)
+            signature = self._stat()
+            if signature == self._signature:
+                continue
+            self._signature = signature
+            if signature is None:
+                self.logger.warning(f"Config file {self.path} was removed, keeping the current settings.")
+                continue
+            try:
+                config = await asyncio.to_thread(self.load)
+            except ConfigError as e:
+                self.errors += 1
+                self.logger.error(f"Ignoring the changed config file, keeping the current settings: {e}")
+                continue
+            self.reloads += 1
+            self.on_change(config)
@@ -20,3 +20,18 @@ bots_credentials = [
         "CHAT_ID": 987654321
     }
 ]
+
+# Optional delivery settings. The defaults are fine for Gmail and Telegram;
+# change them to point at a local test server.
+# alert_timeout_s = 15
+# smtp_host = "smtp.gmail.com"
+# smtp_port = 587
+# smtp_starttls = True
+# telegram_api_url = "https://api.telegram.org"
+
+# Optional alert rate limits. Alerts within alert_coalesce_window_s of the
+# previous message, or over a channel's limit of (burst, seconds per message),
+# are merged into one summary.
+# alert_coalesce_window_s = 30
+# gmail_rate_limit = (4, 900)
+# telegram_rate_limit = (6, 120)
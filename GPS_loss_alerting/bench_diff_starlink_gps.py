@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+"""Benchmarks for the diff_starlink_gps.py hot path.
+
+Measures throughput, per-call latency percentiles and memory churn for:
+
+- haversine
+- SignalKDecoder.decode and GpsAlerter._process_message, fed a synthetic
+  mix of NMEA2000 GPS/SOG, signalk-starlink and unsubscribed "noise" deltas
+- CsvLogHandler.emit (row formatting plus the hand-off to the track writer)
+- the alert path (_write_alert_to_file and the sender wake-up)
+- end to end: a local websocket stand-in streams the same mix to a real
+  GpsAlerter websocket loop (needs the websockets package)
+- start-up: time to import and set up, and peak resident memory, of the
+  monitor and alert sender as separate processes and of the single-process
+  gps_loss_alerting.py, each in a fresh interpreter
+
+Each run is appended as one JSON line to the results file, tagged with the
+git revision, so numbers can be compared release over release:
+
+    python bench_diff_starlink_gps.py --compare
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from datetime import datetime
+from pathlib import Path
+
+from diff_starlink_gps import GpsAlerter, CsvLogHandler, haversine, LOG_DIR
+from io_worker import QueuedLogHandler
+from signalk_synth import DeltaGenerator
+
+RESULTS_FILE = LOG_DIR / "bench_results.jsonl"
+# Fresh interpreters started per start-up measurement
+STARTUP_REPEATS = 5
+
+# What each process does at start-up, up to the point where it would start
+# connecting. The sender uses Telegram only, as set in STARTUP_SECRETS.
+STARTUP_SNIPPETS = {
+    "monitor": "import diff_starlink_gps as m; m.GpsAlerter(log_dir=log_dir)",
+    "sender": "import starlink_gps_alert as s; s.AlertDispatcher(s.build_channels())",
+    "combined": ("import gps_loss_alerting, diff_starlink_gps as m, starlink_gps_alert as s; "
+                 "m.GpsAlerter(log_dir=log_dir); s.AlertDispatcher(s.build_channels())"),
+}
+STARTUP_SECRETS = """
+gmail_alert_enabled = False
+telegram_alert_enabled = True
+bots_credentials = [{"BOT_TOKEN": "bench", "CHAT_ID": 1}]
+"""
+STARTUP_CHILD = """
+import json, resource, sys, time, logging
+log_dir = sys.argv[1]
+{snippet}
+logging.disable(logging.CRITICAL)
+print(json.dumps({{"rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(p / 100.0 * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def measure(name, fn, items):
+    """Calls fn(item) for every item and returns a result dict for the stage."""
+    n = len(items)
+    latencies = array('q', [0]) * n
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    perf_counter_ns = time.perf_counter_ns
+    start = time.perf_counter()
+    for i, item in enumerate(items):
+        t0 = perf_counter_ns()
+        fn(item)
+        latencies[i] = perf_counter_ns() - t0
+    elapsed = time.perf_counter() - start
+    blocks_after = sys.getallocatedblocks()
+
+    # Separate, slower pass: the largest transient allocation of a single call
+    sample = items[:min(n, 2000)]
+    tracemalloc.start()
+    peak = 0
+    for item in sample:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    lat = sorted(latencies)
+    return {
+        "stage": name,
+        "ops": n,
+        "ops_per_s": round(n / elapsed, 1),
+        "p50_us": round(_percentile(lat, 50) / 1000, 2),
+        "p95_us": round(_percentile(lat, 95) / 1000, 2),
+        "p99_us": round(_percentile(lat, 99) / 1000, 2),
+        "max_us": round(lat[-1] / 1000, 2),
+        "peak_alloc_bytes_per_op": peak,
+        "retained_blocks_per_1k_ops": round((blocks_after - blocks_before) * 1000 / n, 1),
+    }
+
+
+async def measure_end_to_end(alerter, frames, rate_hz):
+    """Streams frames to the alerter through a local websocket server."""
+    import websockets
+
+    sent = array('d')
+    done = array('d')
+    finished = asyncio.Event()
+
+    async def handler(websocket, path=None):
+        await websocket.recv()  # Wait for the subscription
+        interval = 1.0 / rate_hz if rate_hz else 0.0
+        next_send = time.perf_counter()
+        for frame in frames:
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            sent.append(time.perf_counter())
+            await websocket.send(frame)
+        await finished.wait()
+
+    process_message = alerter._process_message
+
+    def timed_process_message(message):
+        process_message(message)
+        done.append(time.perf_counter())
+        if len(done) == len(frames):
+            finished.set()
+
+    alerter._process_message = timed_process_message
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    alerter.signalk_uri = f"ws://127.0.0.1:{port}/signalk/v1/stream?subscribe=none"
+    task = asyncio.create_task(alerter._websocket_loop())
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(finished.wait(), timeout=max(60.0, 3 * len(frames) / (rate_hz or 1000)))
+    finally:
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        server.close()
+        await server.wait_closed()
+        alerter._process_message = process_message
+
+    lat = sorted(d - s for s, d in zip(sent, done))
+    return {
+        "stage": "end_to_end",
+        "ops": len(done),
+        "ops_per_s": round(len(done) / elapsed, 1),
+        "p50_us": round(_percentile(lat, 50) * 1e6, 2),
+        "p95_us": round(_percentile(lat, 95) * 1e6, 2),
+        "p99_us": round(_percentile(lat, 99) * 1e6, 2),
+        "max_us": round(lat[-1] * 1e6, 2),
+    }
+
+
+def measure_startup(repeats=STARTUP_REPEATS):
+    """Returns the median start-up time and peak RSS of each process layout."""
+    here = Path(__file__).resolve().parent
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        # alerting_secrets.py for the sender; found before any real one in the working directory
+        Path(work, "alerting_secrets.py").write_text(STARTUP_SECRETS)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([work, str(here)])}
+        for name, snippet in STARTUP_SNIPPETS.items():
+            times, rss = [], []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                out = subprocess.run([sys.executable, "-c", STARTUP_CHILD.format(snippet=snippet), work],
+                                     cwd=work, env=env, capture_output=True, text=True, check=True).stdout
+                times.append(time.perf_counter() - start)
+                rss.append(json.loads(out.splitlines()[-1])["rss_kb"])
+            results[name] = {"startup_ms": round(statistics.median(times) * 1000, 1),
+                             "rss_kb": int(statistics.median(rss))}
+    results["two_process"] = {"startup_ms": max(results["monitor"]["startup_ms"], results["sender"]["startup_ms"]),
+                              "rss_kb": results["monitor"]["rss_kb"] + results["sender"]["rss_kb"]}
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, cwd=Path(__file__).parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _quiet(alerter):
+    """Stops the alerter's loggers writing to the console during the benchmark."""
+    for logger in (alerter.logger, alerter.alert_logger):
+        for handler in list(logger.handlers):
+            if type(handler) is logging.StreamHandler:
+                logger.removeHandler(handler)
+            elif isinstance(handler, QueuedLogHandler):
+                handler.handlers = [h for h in handler.handlers if type(h) is not logging.StreamHandler]
+
+
+def run(args):
+    generator = DeltaGenerator(gps_hz=args.gps_hz, starlink_hz=args.starlink_hz, noise_hz=args.noise_hz)
+    frames = [frame for _, frame in generator.frames(args.duration)]
+    with tempfile.TemporaryDirectory() as log_dir:
+        alerter = GpsAlerter(log_dir=log_dir)
+        _quiet(alerter)
+        csv_handler = next(h for h in alerter.logger.handlers if isinstance(h, CsvLogHandler))
+        record = logging.LogRecord("bench", logging.INFO, __file__, 0, "", (), None)
+
+        results = []
+        points = [(generator.position_at(t), generator.position_at(t + 30)) for t in range(len(frames))]
+        results.append(measure("haversine", lambda p: haversine(p[0][0], p[0][1], p[1][0], p[1][1]), points))
+        results.append(measure("decode", alerter.decoder.decode, frames))
+        results.append(measure("process_message", alerter._process_message, frames))
+        results.append(measure("csv_emit", csv_handler.emit, [record] * min(len(frames), 50000)))
+        results.append(measure("alert_write", alerter._write_alert_to_file,
+                               ["ALERT: benchmark alert"] * min(len(frames), 5000)))
+        if not args.no_end_to_end:
+            try:
+                results.append(asyncio.run(measure_end_to_end(alerter, frames, args.rate)))
+            except ImportError:
+                print("websockets is not installed; skipping the end-to-end benchmark.")
+        alerter.track_writer.close()
+        alerter.io_worker.close()
+    startup = None if args.no_startup else measure_startup()
+
+    return {
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "node": platform.node(),
+        "mix": {"gps_hz": args.gps_hz, "starlink_hz": args.starlink_hz, "noise_hz": args.noise_hz,
+                "frames": len(frames), "end_to_end_rate_hz": args.rate},
+        "results": results,
+        "startup": startup,
+    }
+
+
+def _previous_run(results_file):
+    try:
+        lines = Path(results_file).read_text().splitlines()
+    except OSError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def print_report(run_result, previous=None):
+    before = {r["stage"]: r for r in previous["results"]} if previous else {}
+    print(f"{'stage':<16}{'ops/s':>12}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}"
+          f"{'peak B/op':>11}{'change':>9}")
+    for r in run_result["results"]:
+        change = ""
+        old = before.get(r["stage"])
+        if old:
+            change = f"{(r['ops_per_s'] / old['ops_per_s'] - 1) * 100:+.1f}%"
+        print(f"{r['stage']:<16}{r['ops_per_s']:>12,.0f}{r['p50_us']:>10.2f}{r['p95_us']:>10.2f}"
+              f"{r['p99_us']:>10.2f}{r.get('peak_alloc_bytes_per_op', ''):>11}{change:>9}")
+    if run_result.get("startup"):
+        old_startup = (previous or {}).get("startup") or {}
+        print(f"\n{'start-up':<16}{'ms':>12}{'RSS MB':>10}{'change':>9}")
+        for name, r in run_result["startup"].items():
+            change = ""
+            if name in old_startup:
+                change = f"{(r['rss_kb'] / old_startup[name]['rss_kb'] - 1) * 100:+.1f}%"
+            print(f"{name:<16}{r['startup_ms']:>12.1f}{r['rss_kb'] / 1024:>10.1f}{change:>9}")
+    if previous:
+        print(f"(change in ops/s and RSS against {previous.get('revision')} from {previous.get('time')})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diff_starlink_gps.py hot path.")
+    parser.add_argument("--duration", type=float, default=300,
+                        help="Seconds of synthetic traffic to generate (default: 300).")
+    parser.add_argument("--gps-hz", type=float, default=14.0)
+    parser.add_argument("--starlink-hz", type=float, default=1.0)
+    parser.add_argument("--noise-hz", type=float, default=20.0)
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Frames per second for the end-to-end run; 0 sends as fast as possible.")
+    parser.add_argument("--no-end-to-end", action="store_true", help="Skip the websocket benchmark.")
+    parser.add_argument("--no-startup", action="store_true", help="Skip the start-up benchmark.")
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE,
+                        help=f"File the results are appended to (default: {RESULTS_FILE}).")
+    parser.add_argument("--compare", action="store_true", help="Compare with the previous run.")
+    args = parser.parse_args()
+
+    previous = _previous_run(args.results) if args.compare else None
+    result = run(args)
+    print_report(result, previous)
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+
+if __name__ == "__main__":
+    main()
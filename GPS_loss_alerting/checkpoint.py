@@ -0,0 +1,71 @@
+"""Small on-disk snapshots of daemon state, for warm restarts.
+
+diff_starlink_gps.py and starlink_gps_alert.py each save a JSON snapshot of
+the state they would otherwise rebuild from scratch (latest positions, alert
+flags, rate limits). It is written to a temporary file, synced to disk and
+renamed over the old one, and the rename is synced too, so a crash or power
+cut mid-write leaves the previous snapshot intact rather than an empty or
+truncated one. The sync can take a while on an SD card, so call
+save_checkpoint() off the event loop. Snapshots are stamped with the wall-clock time they were saved, and
+one older than the caller's limit is ignored, giving a cold start.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+CHECKPOINT_VERSION = 1
+# Seconds between snapshots while running
+CHECKPOINT_INTERVAL_S = 10.0
+# Snapshots older than this are not restored
+CHECKPOINT_MAX_AGE_S = 3600.0
+
+logger = logging.getLogger(__name__)
+
+
+def save_checkpoint(path, state):
+    """Atomically replaces the snapshot at `path` with the JSON-serialisable dict `state`."""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    data = {"version": CHECKPOINT_VERSION, "saved_at": time.time(), "state": state}
+    with open(tmp, 'w') as f:
+        f.write(json.dumps(data, separators=(',', ':')))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory):
+    """Makes a rename in `directory` durable. Not possible on Windows, where it is skipped."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def load_checkpoint(path, max_age_s=CHECKPOINT_MAX_AGE_S):
+    """Returns (state, age in seconds) from the snapshot at `path`, or (None, None)
+    if there is none, it can't be read, or it is older than max_age_s."""
+    try:
+        data = json.loads(Path(path).read_text())
+        if data.get("version") != CHECKPOINT_VERSION:
+            return None, None
+        age = time.time() - float(data["saved_at"])
+        state = data["state"]
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None, None
+    if not 0 <= age <= max_age_s:
+        return None, None
+    return state, age
@@ -0,0 +1,103 @@
+"""Clocks used by GpsAlerter for every timing decision.
+
+SystemClock is used in normal operation. VirtualClock only moves when it is
+told to, which lets a recorded capture drive the alerter's timers (data loss
+timeouts, log throttling, the self-test sequence) faster than real time.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """Real time, backed by time.monotonic(), datetime.now() and asyncio.sleep()."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    async def sleep(self, delay):
+        await asyncio.sleep(delay)
+
+    def call_later(self, delay, callback):
+        """Calls callback() after delay seconds. Returns a handle with cancel()."""
+        return asyncio.get_running_loop().call_later(delay, callback)
+
+
+class _TimerHandle:
+    """A callback scheduled on a VirtualClock."""
+    __slots__ = ('callback', 'cancelled')
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """A clock that only advances when advance_to() is called.
+
+    Coroutines sleeping on this clock, and callbacks scheduled on it, run in
+    deadline order as time is advanced, so code written against SystemClock
+    behaves exactly as it would in real time, only without the waiting.
+    """
+
+    def __init__(self, start_wall=None):
+        self._now = 0.0
+        self._start_wall = start_wall or datetime.now()
+        self._timers = []
+        self._seq = itertools.count()
+
+    def monotonic(self):
+        return self._now
+
+    def now(self):
+        return self._start_wall + timedelta(seconds=self._now)
+
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+
+        def wake():
+            if not future.done():  # The sleeping task may have been cancelled
+                future.set_result(None)
+
+        self.call_later(delay, wake)
+        await future
+
+    def call_later(self, delay, callback):
+        """Calls callback() once virtual time has moved on by delay seconds."""
+        handle = _TimerHandle(callback)
+        deadline = self._now + max(delay, 0.0)
+        heapq.heappush(self._timers, (deadline, next(self._seq), handle))
+        return handle
+
+    async def advance_to(self, t, speed=0.0):
+        """Moves virtual time forward to t, running every timer due on the way.
+
+        With speed == 0 time jumps as fast as possible. With speed > 0 the
+        caller is held back so that virtual time runs at `speed` times real time.
+        """
+        # Let freshly created tasks run far enough to register their sleeps
+        await asyncio.sleep(0)
+        while self._timers and self._timers[0][0] <= t:
+            deadline, _, handle = heapq.heappop(self._timers)
+            if handle.cancelled:
+                continue
+            await self._pace(deadline, speed)
+            self._now = max(self._now, deadline)
+            handle.callback()
+            # Give a woken task a chance to run up to its next sleep
+            await asyncio.sleep(0)
+        await self._pace(t, speed)
+        self._now = max(self._now, t)
+
+    async def _pace(self, t, speed):
+        if speed > 0 and t > self._now:
+            await asyncio.sleep((t - self._now) / speed)
@@ -0,0 +1,156 @@
+"""Per-source data loss detection with event-driven deadline timers.
+
+Each watched source has its own timeout. Feeding a source only stores the
+time of the update; its timer is re-armed lazily when it fires, so a healthy
+source costs one timer wakeup per timeout period and a silent source is
+reported exactly when its deadline passes, without any polling loop.
+
+If a timer fires more than STALL_LATE_S late, the event loop itself was
+stalled, and the source's updates may be waiting unread in a socket buffer.
+The deadline is then checked again STALL_GRACE_S later, once they had a
+chance to be processed, instead of reporting the source as lost straight away.
+"""
+
+# A timer firing this late means the event loop was stalled, in seconds
+STALL_LATE_S = 1.0
+# How long to wait after such a stall before reporting a source as lost
+STALL_GRACE_S = 2.0
+
+
+class _Watch:
+    __slots__ = ('name', 'timeout', 'last_fed', 'ever_fed', 'expired', 'handle', 'due', 'deferred')
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.last_fed = None
+        self.ever_fed = False
+        self.expired = False
+        self.handle = None
+        # When the armed timer should fire, and whether it is a re-check after a stall
+        self.due = None
+        self.deferred = False
+
+
+class DeadlineWatchdog:
+    """Calls on_expired(name, ever_fed) when a source misses its deadline,
+    and on_resumed(name) when an expired source is fed again.
+    """
+
+    def __init__(self, clock, on_expired, on_resumed, stall_grace_s=STALL_GRACE_S):
+        self.clock = clock
+        self.on_expired = on_expired
+        self.on_resumed = on_resumed
+        self.stall_grace_s = stall_grace_s
+        # Deadlines checked again because their timer fired late
+        self.deferred = 0
+        self._watches = {}
+        self._running = False
+
+    def watch(self, name, timeout):
+        """Starts (or changes the timeout of) watching source `name`."""
+        w = self._watches.get(name)
+        if w is None:
+            w = self._watches[name] = _Watch(name, timeout)
+        else:
+            w.timeout = timeout
+        if self._running:
+            if w.last_fed is None:
+                w.last_fed = self.clock.monotonic()
+            if not w.expired:
+                self._arm(w)
+
+    def unwatch(self, name):
+        w = self._watches.pop(name, None)
+        if w is not None and w.handle is not None:
+            w.handle.cancel()
+
+    def start(self):
+        """Arms all timers. A source that is never fed expires after its timeout."""
+        self._running = True
+        now = self.clock.monotonic()
+        for w in self._watches.values():
+            if w.last_fed is None:
+                w.last_fed = now
+            if not w.expired:  # An expired source is re-armed by the next feed()
+                self._arm(w)
+
+    def stop(self):
+        self._running = False
+        for w in self._watches.values():
+            if w.handle is not None:
+                w.handle.cancel()
+                w.handle = None
+
+    def feed(self, name):
+        """Records an update from `name`. Cheap enough to call on every fix."""
+        w = self._watches.get(name)
+        if w is None:
+            return
+        w.last_fed = self.clock.monotonic()
+        w.ever_fed = True
+        if w.expired:
+            w.expired = False
+            self.on_resumed(name)
+            if self._running:
+                self._arm(w)
+
+    def timeout_for(self, name):
+        w = self._watches.get(name)
+        return w.timeout if w is not None else None
+
+    def is_expired(self, name):
+        w = self._watches.get(name)
+        return w is not None and w.expired
+
+    def seconds_since_fed(self, name):
+        """Seconds since the last update from `name`, or None if it was never fed."""
+        w = self._watches.get(name)
+        if w is None or not w.ever_fed:
+            return None
+        return self.clock.monotonic() - w.last_fed
+
+    def state(self):
+        """Returns {name: {"ever_fed": bool, "expired": bool}} for a checkpoint."""
+        return {w.name: {"ever_fed": w.ever_fed, "expired": w.expired} for w in self._watches.values()}
+
+    def restore(self, state):
+        """Restores the flags saved by state(), before start().
+
+        A source that had been fed counts as fed, so it isn't reported as
+        never received; its deadline starts again from now. A source that
+        was expired stays expired, so it isn't reported again, and is
+        reported as resumed when fed.
+        """
+        for name, flags in state.items():
+            w = self._watches.get(name)
+            if w is not None:
+                w.ever_fed = bool(flags.get("ever_fed"))
+                w.expired = bool(flags.get("expired"))
+
+    def _arm(self, w):
+        if w.handle is not None:
+            w.handle.cancel()
+        now = self.clock.monotonic()
+        w.due = max(w.last_fed + w.timeout, now)
+        w.deferred = False
+        w.handle = self.clock.call_later(w.due - now, lambda: self._fire(w))
+
+    def _fire(self, w):
+        w.handle = None
+        if not self._running or self._watches.get(w.name) is not w:
+            return
+        now = self.clock.monotonic()
+        if now - w.last_fed >= w.timeout:
+            if not w.deferred and self.stall_grace_s and now - w.due > STALL_LATE_S:
+                # The loop was stalled: let any updates held up behind the stall arrive first
+                w.deferred = True
+                self.deferred += 1
+                w.handle = self.clock.call_later(self.stall_grace_s, lambda: self._fire(w))
+                return
+            # Stays disarmed until the next feed() brings the source back
+            w.expired = True
+            self.on_expired(w.name, w.ever_fed)
+        else:
+            # Fed since the timer was armed: move the deadline along
+            self._arm(w)
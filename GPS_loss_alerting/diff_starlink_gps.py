@@ -3,26 +3,117 @@
 import asyncio
 import websockets
 import json
-import dict_digger
 from math import radians, cos, sin, asin, sqrt
-import time
 import os
+import random
+import signal
 import sys
+from urllib.parse import urlsplit, urlunsplit
 import argparse
 import logging
+import logging.handlers
 from pathlib import Path
+from time import perf_counter
+from clock import SystemClock, VirtualClock
+from signalk_capture import CaptureRecorder, CaptureReader
+from track_writer import TrackWriter
+from track_archive import ArchiveWriter, ArchiveLogHandler, ARCHIVE_DIRNAME, ARCHIVE_MAX_BYTES, KIND_ALERT
+from deadline_watchdog import DeadlineWatchdog
+from io_worker import IoWorker, QueuedLogHandler
+from loop_monitor import LoopLagMonitor, LOOP_STALL_WARN_S
+from track_store import TrackStore, SOURCE_GPS, SOURCE_STARLINK
+from divergence_stats import DivergenceStats
+from alert_channel import AlertNotifier, ALERTS_FILENAME, NOTIFY_SOCKET_FILENAME
+from metrics import MetricsRegistry, MetricsServer
+from signalk_decode import SignalKDecoder, FrameDecodeError, Position
+from nmea_server import NmeaServer
+from geofence import GeofenceMonitor, load_geofences
+from gps_integrity import IntegrityMonitor
+from position_sources import StarlinkDishSource, NmeaSource, STARLINK_DISH_TARGET, STARLINK_DISH_POLL_S
+from alerter_config import AlerterConfig, ConfigWatcher, ConfigError, load_config, CONFIG_PATH
+from checkpoint import save_checkpoint, load_checkpoint, CHECKPOINT_INTERVAL_S
 
 # --- Constants ---
+# Most of these defaults can be changed in the YAML config file while running,
+# see alerter_config.py
 # Distance threshold for alerts, in nautical miles
 DISTANCE_THRESHOLD_NM = 1.0
+# Once alerting, the difference must drop below this lower threshold before
+# it is reported as back to normal, so a difference hovering at the threshold
+# doesn't flip the alert on every fix
+DISTANCE_CLEAR_NM = 0.8
+# How long the difference must stay over the threshold (or under the clear
+# threshold) before the alert is raised (or cleared), in seconds
+ALERT_RAISE_DWELL_S = 10.0
+ALERT_CLEAR_DWELL_S = 60.0
 # Time threshold for data loss, in seconds
 DATA_LOSS_TIMEOUT_S = 60.0
+# Data loss timeout for each watched source. Sources are fed by the update
+# handlers below; add e.g. "sog": 120.0 to also alert when SOG stops arriving.
+SOURCE_TIMEOUTS_S = {
+    "gps": DATA_LOSS_TIMEOUT_S,
+    "starlink": DATA_LOSS_TIMEOUT_S,
+}
+# Window whose 95th percentile also counts towards the difference
+# alert, so a jittery difference that keeps crossing the threshold is caught.
+# Keep it within STATS_EXACT_MAX_S (see divergence_stats.py) so the test is exact
+ALERT_PERCENTILE_WINDOW_S = 60
+# Names used for each source in alert messages
+SOURCE_LABELS = {"gps": "GPS", "starlink": "Starlink", "sog": "SOG"}
 # Websocket URI for Signal K server
 SIGNALK_URI = "ws://192.168.1.116:80/signalk/v1/stream?subscribe=none"
-
-def setup_logging():
-    """Configures logging to screen and files."""
-    log_dir = Path.home() / "logs"
+# Reconnect backoff after the websocket drops: a random delay between half and
+# all of RECONNECT_MIN_S doubled per failed attempt, up to RECONNECT_MAX_S.
+# A connection that lasted RECONNECT_STABLE_S starts again from the minimum.
+RECONNECT_MIN_S = 0.25
+RECONNECT_MAX_S = 30.0
+RECONNECT_STABLE_S = 10.0
+# Signal K REST API path used to restore the position state after connecting,
+# so comparisons resume without waiting for new deltas
+SIGNALK_REST_PATH = "/signalk/v1/api/vessels/self/navigation"
+HYDRATE_TIMEOUT_S = 2.0
+# Ignore REST values older than this
+HYDRATE_MAX_AGE_S = 5.0
+# Local Prometheus metrics endpoint, http://METRICS_HOST:METRICS_PORT/metrics.
+# Use --metrics-port 0 to disable it.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Routing of Signal K delta values: (source, path) -> handler name.
+# The source is matched against an update's "$source" and its "source.type".
+DEFAULT_ROUTES = {
+    ("NMEA2000", "navigation.position"): "gps_position",
+    ("NMEA2000", "navigation.speedOverGround"): "sog",
+    ("signalk-starlink", "navigation.position"): "starlink_position",
+}
+# Extra routes for your installation, e.g. a second GPS on another source:
+# EXTRA_ROUTES = {("can0.115", "navigation.position"): "gps_position"}
+EXTRA_ROUTES = {}
+# Handler names that routes can refer to, and the GpsAlerter methods they call
+ROUTE_TARGETS = {
+    "gps_position": "_route_gps_position",
+    "sog": "_route_sog",
+    "starlink_position": "_route_starlink_position",
+}
+# Default directory for logs, CSV files and the alert file
+LOG_DIR = Path.home() / "logs"
+# State snapshot in the log directory, restored on restart (see checkpoint.py)
+CHECKPOINT_FILENAME = "diff_starlink_gps.state.json"
+# Positions in a snapshot older than this are not restored
+CHECKPOINT_POSITION_MAX_AGE_S = 30.0
+# Days of daily track CSV files and of starlink_gps_logs.txt kept; older days
+# are deleted, and are only left in the archive. 0 (the default) keeps them
+# all, so nothing is deleted without the user asking for it.
+PLAIN_LOG_DAYS = 0
+
+def setup_logging(log_dir=LOG_DIR, io_worker=None, keep_days=PLAIN_LOG_DAYS):
+    """Configures logging to screen and files.
+
+    With an IoWorker, the screen and log file are written from its thread.
+    With keep_days, the log file rotates at midnight and keep_days old ones
+    are kept.
+    """
+    log_dir = Path(log_dir)
     try:
         log_dir.mkdir(exist_ok=True)
     except OSError as e:
@@ -39,11 +130,18 @@ def setup_logging():
     # General log handler (console and file)
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
 
-    file_handler = logging.FileHandler(log_file)
+    if keep_days > 0:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when='midnight', backupCount=keep_days)
+    else:
+        file_handler = logging.FileHandler(log_file)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+    handlers = [stream_handler, file_handler]
+    if io_worker is not None:
+        handlers = [QueuedLogHandler(io_worker, handlers)]
+    for handler in handlers:
+        logger.addHandler(handler)
 
     # Specific alert handler (console and main log only, file opened on-demand)
     alert_logger = logging.getLogger('alerter')
@@ -51,82 +149,102 @@ def setup_logging():
     alert_formatter = logging.Formatter('%(asctime)s - %(message)s')
 
     # Also log alerts to the main log
-    alert_logger.addHandler(file_handler)
-    alert_logger.addHandler(stream_handler)
+    for handler in handlers:
+        alert_logger.addHandler(handler)
     # Prevent alert logs from propagating to the root logger's handlers
     alert_logger.propagate = False
 
     return logger, alert_logger
 
 
-class CsvLogHandler(logging.Handler):
-    """Logging handler that appends a CSV row for each emitted log record.
+class ClockTimeFilter(logging.Filter):
+    """Stamps log records with the time of the given clock instead of real time.
 
-    The handler calls a provided callback to get an object with attributes
-    `start_time`, `starlink_lat`, `starlink_lon`, `gps_lat`, `gps_lon`.
+    Used during replay so log timestamps match the recorded data.
     """
-    def __init__(self, csv_path, get_context):
+    def __init__(self, clock):
         super().__init__()
-        self.csv_path = Path(csv_path)
-        self.get_context = get_context
+        self.clock = clock
 
-        # Ensure parent dir exists and create CSV header if missing
-        try:
-            self.csv_path.parent.mkdir(parents=True, exist_ok=True)
-        except Exception:
-            pass
+    def filter(self, record):
+        record.created = self.clock.now().timestamp()
+        record.msecs = (record.created - int(record.created)) * 1000
+        return True
 
-        if not self.csv_path.exists():
-            try:
-                with open(self.csv_path, 'a') as f:
-                    f.write('date-time,slink_lat_min,slink_lon_min,gps_lat_min,gps_lon_min,diff_nm,sog\n')
-            except Exception:
-                pass
+
+# Header of the daily starlink_gps_logs_YYYY-MM-DD.csv track files. The
+# full positions in decimal degrees come last, so the older columns keep
+# their place for existing spreadsheets.
+CSV_HEADER = ('date-time,slink_lat_min,slink_lon_min,gps_lat_min,gps_lon_min,diff_nm,sog,'
+              'slink_lat,slink_lon,gps_lat,gps_lon\n')
+
+
+def _get_minutes(val):
+    """Returns the minutes fraction of a decimal degree value as text, or ''."""
+    try:
+        if val is None or val == '':
+            return ''
+        d = int(float(val))
+        m = abs(float(val) - d) * 60
+        return f"{m:.2f}"
+    except Exception:
+        return ''
+
+
+def _get_degrees(val):
+    """Returns a decimal degree value as text to 7 places (about 1 cm), or ''."""
+    try:
+        if val is None or val == '':
+            return ''
+        return f"{float(val):.7f}"
+    except Exception:
+        return ''
+
+
+def format_csv_row(ctx, now):
+    """Formats one track CSV line for the state of `ctx` (a GpsAlerter) at datetime `now`."""
+    timestamp = now.strftime('%Y-%m-%dT%H:%M:%S')
+    # Latest fixes from the alerter's track store
+    gps = ctx.track.latest(SOURCE_GPS)
+    starlink = ctx.track.latest(SOURCE_STARLINK)
+    slat = _get_minutes(starlink.lat if starlink else None)
+    slon = _get_minutes(starlink.lon if starlink else None)
+    glat = _get_minutes(gps.lat if gps else None)
+    glon = _get_minutes(gps.lon if gps else None)
+
+    diff_nm = ''
+    if gps and starlink:
+        diff_nm = f"{haversine(gps.lat, gps.lon, starlink.lat, starlink.lon):.3f}"
+
+    sog = ctx.sog if ctx.sog is not None else ''
+    degrees = ','.join(_get_degrees(v) for v in (starlink.lat if starlink else None,
+                                                 starlink.lon if starlink else None,
+                                                 gps.lat if gps else None,
+                                                 gps.lon if gps else None))
+    return f"{timestamp},{slat},{slon},{glat},{glon},{diff_nm},{sog},{degrees}\n"
+
+
+class CsvLogHandler(logging.Handler):
+    """Logging handler that appends a CSV track row for each emitted log record.
+
+    The handler calls a provided callback to get the GpsAlerter whose state
+    is written, and hands the row to a TrackWriter which does the file I/O.
+    """
+    def __init__(self, track_writer, get_context, latency=None):
+        super().__init__()
+        self.track_writer = track_writer
+        self.get_context = get_context
+        # Optional metrics Histogram of the time taken per row
+        self.latency = latency
 
     def emit(self, record):
         try:
-            from datetime import datetime
-            ctx = None
-            try:
-                ctx = self.get_context()
-            except Exception:
-                ctx = None
-
-            timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-            def get_minutes(val):
-                try:
-                    if val is None or val == '':
-                        return ''
-                    d = int(float(val))
-                    m = abs(float(val) - d) * 60
-                    return f"{m:.2f}"
-                except Exception:
-                    return ''
-
-            slat = get_minutes(getattr(ctx, 'starlink_lat', None))
-            slon = get_minutes(getattr(ctx, 'starlink_lon', None))
-            glat = get_minutes(getattr(ctx, 'gps_lat', None))
-            glon = get_minutes(getattr(ctx, 'gps_lon', None))
-
-            # Try to get the current distance_nm from the context (GpsAlerter)
-            diff_nm = ''
-            if ctx is not None:
-                try:
-                    # If distance_nm is not a property, recompute if possible
-                    diff_nm_val = getattr(ctx, 'distance_nm', None)
-                    if diff_nm_val is None:
-                        # Try to compute if all values present
-                        if all([getattr(ctx, 'gps_lat', None), getattr(ctx, 'gps_lon', None), getattr(ctx, 'starlink_lat', None), getattr(ctx, 'starlink_lon', None)]):
-                            diff_nm_val = haversine(ctx.gps_lat, ctx.gps_lon, ctx.starlink_lat, ctx.starlink_lon)
-                    if diff_nm_val is not None:
-                        diff_nm = f"{diff_nm_val:.3f}"
-                except Exception:
-                    pass
-
-            sog = getattr(ctx, 'sog', '') if ctx is not None else ''
-            line = f"{timestamp},{slat},{slon},{glat},{glon},{diff_nm},{sog}\n"
-            with open(self.csv_path, 'a') as f:
-                f.write(line)
+            t0 = perf_counter()
+            ctx = self.get_context()
+            now = ctx.clock.now()
+            self.track_writer.write(now, format_csv_row(ctx, now))
+            if self.latency is not None:
+                self.latency.observe(perf_counter() - t0)
         except Exception:
             self.handleError(record)
 
@@ -146,6 +264,47 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * asin(sqrt(a))
     return R * c
 
+def _lat_lon(value):
+    """Returns (latitude, longitude) from a Signal K position value, or (None, None)."""
+    if isinstance(value, Position):
+        return value.latitude, value.longitude
+    try:
+        return value["latitude"], value["longitude"]
+    except (TypeError, KeyError):
+        return None, None
+
+def _rest_url(websocket_uri, path=SIGNALK_REST_PATH):
+    """Returns the Signal K REST URL on the same server as a websocket URI."""
+    parts = urlsplit(websocket_uri)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return urlunsplit((scheme, parts.netloc, path, "", ""))
+
+
+def _fetch_json(url, timeout):
+    # Imported here as it is only needed after a reconnect, and slow to import
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _host_port(text, default_host):
+    """Parses "host:port" or "port" into a (host, port) pair."""
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port)
+
+
+def _format_duration(seconds):
+    """Formats a timeout for alert messages, e.g. "1 minute" or "90 seconds"."""
+    if seconds % 60 == 0:
+        minutes = int(seconds // 60)
+        return f"{minutes} minute" + ("s" if minutes != 1 else "")
+    return f"{seconds:g} seconds"
+
+def default_config():
+    """Returns the settings of the constants above, used for anything the config file leaves out."""
+    return AlerterConfig(SIGNALK_URI, DISTANCE_THRESHOLD_NM, DISTANCE_CLEAR_NM, ALERT_RAISE_DWELL_S,
+                         ALERT_CLEAR_DWELL_S, dict(SOURCE_TIMEOUTS_S), {**DEFAULT_ROUTES, **EXTRA_ROUTES})
+
 def dd_to_dm(deg):
     """Convert decimal degrees to degrees and decimal minutes."""
     d = int(deg)
@@ -157,50 +316,132 @@ class GpsAlerter:
     Monitors GPS and Starlink position data, logs it, and generates alerts
     for position discrepancies or data loss.
     """
-    def __init__(self, test_mode=False):
+    def __init__(self, test_mode=False, clock=None, log_dir=LOG_DIR, recorder=None,
+                 signalk_uri=None, config_path=None, metrics_address=None, nmea_server=None, geofences=(),
+                 checkpoint_path=None, alert_sink=None, archive_max_bytes=ARCHIVE_MAX_BYTES,
+                 plain_log_days=PLAIN_LOG_DAYS):
         self.test_mode = test_mode
-        self.logger, self.alert_logger = setup_logging()
+        # Optional callable(line, token) that is handed every alert written to
+        # the alert file, with the AlertFileReader token to acknowledge it, for
+        # delivery within this process (see gps_loss_alerting.py)
+        self.alert_sink = alert_sink
+        # State snapshot to restore on start and keep up to date, or None
+        self.checkpoint_path = checkpoint_path
+        # YAML config file (see alerter_config.py), or None. A Signal K URI given
+        # here takes precedence over the one in the file.
+        self.config_path = config_path
+        self._uri_override = signalk_uri
+        self.config = self._override(default_config())
+        if config_path is not None and Path(config_path).exists():
+            try:
+                self.config = self._load_config()
+            except ConfigError as e:
+                print(f"Invalid config file: {e}")
+                sys.exit(1)
+        self.signalk_uri = self.config.signalk_uri
+        # The connected websocket, and whether its subscription misses routed paths
+        self._websocket = None
+        self._subscription_stale = False
+        self._close_task = None
+        # (host, port) to serve metrics on while running, or None
+        self.metrics_address = metrics_address
+        self.metrics_server = None
+        # Optional NmeaServer that re-emits each Starlink position to chartplotters
+        self.nmea_server = nmea_server
+        # Geofence zones (see geofence.py) checked against every GPS and Starlink fix
+        self.geofence = GeofenceMonitor(geofences) if geofences else None
+        # Spoofing and jamming detectors (see gps_integrity.py) fed with every fix
+        self.integrity = IntegrityMonitor()
+        # All timing goes through the clock so a replay can run faster than real time
+        self.clock = clock or SystemClock()
+        # Optional CaptureRecorder that receives every raw websocket frame
+        self.recorder = recorder
+        self.log_dir = Path(log_dir)
+        # Writes the log and alert files from a background thread, so a slow
+        # SD card doesn't stall the event loop (see io_worker.py)
+        self.io_worker = IoWorker()
+        self.logger, self.alert_logger = setup_logging(self.log_dir, self.io_worker, plain_log_days)
+        # Event loop the alerter runs on, set by run() and replay()
+        self._loop = None
+        # Measures how late the event loop runs, while run() is running
+        self.loop_monitor = LoopLagMonitor(self.clock)
+        if isinstance(self.clock, VirtualClock):
+            clock_filter = ClockTimeFilter(self.clock)
+            self.logger.addFilter(clock_filter)
+            self.alert_logger.addFilter(clock_filter)
 
         # Record application start time for CSV logging (seconds since start)
-        self.start_time = time.monotonic()
-
-        # CSV log path and handler: append a row for every log entry
-        try:
-            from datetime import datetime
-            today_str = datetime.now().strftime("%Y-%m-%d")
-            csv_filename = f"starlink_gps_logs_{today_str}.csv"
-            csv_path = Path.home() / "logs" / csv_filename
-            csv_handler = CsvLogHandler(csv_path, lambda: self)
-            # Add the CSV handler to both loggers so any emitted record appends a CSV row
-            self.logger.addHandler(csv_handler)
-            self.alert_logger.addHandler(csv_handler)
-        except Exception as e:
-            # Fail gracefully if CSV handler can't be created
-            self.logger.error(f"Could not initialize CSV log handler: {e}")
-
-        # Alert file path
-        self.alert_file = Path.home() / "logs" / "starlink_gps_alerts.txt"
-
-        # Position data
-        self.gps_lat = None
-        self.gps_lon = None
-        self.starlink_lat = None
-        self.starlink_lon = None
-        self.max_distance_nm = 0.0
+        self.start_time = self.clock.monotonic()
+
+        # Counters, latency histograms and gauges for the metrics endpoint
+        self.metrics = MetricsRegistry()
+        self._init_metrics()
+
+        # Compressed archive of track rows, alerts and log lines, or None if disabled
+        self.archive = None
+        if archive_max_bytes:
+            self.archive = ArchiveWriter(self.log_dir / ARCHIVE_DIRNAME, archive_max_bytes)
+            archive_handler = ArchiveLogHandler(self.archive)
+            archive_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            self.logger.addHandler(archive_handler)
+            self.alert_logger.addHandler(archive_handler)
+
+        # Daily track CSV files, written in batches from a background thread
+        self.track_writer = TrackWriter(self.log_dir, "starlink_gps_logs", CSV_HEADER, archive=self.archive,
+                                        keep_days=plain_log_days)
+        # Add the CSV handler to both loggers so any emitted record appends a CSV row
+        csv_handler = CsvLogHandler(self.track_writer, lambda: self, self.m_csv_seconds)
+        self.logger.addHandler(csv_handler)
+        self.alert_logger.addHandler(csv_handler)
+
+        # Alert file path, and the wake-up notifier for starlink_gps_alert.py. A
+        # replay (on a VirtualClock) never wakes up the sender, which would
+        # otherwise send the recorded alerts as if they were new.
+        self.alert_file = self.log_dir / ALERTS_FILENAME
+        self.alert_notifier = None
+        if not isinstance(self.clock, VirtualClock):
+            self.alert_notifier = AlertNotifier(self.log_dir / NOTIFY_SOCKET_FILENAME)
+
+        # Position data: recent GPS and Starlink fixes, newest gives the current state
+        self.track = TrackStore(self.clock)
+        # Rolling statistics of the difference over 1 minute, 10 minutes and 1 hour
+        self.stats = DivergenceStats(self.clock)
+        # Latest GPS/Starlink difference, None until both positions are known
+        self.distance_nm = None
         # Speed Over Ground (SOG)
         self.sog = 0.0
 
-        # Timestamps for data loss detection
-        self.last_gps_update_time = None
-        self.last_starlink_update_time = None
+        # Data loss detection: one deadline timer per source
+        self.watchdog = DeadlineWatchdog(self.clock, self._on_data_lost, self._on_data_resumed)
+        for source, timeout in self.config.source_timeouts_s.items():
+            self.watchdog.watch(source, timeout)
+
+        # Monotonic time of the last websocket connection, until the first
+        # comparison of positions received since then
+        self._connected_at = None
 
         # Timestamp for position logging throttle
         self.last_position_log_time = None
 
         # State flags
         self.starlink_gps_big_diff = False
-        self.gps_data_lost = False
-        self.starlink_data_lost = False
+        # Monotonic time since when the difference has disagreed with
+        # starlink_gps_big_diff, None while it agrees
+        self._diff_changed_at = None
+
+        # Precompiled delta routing table: source -> {path: handler}
+        self._routes = {}
+        self._route_cache = {}
+        # Rejects frames without a routed path before parsing them
+        self.decoder = SignalKDecoder()
+        # Position source adapters outside Signal K, as (source, on_fix) pairs,
+        # and the latest fix of each by name
+        self.sources = []
+        self._source_fixes = {}
+        # Routes from the config, and route targets supplied by adapters instead
+        self._config_routes = {}
+        self._disabled_targets = set()
+        self._apply_routes(self.config.routes)
 
         # Test mode state
         if self.test_mode:
@@ -215,253 +456,703 @@ class GpsAlerter:
         if self.test_mode:
             self.logger.warning("TEST MODE ENABLED.")
 
+    def _init_metrics(self):
+        """Registers the metrics. Gauges are read at scrape time, so may refer to later state."""
+        m = self.metrics
+        self.m_messages = m.counter("gps_alerter_messages", "Signal K websocket messages processed.")
+        self.m_messages_filtered = m.counter("gps_alerter_messages_filtered",
+                                             "Websocket messages skipped without parsing (no routed path).")
+        self.m_message_errors = m.counter("gps_alerter_message_errors",
+                                          "Websocket messages that could not be decoded or processed.")
+        self.m_process_seconds = m.histogram("gps_alerter_process_message_seconds",
+                                             "Time taken to process one websocket message.")
+        self.m_update_seconds = {
+            name: m.histogram("gps_alerter_update_seconds", "Time taken by each update path.", {"update": name})
+            for name in ("gps", "starlink", "sog")
+        }
+        self.m_csv_seconds = m.histogram("gps_alerter_csv_write_seconds",
+                                         "Time taken to format and queue one track CSV row.")
+        self.m_alert_seconds = m.histogram("gps_alerter_alert_write_seconds",
+                                           "Time taken to append one alert to the alert file.")
+        self.m_alerts = m.counter("gps_alerter_alerts", "Alerts written to the alert file.")
+        self.loop_monitor.histogram = m.histogram(
+            "gps_alerter_loop_lag_seconds", "How late the event loop woke up the lag monitor.",
+            bounds=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+        m.gauge("gps_alerter_loop_lag_max_seconds", "Largest event loop lag since startup.",
+                lambda: self.loop_monitor.max_lag)
+        m.gauge("gps_alerter_io_queue_depth", "Log records and alerts waiting to be written.",
+                lambda: self.io_worker.depth)
+        m.counter_func("gps_alerter_io_dropped", "Log records dropped because the write queue was full.",
+                       lambda: self.io_worker.dropped)
+        m.counter_func("gps_alerter_data_loss_deferred",
+                       "Data loss deadlines checked again because the event loop was stalled.",
+                       lambda: self.watchdog.deferred)
+        self.m_connects = m.counter("gps_alerter_websocket_connects", "Successful Signal K websocket connections.")
+        self.m_reconnects = m.counter("gps_alerter_websocket_reconnects",
+                                      "Websocket connections lost or failed, each followed by a reconnect.")
+        self.m_connect_to_compare = m.histogram(
+            "gps_alerter_connect_to_compare_seconds",
+            "Time from a websocket connection to the first comparison of fresh positions.",
+            bounds=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+        for source in SOURCE_LABELS:
+            m.gauge("gps_alerter_source_age_seconds", "Seconds since the last update from each source.",
+                    lambda source=source: self.watchdog.seconds_since_fed(source), {"source": source})
+        m.gauge("gps_alerter_difference_nm", "Current GPS/Starlink position difference in NM.",
+                lambda: self.distance_nm)
+        m.gauge("gps_alerter_difference_alert", "1 while the position difference alert is active.",
+                lambda: int(self.starlink_gps_big_diff))
+        if self.nmea_server is not None:
+            m.gauge("gps_alerter_nmea_clients", "Connected NMEA 0183 TCP clients.",
+                    lambda: self.nmea_server.clients)
+            m.counter_func("gps_alerter_nmea_sent", "NMEA 0183 position messages sent (UDP and per TCP client).",
+                           lambda: self.nmea_server.sent)
+            m.counter_func("gps_alerter_nmea_dropped", "NMEA 0183 position messages skipped for slow clients.",
+                           lambda: self.nmea_server.dropped)
+        for name in self.integrity.active:
+            m.gauge("gps_alerter_integrity_confidence", "Latest confidence of each GPS integrity detector.",
+                    lambda name=name: self.integrity.confidence[name], {"detector": name})
+            m.gauge("gps_alerter_integrity_alert", "1 while the alert of each GPS integrity detector is active.",
+                    lambda name=name: int(self.integrity.active[name]), {"detector": name})
+        if self.geofence is not None:
+            m.gauge("gps_alerter_geofences", "Geofence zones loaded.", lambda: len(self.geofence.index.zones))
+
+    def _override(self, config):
+        return config._replace(signalk_uri=self._uri_override) if self._uri_override else config
+
+    def _load_config(self):
+        """Reads the config file; raises ConfigError if it is invalid."""
+        return self._override(load_config(self.config_path, default_config(), ROUTE_TARGETS, SOURCE_LABELS))
+
+    def apply_config(self, config):
+        """Switches to new settings while running.
+
+        All of it is applied at once between two messages, which are handled
+        with the new settings from then on. Only a new Signal K URI reconnects.
+        """
+        old, self.config = self.config, config
+        changed = [field for field in config._fields if getattr(old, field) != getattr(config, field)]
+        if not changed:
+            return
+        for source in old.source_timeouts_s.keys() - config.source_timeouts_s.keys():
+            self.watchdog.unwatch(source)
+        for source, timeout in config.source_timeouts_s.items():
+            if old.source_timeouts_s.get(source) != timeout:
+                self.watchdog.watch(source, timeout)
+        if config.routes != old.routes:
+            self._apply_routes(config.routes)
+        self.logger.info(f"Applied the changed config: {', '.join(changed)}.")
+        if config.signalk_uri != old.signalk_uri:
+            self.signalk_uri = config.signalk_uri
+            if self._websocket is not None:
+                self.logger.info(f"Signal K URI changed, reconnecting to {self.signalk_uri}")
+                self._close_task = asyncio.create_task(self._websocket.close())
+
+    def _apply_routes(self, routes):
+        """Replaces the routes from the config with `routes`, leaving routes added by add_route() alone."""
+        paths = self._subscribed_paths()
+        for (source, path), target in self._config_routes.items():
+            if routes.get((source, path)) != target:
+                self.remove_route(source, path)
+        for (source, path), target in routes.items():
+            if target not in self._disabled_targets and self._config_routes.get((source, path)) != target:
+                self.add_route(source, path, target)
+        self._config_routes = dict(routes)
+        if self._subscribed_paths() != paths:
+            self._subscription_stale = True
+
+    def disable_route_targets(self, *targets):
+        """Stops routing Signal K values to these targets, e.g. because an adapter supplies them.
+
+        This also applies to the routes of later config changes.
+        """
+        self._disabled_targets.update(targets)
+        for (source, path), target in self._config_routes.items():
+            if target in targets:
+                self.remove_route(source, path)
+
+    def _start_metrics_server(self):
+        if self.metrics_address is None:
+            return
+        host, port = self.metrics_address
+        try:
+            self.metrics_server = MetricsServer(self.metrics, host, port)
+        except OSError as e:
+            self.logger.error(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+            return
+        self.metrics_server.start()
+        host, port = self.metrics_server.address[:2]
+        self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    @property
+    def gps_lat(self):
+        return self.track.latest_lat(SOURCE_GPS)
+
+    @property
+    def gps_lon(self):
+        return self.track.latest_lon(SOURCE_GPS)
+
+    @property
+    def starlink_lat(self):
+        return self.track.latest_lat(SOURCE_STARLINK)
+
+    @property
+    def starlink_lon(self):
+        return self.track.latest_lon(SOURCE_STARLINK)
+
     def _write_alert_to_file(self, message):
-        """Writes an alert message to the alert file, opening and closing it immediately."""
+        """Queues an alert message to be appended to the alert file by the I/O worker.
+
+        Alerts are never dropped, however full the queue is.
+        """
+        t0 = perf_counter()
+        now = self.clock.now()
+        timestamp = now.strftime('%Y-%m-%dT%H:%M:%S')
+        line = f'{timestamp} - {message}\n'
+        self.io_worker.submit(self._append_alert, line, essential=True)
+        if self.archive is not None:
+            self.archive.append(KIND_ALERT, now.timestamp(), line.rstrip('\n'))
+        self.m_alert_seconds.observe(perf_counter() - t0)
+        self.m_alerts.inc()
+
+    def _append_alert(self, line):
+        """Appends an alert line to the alert file, opening and closing it immediately (I/O worker thread)."""
         try:
             with open(self.alert_file, 'a') as f:
-                from datetime import datetime
-                timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                f.write(f'{timestamp} - {message}\n')
+                f.write(line)
+                if self.alert_sink is not None:
+                    f.flush()
+                    token = (os.fstat(f.fileno()).st_ino, f.tell())
+            if self.alert_sink is None:
+                if self.alert_notifier is not None:
+                    self.alert_notifier.notify()
+            elif self._loop is None or self._loop.is_closed():
+                self.alert_sink(line, token)
+            else:
+                # The sink belongs to the event loop
+                self._loop.call_soon_threadsafe(self.alert_sink, line, token)
         except Exception as e:
             self.logger.error(f"Error writing to alert file: {e}", exc_info=True)
 
     async def run(self):
         """Main entry point. Runs all monitoring tasks."""
         self.logger.info("Starting GPS Alerter...")
+        self._loop = asyncio.get_running_loop()
+        lag_task = asyncio.create_task(self.loop_monitor.run())
         try:
-            websocket_task = asyncio.create_task(self._websocket_loop())
-            data_loss_task = asyncio.create_task(self._data_loss_checker_loop())
-
-            tasks = [websocket_task, data_loss_task]
+            self._start_metrics_server()
+            self._restore_checkpoint()
+            if self.nmea_server is not None:
+                try:
+                    await self.nmea_server.start()
+                except OSError as e:
+                    self.logger.error(f"Could not start the NMEA 0183 output: {e}")
+            self.watchdog.start()
+            tasks = []
+            # Without any Signal K routes left, e.g. with only NMEA and dish sources, skip the websocket
+            if self._routes:
+                tasks.append(asyncio.create_task(self._websocket_loop()))
+            for source, on_fix in self.sources:
+                tasks.append(asyncio.create_task(source.run(on_fix)))
             if self.test_mode:
                 test_runner_task = asyncio.create_task(self._test_runner_loop())
                 tasks.append(test_runner_task)
+            if self.checkpoint_path is not None:
+                tasks.append(asyncio.create_task(self._checkpoint_loop()))
+            if self.config_path is not None:
+                watcher = ConfigWatcher(self.config_path, self._load_config, self.apply_config, self.clock)
+                tasks.append(asyncio.create_task(watcher.run()))
 
             await asyncio.gather(*tasks)
         except Exception as e:
             self.logger.error(f"A critical error occurred: {e}", exc_info=True)
         finally:
+            self.watchdog.stop()
+            lag_task.cancel()
+            self._save_checkpoint()
+            for source, _ in self.sources:
+                source.close()
+            if self.nmea_server is not None:
+                await self.nmea_server.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            if self.recorder is not None:
+                self.recorder.close()
             self.logger.info("GpsAlerter shut down.")
+            self.track_writer.close()
+            self.io_worker.close()
+            if self.archive is not None:
+                self.archive.close()
+
+    def _checkpoint_state(self):
+        """Returns the state to restore after a restart, as a JSON-serialisable dict."""
+        now = self.clock.monotonic()
+        fixes = {}
+        for source, name in ((SOURCE_GPS, "gps"), (SOURCE_STARLINK, "starlink")):
+            fix = self.track.latest(source)
+            if fix is not None:
+                fixes[name] = {"lat": fix.lat, "lon": fix.lon, "sog": fix.sog, "age_s": now - fix.time}
+        return {
+            "fixes": fixes,
+            "sog": self.sog,
+            "difference_alert": self.starlink_gps_big_diff,
+            "watchdog": self.watchdog.state(),
+            "geofences": self.geofence.state() if self.geofence is not None else {},
+            "integrity_alerts": self.integrity.state(),
+        }
+
+    def _save_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        try:
+            save_checkpoint(self.checkpoint_path, self._checkpoint_state())
+        except Exception as e:
+            self.logger.error(f"Could not save checkpoint {self.checkpoint_path}: {e}")
+
+    async def _checkpoint_loop(self):
+        """Saves the state snapshot every CHECKPOINT_INTERVAL_S."""
+        while True:
+            await self.clock.sleep(CHECKPOINT_INTERVAL_S)
+            state = self._checkpoint_state()
+            try:
+                await asyncio.to_thread(save_checkpoint, self.checkpoint_path, state)
+            except Exception as e:
+                self.logger.error(f"Could not save checkpoint {self.checkpoint_path}: {e}")
+
+    def _restore_checkpoint(self):
+        """Restores the last snapshot, if recent, so a restart doesn't repeat or miss alerts.
+
+        Recent positions are put back in the track, so the first new fix can
+        be compared straight away. Alert flags are restored so active alerts
+        aren't sent again and their OK messages still are.
+        """
+        if self.checkpoint_path is None:
+            return
+        state, age = load_checkpoint(self.checkpoint_path)
+        if state is None:
+            return
+        try:
+            # (age, name, lat, lon, sog) of the saved positions
+            fixes = sorted((float(fix["age_s"]) + age, name, float(fix["lat"]), float(fix["lon"]), fix["sog"])
+                           for name, fix in state["fixes"].items() if name in ("gps", "starlink"))
+            sog = state["sog"]
+            big_diff = bool(state["difference_alert"])
+            watchdog_state = dict(state["watchdog"])
+            geofence_state = dict(state["geofences"])
+            integrity_alerts = list(state.get("integrity_alerts", ()))
+        except (KeyError, TypeError, ValueError) as e:
+            self.logger.warning(f"Ignoring checkpoint {self.checkpoint_path}: {e}")
+            return
+        now = self.clock.monotonic()
+        restored = []
+        for fix_age, name, lat, lon, fix_sog in sorted(fixes, reverse=True):
+            if fix_age <= CHECKPOINT_POSITION_MAX_AGE_S:
+                source = SOURCE_GPS if name == "gps" else SOURCE_STARLINK
+                self.track.append(source, lat, lon, fix_sog, now - fix_age)
+                restored.append(name)
+        self.sog = sog
+        self.starlink_gps_big_diff = big_diff
+        self.watchdog.restore(watchdog_state)
+        if self.geofence is not None:
+            self.geofence.restore(geofence_state)
+        self.integrity.restore(integrity_alerts)
+        self.logger.info(f"Restored state saved {age:.1f} s ago: positions {', '.join(restored) or 'none'}, "
+                         f"difference alert {'active' if self.starlink_gps_big_diff else 'inactive'}.")
+
+    async def replay(self, capture, speed=0.0):
+        """Feeds a recorded capture through the alert logic instead of a live websocket.
+
+        `capture` is a CaptureReader and self.clock must be a VirtualClock.
+        A speed of 0 replays as fast as possible, otherwise virtual time runs at
+        `speed` times real time. The data loss timers and, in test mode, the
+        test runner are driven by the same virtual clock.
+        """
+        self.logger.info(f"Replaying capture {capture.path} (speed: {speed or 'max'})...")
+        self._loop = asyncio.get_running_loop()
+        self.watchdog.start()
+        tasks = []
+        if self.test_mode:
+            tasks.append(asyncio.create_task(self._test_runner_loop()))
+        frames = 0
+        try:
+            for t, frame in capture:
+                await self.clock.advance_to(t, speed)
+                self._process_message(frame)
+                frames += 1
+        finally:
+            self.watchdog.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.logger.info(f"Replay complete: {frames} frames, "
+                             f"{self.clock.monotonic():.1f} s of recorded time.")
+            self.track_writer.close()
+            self.io_worker.close()
+            if self.archive is not None:
+                self.archive.close()
 
     async def _websocket_loop(self):
         """The main loop for connecting to the websocket and processing messages."""
+        attempt = 0
         while True:
+            connected_at = None
+            uri = self.signalk_uri
             try:
-                async with websockets.connect(SIGNALK_URI) as websocket:
-                    self.logger.info(f"Connected to Signal K websocket at {SIGNALK_URI}")
+                async with websockets.connect(uri) as websocket:
+                    self._websocket = websocket
+                    connected_at = self._connected_at = self.clock.monotonic()
+                    self.logger.info(f"Connected to Signal K websocket at {uri}")
+                    self.m_connects.inc()
                     await self._subscribe_to_position(websocket)
+                    await self._hydrate()
                     while True:
                         message = await websocket.recv()
+                        if self.recorder is not None:
+                            self.recorder.record(message)
                         self._process_message(message)
+                        if self._subscription_stale:
+                            await self._subscribe_to_position(websocket, resubscribe=True)
             except (websockets.exceptions.ConnectionClosed, ConnectionRefusedError) as e:
-                self.logger.warning(f"Websocket connection error: {e}. Reconnecting in 30 seconds...")
-                await asyncio.sleep(30)
+                self.m_reconnects.inc()
+                reason = f"Websocket connection error: {e}."
             except Exception as e:
+                self.m_reconnects.inc()
                 self.logger.error(f"An unexpected error occurred in the websocket loop: {e}", exc_info=True)
-                self.logger.warning("Attempting to reconnect in 30 seconds...")
-                await asyncio.sleep(30)
-
-    async def _subscribe_to_position(self, websocket):
-        """Sends the subscription message to the Signal K server."""
+                reason = "Websocket loop failed."
+            finally:
+                self._websocket = None
+
+            if uri != self.signalk_uri:
+                # Closed by apply_config()
+                attempt = 0
+                continue
+            if connected_at is not None and self.clock.monotonic() - connected_at >= RECONNECT_STABLE_S:
+                attempt = 0
+            delay = self._reconnect_delay(attempt)
+            attempt += 1
+            self.logger.warning(f"{reason} Reconnecting in {delay:.2f} seconds...")
+            await self.clock.sleep(delay)
+
+    @staticmethod
+    def _reconnect_delay(attempt):
+        """Jittered exponential backoff delay for the given failed attempt (0 = first)."""
+        delay = min(RECONNECT_MAX_S, RECONNECT_MIN_S * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _hydrate(self):
+        """Restores GPS, Starlink and SOG state from the Signal K REST API."""
+        url = _rest_url(self.signalk_uri)
+        try:
+            navigation = await asyncio.to_thread(_fetch_json, url, HYDRATE_TIMEOUT_S)
+            deltas = self.decoder.decode_snapshot(navigation, HYDRATE_MAX_AGE_S)
+            # Starlink positions last, as they trigger the comparison with GPS
+            deltas.sort(key=lambda d: self._routes_for(d.sk_source, d.source_type).get(d.path)
+                        == self._route_starlink_position)
+            self._dispatch(deltas)
+        except Exception as e:
+            # Best effort: without it, state is rebuilt from the websocket deltas
+            self.logger.warning(f"Could not restore state from {url}: {e}")
+            return
+        self.logger.info(f"Restored {len(deltas)} values from {url}.")
+
+    async def _subscribe_to_position(self, websocket, resubscribe=False):
+        """Sends the subscription message for every routed path to the Signal K server."""
+        if resubscribe:
+            await websocket.send(json.dumps({"context": "*", "unsubscribe": [{"path": "*"}]}))
+        paths = self._subscribed_paths()
+        self._subscription_stale = False
         msg = {
             "context": "vessels.self",
-            "subscribe": [{"path": "navigation.position", "policy": "instant"},
-                          {"path": "navigation.speedOverGround", "policy": "instant"}]
+            "subscribe": [{"path": path, "policy": "instant"} for path in paths],
         }
         await websocket.send(json.dumps(msg))
-        self.logger.info("Subscribed to navigation.position updates.")
+        self.logger.info(f"Subscribed to {', '.join(paths)} updates.")
+
+    def _subscribed_paths(self):
+        return sorted({path for table in self._routes.values() for path in table})
+
+    def add_route(self, source, path, target):
+        """Routes values of `path` from `source` to a handler.
+
+        `source` is matched against an update's "$source" (e.g. "signalk-starlink"
+        or "can0.115") or its "source.type" (e.g. "NMEA2000"). `target` is one of
+        the names in ROUTE_TARGETS or a callable taking the value, as decoded by
+        signalk_decode.py: a Position for positions, a float for SOG, otherwise
+        the Signal K JSON value.
+        """
+        handler = getattr(self, ROUTE_TARGETS[target]) if isinstance(target, str) else target
+        self._routes.setdefault(source, {})[path] = handler
+        self._route_cache.clear()
+        self.decoder.set_paths(path for table in self._routes.values() for path in table)
+
+    def remove_route(self, source, path):
+        """Removes the route of `path` from `source`, if there is one."""
+        table = self._routes.get(source, {})
+        if table.pop(path, None) is not None:
+            if not table:
+                del self._routes[source]
+            self._route_cache.clear()
+            self.decoder.set_paths(path for table in self._routes.values() for path in table)
+
+    def add_source(self, source):
+        """Adds a position source adapter (see position_sources.py), run while the alerter runs.
+
+        Its fixes go to the handler named by source.target, like routed Signal K values.
+        """
+        handler = getattr(self, ROUTE_TARGETS[source.target])
+
+        def on_fix(fix):
+            self._source_fixes[source.name] = fix
+            if fix.sog is not None:
+                self._route_sog(fix.sog)
+            if fix.lat is not None:
+                handler(Position(fix.lat, fix.lon))
+
+        self.sources.append((source, on_fix))
+        labels = {"source": source.name}
+        self.metrics.gauge("gps_alerter_source_accuracy_m", "Reported accuracy of the latest adapter fix.",
+                           lambda: getattr(self._source_fixes.get(source.name), "accuracy_m", None), labels)
+        self.metrics.gauge("gps_alerter_source_fix_age_seconds", "Age of the latest adapter fix.",
+                           lambda: self._source_fix_age(source.name), labels)
+
+    def _source_fix_age(self, name):
+        fix = self._source_fixes.get(name)
+        return (self.clock.now() - fix.time).total_seconds() if fix is not None else None
+
+    def _routes_for(self, sk_source, source_type):
+        """Returns the merged path->handler table for one ($source, source.type) pair.
+
+        Routes for the specific $source override routes for the source type.
+        The result is cached, so each distinct source is only merged once.
+        """
+        key = (sk_source, source_type)
+        table = self._route_cache.get(key)
+        if table is None:
+            table = dict(self._routes.get(source_type, {}))
+            table.update(self._routes.get(sk_source, {}))
+            self._route_cache[key] = table
+        return table
 
     def _process_message(self, message):
-        """Parses a JSON message from the websocket."""
+        """Decodes a message from the websocket and dispatches every routed value."""
+        t0 = perf_counter()
+        self.m_messages.inc()
         try:
-            data = json.loads(message)
-            # print(f"Received message: {data}")  # Debug print for incoming messages
-            if "updates" not in data:
+            deltas = self.decoder.decode(message)
+            if deltas is None:
+                self.m_messages_filtered.inc()
                 return
-
-            for update in data["updates"]:
-                # GPS data from NMEA2000
-                if dict_digger.dig(update, "source", "type") == "NMEA2000":
-                    values = update.get("values", [])
-                    if not values:
-                        continue
-                    # Check for navigation.position
-                    if values[0].get("path") == "navigation.position":
-                        if self.test_mode and self.test_state == "SUPPRESS_GPS":
-                            continue # Skip processing this update
-                        lat = dict_digger.dig(update, "values", 0, "value", "latitude")
-                        lon = dict_digger.dig(update, "values", 0, "value", "longitude")
-                        if lat is not None and lon is not None:
-                            if self.test_mode:
-                                # Apply offsets during test mode
-                                if self.test_state == "RAMP_LAT_UP":
-                                    self.gps_lat_offset += self.offset_increment
-                                elif self.test_state == "RAMP_LAT_DOWN":
-                                    self.gps_lat_offset -= self.offset_increment
-                                elif self.test_state == "RAMP_LON_UP":
-                                    self.gps_lon_offset += self.offset_increment
-                                elif self.test_state == "RAMP_LON_DOWN":
-                                    self.gps_lon_offset -= self.offset_increment
-                                lat += self.gps_lat_offset
-                                lon += self.gps_lon_offset
-                            self._update_gps_position(lat, lon)
-                    # Check for navigation.speedOverGround
-                    elif values[0].get("path") == "navigation.speedOverGround":
-                        sog = values[0].get("value")
-                        self._update_sog(sog)
-                # Starlink data
-                elif dict_digger.dig(update, "$source") == "signalk-starlink":
-                    if self.test_mode and self.test_state == "SUPPRESS_STARLINK":
-                        continue # Skip processing this update
-
-                    lat = dict_digger.dig(update, "values", 0, "value", "latitude")
-                    lon = dict_digger.dig(update, "values", 0, "value", "longitude")
-                    if lat is not None and lon is not None:
-                        self._update_starlink_position(lat, lon)
-
-        except json.JSONDecodeError:
+            self._dispatch(deltas)
+        except FrameDecodeError:
+            self.m_message_errors.inc()
             self.logger.warning(f"Could not decode JSON message: {message}")
         except Exception as e:
+            self.m_message_errors.inc()
             self.logger.error(f"Error processing message: {e}", exc_info=True)
+        finally:
+            self.m_process_seconds.observe(perf_counter() - t0)
+
+    def _dispatch(self, deltas):
+        """Calls the routed handler of each decoded value."""
+        # A single frame can carry several values, e.g. position and SOG
+        for delta in deltas:
+            handler = self._routes_for(delta.sk_source, delta.source_type).get(delta.path)
+            if handler is not None:
+                handler(delta.value)
+
+    def _route_gps_position(self, value):
+        """Handles a GPS navigation.position value, applying test mode offsets."""
+        if self.test_mode and self.test_state == "SUPPRESS_GPS":
+            return # Skip processing this update
+        lat, lon = _lat_lon(value)
+        if lat is None or lon is None:
+            return
+        if self.test_mode:
+            # Apply offsets during test mode
+            if self.test_state == "RAMP_LAT_UP":
+                self.gps_lat_offset += self.offset_increment
+            elif self.test_state == "RAMP_LAT_DOWN":
+                self.gps_lat_offset -= self.offset_increment
+            elif self.test_state == "RAMP_LON_UP":
+                self.gps_lon_offset += self.offset_increment
+            elif self.test_state == "RAMP_LON_DOWN":
+                self.gps_lon_offset -= self.offset_increment
+            lat += self.gps_lat_offset
+            lon += self.gps_lon_offset
+        self._update_gps_position(lat, lon)
+
+    def _route_sog(self, value):
+        """Handles a navigation.speedOverGround value."""
+        self._update_sog(value)
+
+    def _route_starlink_position(self, value):
+        """Handles a Starlink navigation.position value."""
+        if self.test_mode and self.test_state == "SUPPRESS_STARLINK":
+            return # Skip processing this update
+        lat, lon = _lat_lon(value)
+        if lat is not None and lon is not None:
+            self._update_starlink_position(lat, lon)
 
     def _update_sog(self, sog):
         """Updates the state with a new Speed Over Ground value."""
+        t0 = perf_counter()
         self.sog = sog
+        self.watchdog.feed("sog")
+        changes = self.integrity.sog(self.clock.monotonic(), sog)
+        if changes:
+            self._report_integrity(changes)
+        self.m_update_seconds["sog"].observe(perf_counter() - t0)
 
     def _update_gps_position(self, lat, lon):
         """Updates the state with a new GPS position."""
-        if self.gps_data_lost:
-            msg = "OK: GPS data stream has resumed."
-            self.alert_logger.warning(msg)
-            self._write_alert_to_file(msg)
-            self.gps_data_lost = False
-
-        self.gps_lat = lat
-        self.gps_lon = lon
-        self.last_gps_update_time = time.monotonic()
+        t0 = perf_counter()
+        self.track.append(SOURCE_GPS, lat, lon, self.sog)
+        self.watchdog.feed("gps")
+        changes = self.integrity.gps(self.clock.monotonic(), lat, lon)
+        if changes:
+            self._report_integrity(changes)
+        if self.geofence is not None:
+            self._check_geofences("gps", lat, lon)
+        self.m_update_seconds["gps"].observe(perf_counter() - t0)
 
     def _update_starlink_position(self, lat, lon):
         """Updates the state with a new Starlink position and triggers checks."""
-        if self.starlink_data_lost:
-            msg = "OK: Starlink data stream has resumed."
-            self.alert_logger.warning(msg)
-            self._write_alert_to_file(msg)
-            self.starlink_data_lost = False
-
-        self.starlink_lat = lat
-        self.starlink_lon = lon
-        self.last_starlink_update_time = time.monotonic()
+        t0 = perf_counter()
+        self.track.append(SOURCE_STARLINK, lat, lon, self.sog)
+        self.watchdog.feed("starlink")
+        changes = self.integrity.starlink(self.clock.monotonic(), lat, lon)
+        if changes:
+            self._report_integrity(changes)
+        if self.geofence is not None:
+            self._check_geofences("starlink", lat, lon)
         # Log to CSV every time a Starlink position report comes in
-        for handler in self.logger.handlers:
-            if hasattr(handler, 'emit') and handler.__class__.__name__ == 'CsvLogHandler':
-                import logging
-                handler.emit(logging.LogRecord(
-                    name=self.logger.name,
-                    level=logging.INFO,
-                    pathname=__file__,
-                    lineno=0,
-                    msg='',
-                    args=(),
-                    exc_info=None
-                ))
+        t_csv = perf_counter()
+        now = self.clock.now()
+        self.track_writer.write(now, format_csv_row(self, now))
+        self.m_csv_seconds.observe(perf_counter() - t_csv)
+        if self.nmea_server is not None:
+            self.nmea_server.publish(lat, lon, now, self.sog)
 
         # Still only log to text file and check for alerts no more often than every minute
         self._check_position_difference()
+        self.m_update_seconds["starlink"].observe(perf_counter() - t0)
 
     def _check_position_difference(self):
         """Checks for position differences and logs/alerts if the state changes."""
-        if not all([self.gps_lat, self.gps_lon, self.starlink_lat, self.starlink_lon]):
+        gps = self.track.latest(SOURCE_GPS)
+        starlink = self.track.latest(SOURCE_STARLINK)
+        if gps is None or starlink is None:
             return  # Not enough data to compare
 
-        distance_nm = haversine(self.gps_lat, self.gps_lon, self.starlink_lat, self.starlink_lon)
-
-        slink_lat_deg, slink_lat_min = dd_to_dm(self.starlink_lat)
-        slink_lon_deg, slink_lon_min = dd_to_dm(self.starlink_lon)
-        lat_hemisphere = 'N' if self.starlink_lat >= 0 else 'S'
-        lon_hemisphere = 'W' if self.starlink_lon < 0 else 'E'
+        distance_nm = haversine(gps.lat, gps.lon, starlink.lat, starlink.lon)
+        self.distance_nm = distance_nm
+        self.stats.update(distance_nm)
+        connected_at = self._connected_at
+        if connected_at is not None and gps.time >= connected_at and starlink.time >= connected_at:
+            elapsed = self.clock.monotonic() - connected_at
+            self._connected_at = None
+            self.m_connect_to_compare.observe(elapsed)
+            self.logger.info(f"First position comparison {elapsed:.3f} s after connecting.")
+        recent = self.stats.window(ALERT_PERCENTILE_WINDOW_S)
+
+        slink_lat_deg, slink_lat_min = dd_to_dm(starlink.lat)
+        slink_lon_deg, slink_lon_min = dd_to_dm(starlink.lon)
+        lat_hemisphere = 'N' if starlink.lat >= 0 else 'S'
+        lon_hemisphere = 'W' if starlink.lon < 0 else 'E'
 
         # Log the current status to the main log file only if a minute or more has passed
-        now = time.monotonic()
+        now = self.clock.monotonic()
         if self.last_position_log_time is None or (now - self.last_position_log_time) >= 60:
-            # Update maximum distance seen
-            self.max_distance_nm = max(self.max_distance_nm, distance_nm)
             sog_str = f", SOG: {self.sog}" if self.sog is not None else ""
             log_msg = (
                 f"Starlink Position: {abs(slink_lat_deg)}° {slink_lat_min:.3f}' {lat_hemisphere}, "
                 f"{abs(slink_lon_deg)}° {slink_lon_min:.3f}' {lon_hemisphere}. "
-                f"GPS delta: {distance_nm:.3f} NM (max: {self.max_distance_nm:.3f} NM){sog_str}"
+                f"GPS delta: {distance_nm:.3f} NM ({self.stats.summary()}){sog_str}"
             )
             self.logger.info(log_msg)
             self.last_position_log_time = now
 
-        # Check if the difference state has changed
-        is_different = distance_nm > DISTANCE_THRESHOLD_NM
-        if is_different != self.starlink_gps_big_diff:
-            self.starlink_gps_big_diff = is_different
-            if is_different:
-                alert_msg = (
-                    f"ALERT: GPS/Starlink position difference exceeds {DISTANCE_THRESHOLD_NM} NM. "
-                    f"Current difference is {distance_nm:.3f} NM."
-                )
-                self.alert_logger.warning(alert_msg)
-                self._write_alert_to_file(alert_msg)
+        # Check if the difference state has changed. Besides the current value,
+        # the recent 95th percentile keeps a jittery difference from looking normal.
+        # A raised alert clears at the lower distance_clear_nm (hysteresis).
+        config = self.config
+        threshold = config.distance_clear_nm if self.starlink_gps_big_diff else config.distance_threshold_nm
+        is_different = distance_nm > threshold or recent.percentile_above(95, threshold)
+        if is_different == self.starlink_gps_big_diff:
+            self._diff_changed_at = None
+            return
+        # The new state must last for the dwell time before it is reported
+        if self._diff_changed_at is None:
+            self._diff_changed_at = now
+        dwell_s = config.alert_raise_dwell_s if is_different else config.alert_clear_dwell_s
+        if now - self._diff_changed_at < dwell_s:
+            return
+        self._diff_changed_at = None
+        self.starlink_gps_big_diff = is_different
+        if is_different:
+            alert_msg = (
+                f"ALERT: GPS/Starlink position difference exceeds {config.distance_threshold_nm} NM. "
+                f"Current difference is {distance_nm:.3f} NM, "
+                f"{recent.seconds} s 95th percentile {recent.p95:.3f} NM."
+            )
+        else:
+            alert_msg = (
+                f"OK: GPS/Starlink position difference is back within "
+                f"{config.distance_clear_nm} NM. Current difference is {distance_nm:.3f} NM."
+            )
+        self.alert_logger.warning(alert_msg)
+        self._write_alert_to_file(alert_msg)
+
+    def _check_geofences(self, source, lat, lon):
+        """Alerts when the position from `source` enters or leaves a geofence."""
+        label = SOURCE_LABELS.get(source, source)
+        for zone, entered in self.geofence.update(source, lat, lon):
+            status = "ALERT" if zone.alerts_on(entered) else "OK"
+            msg = (f"{status}: {label} position {'entered' if entered else 'left'} geofence '{zone.name}' "
+                   f"at {lat:.5f}, {lon:.5f}.")
+            self.alert_logger.warning(msg)
+            self._write_alert_to_file(msg)
+
+    def _report_integrity(self, changes):
+        """Alerts on GPS integrity detectors that were raised or cleared."""
+        for detector, raised, confidence in changes:
+            if raised:
+                msg = (f"ALERT: GPS integrity check {detector.name} failed "
+                       f"(confidence {confidence:.2f}): {detector.detail}.")
             else:
-                alert_msg = (
-                    f"OK: GPS/Starlink position difference is back within "
-                    f"{DISTANCE_THRESHOLD_NM} NM tolerance. Current difference is {distance_nm:.3f} NM."
-                )
-                self.alert_logger.warning(alert_msg)
-                self._write_alert_to_file(alert_msg)
-                self.max_distance_nm = 0.0 # Reset max distance after returning to normal
-
-    async def _data_loss_checker_loop(self):
-        """Periodically checks if data sources have timed out."""
-        # Wait a moment for the first messages to arrive
-        await asyncio.sleep(DATA_LOSS_TIMEOUT_S)
+                msg = f"OK: GPS integrity check {detector.name} passes again."
+            self.alert_logger.warning(msg)
+            self._write_alert_to_file(msg)
 
-        while True:
-            now = time.monotonic()
-
-            # Check for GPS data loss
-            if self.last_gps_update_time:
-                if now - self.last_gps_update_time > DATA_LOSS_TIMEOUT_S and not self.gps_data_lost:
-                    self.gps_data_lost = True
-                    msg = "ALERT: No GPS data received for 1 minute."
-                    self.alert_logger.warning(msg)
-                    self._write_alert_to_file(msg)
-            else: # No data ever received
-                if not self.gps_data_lost:
-                    self.gps_data_lost = True
-                    msg = "ALERT: No GPS data ever received after startup period."
-                    self.alert_logger.warning(msg)
-                    self._write_alert_to_file(msg)
-
-
-            # Check for Starlink data loss
-            if self.last_starlink_update_time:
-                if now - self.last_starlink_update_time > DATA_LOSS_TIMEOUT_S and not self.starlink_data_lost:
-                    self.starlink_data_lost = True
-                    msg = "ALERT: No Starlink data received for 1 minute."
-                    self.alert_logger.warning(msg)
-                    self._write_alert_to_file(msg)
-            else: # No data ever received
-                if not self.starlink_data_lost:
-                    self.starlink_data_lost = True
-                    msg = "ALERT: No Starlink data ever received after startup period."
-                    self.alert_logger.warning(msg)
-                    self._write_alert_to_file(msg)
-
-
-            await asyncio.sleep(10) # Check every 10 seconds
+    def _on_data_lost(self, source, ever_received):
+        """Called by the watchdog when a source misses its deadline."""
+        label = SOURCE_LABELS.get(source, source)
+        if ever_received:
+            timeout = self.watchdog.timeout_for(source)
+            msg = f"ALERT: No {label} data received for {_format_duration(timeout)}."
+        else:
+            msg = f"ALERT: No {label} data ever received after startup period."
+        # Say so if we were stalled ourselves, so the data may not really have been missing
+        silent_s = self.watchdog.seconds_since_fed(source) or self.watchdog.timeout_for(source)
+        stall_s = self.loop_monitor.stalled_since(self.clock.monotonic() - silent_s)
+        if stall_s >= LOOP_STALL_WARN_S:
+            msg = f"{msg[:-1]} (this monitor was itself stalled for {stall_s:.1f} s)."
+        self.alert_logger.warning(msg)
+        self._write_alert_to_file(msg)
+
+    def _on_data_resumed(self, source):
+        """Called by the watchdog when a lost source sends data again."""
+        msg = f"OK: {SOURCE_LABELS.get(source, source)} data stream has resumed."
+        self.alert_logger.warning(msg)
+        self._write_alert_to_file(msg)
 
     async def _test_runner_loop(self):
         """Runs a sequence of test scenarios to trigger alerts."""
         # Wait for the system to receive initial data from both sources
         self.logger.info("Test runner waiting for initial GPS and Starlink data...")
         while not all([self.gps_lat, self.starlink_lat]):
-            await asyncio.sleep(1)
+            await self.clock.sleep(1)
         self.logger.info("Test runner detected initial data. Starting test sequence in 5 seconds.")
-        await asyncio.sleep(5)
+        await self.clock.sleep(5)
 
         # --- GPS Offset Test ---
         self.logger.warning("STARTING GPS OFFSET TEST")
@@ -469,40 +1160,40 @@ class GpsAlerter:
         # Ramp latitude up from 0 to +8/600 deg (4 mins total)
         self.logger.info("Test: Ramping latitude offset up to +8/600 deg over 4 mins...")
         self.test_state = "RAMP_LAT_UP"
-        await asyncio.sleep(240) # 4 minutes
+        await self.clock.sleep(240) # 4 minutes
 
         # Ramp latitude down from +8/600 to -8/600 deg (8 mins total)
         self.logger.info("Test: Ramping latitude offset down to -8/600 deg over 8 mins...")
         self.test_state = "RAMP_LAT_DOWN"
-        await asyncio.sleep(480) # 8 minutes
+        await self.clock.sleep(480) # 8 minutes
 
         # Ramp latitude up from -8/600 to 0 deg (4 mins total)
         self.logger.info("Test: Ramping latitude offset up to 0 deg over 4 mins...")
         self.test_state = "RAMP_LAT_UP"
-        await asyncio.sleep(240) # 4 minutes
+        await self.clock.sleep(240) # 4 minutes
         self.gps_lat_offset = 0.0 # Reset to exactly zero
 
         self.logger.info("Test: Latitude offset test complete.")
-        await asyncio.sleep(2)
+        await self.clock.sleep(2)
 
         # Ramp longitude up from 0 to +8/600 deg (4 mins total)
         self.logger.info("Test: Ramping longitude offset up to +8/600 deg over 4 mins...")
         self.test_state = "RAMP_LON_UP"
-        await asyncio.sleep(240) # 4 minutes
+        await self.clock.sleep(240) # 4 minutes
 
         # Ramp longitude down from +8/600 to -8/600 deg (8 mins total)
         self.logger.info("Test: Ramping longitude offset down to -8/600 deg over 8 mins...")
         self.test_state = "RAMP_LON_DOWN"
-        await asyncio.sleep(480) # 8 minutes
+        await self.clock.sleep(480) # 8 minutes
 
         # Ramp longitude up from -8/600 to 0 deg (4 mins total)
         self.logger.info("Test: Ramping longitude offset up to 0 deg over 4 mins...")
         self.test_state = "RAMP_LON_UP"
-        await asyncio.sleep(240) # 4 minutes
+        await self.clock.sleep(240) # 4 minutes
         self.gps_lon_offset = 0.0 # Reset to exactly zero
 
         self.logger.warning("GPS OFFSET TEST COMPLETE.")
-        await asyncio.sleep(5)
+        await self.clock.sleep(5)
 
         # --- Data Loss Test ---
         self.logger.warning("STARTING DATA LOSS TEST")
@@ -510,17 +1201,17 @@ class GpsAlerter:
         # Suppress GPS for 2 minutes
         self.logger.info("Test: Suppressing GPS data for 2 minutes...")
         self.test_state = "SUPPRESS_GPS"
-        await asyncio.sleep(120)
+        await self.clock.sleep(120)
 
         # Restore GPS for 2 minutes
         self.logger.info("Test: Restoring GPS data for 2 minutes...")
         self.test_state = "IDLE"
-        await asyncio.sleep(120)
+        await self.clock.sleep(120)
 
         # Suppress Starlink for 2 minutes
         self.logger.info("Test: Suppressing Starlink data for 2 minutes...")
         self.test_state = "SUPPRESS_STARLINK"
-        await asyncio.sleep(120)
+        await self.clock.sleep(120)
 
         # Restore Starlink
         self.logger.info("Test: Restoring Starlink data...")
@@ -530,18 +1221,145 @@ class GpsAlerter:
 
 
 
-async def main():
-    """Main function to run the alerter."""
-    parser = argparse.ArgumentParser(description="Monitor Starlink and GPS position data.")
+def build_arg_parser(description="Monitor Starlink and GPS position data."):
+    """Returns the command line parser, shared with the single-process gps_loss_alerting.py."""
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("-t", "--test", action="store_true",
                         help="Enable test mode to generate alert conditions.")
-    args = parser.parse_args()
+    parser.add_argument("--uri",
+                        help=f"Signal K websocket URI (default: signalk_uri from the config file, or {SIGNALK_URI}).")
+    parser.add_argument("--config", metavar="YAML", type=Path, default=CONFIG_PATH,
+                        help="Config file, applied again whenever it changes, see alerter_config.py "
+                             f"(default: {CONFIG_PATH}, if it exists or once it is created).")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"Port of the local metrics endpoint, 0 to disable (default: {METRICS_PORT}).")
+    parser.add_argument("--starlink-dish", metavar="HOST:PORT", nargs="?", const=STARLINK_DISH_TARGET,
+                        help="Read Starlink positions from the dish's gRPC API instead of the "
+                             f"signalk-starlink plugin (default address: {STARLINK_DISH_TARGET}).")
+    parser.add_argument("--starlink-dish-interval", type=float, default=STARLINK_DISH_POLL_S,
+                        help=f"Seconds between dish location requests (default: {STARLINK_DISH_POLL_S}).")
+    parser.add_argument("--nmea", metavar="URL", action="append", default=[],
+                        help="Read GPS position and SOG from NMEA 0183 instead of Signal K, e.g. "
+                             "udp://:10110 or tcp://192.168.1.1:10110. Can be given more than once.")
+    parser.add_argument("--nmea-out-udp", metavar="HOST:PORT",
+                        help="Send the Starlink position as NMEA 0183 to this UDP address, "
+                             "e.g. 192.168.1.255:10110 to broadcast on the boat network.")
+    parser.add_argument("--nmea-out-tcp", metavar="[HOST:]PORT",
+                        help="Serve the Starlink position as NMEA 0183 to TCP clients on this port.")
+    parser.add_argument("--geofences", metavar="GEOJSON", type=Path,
+                        help="Alert when GPS or Starlink positions enter or leave the zones in this GeoJSON file.")
+    parser.add_argument("--log-dir", type=Path,
+                        help=f"Directory for logs, CSV files and alerts (default: {LOG_DIR}; "
+                             "required with --replay).")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="Start without the saved state and don't save it (not used with --replay).")
+    parser.add_argument("--archive-max-mb", type=float, default=ARCHIVE_MAX_BYTES / 2**20,
+                        help="Size limit of the compressed track, alert and log archive in MB, "
+                             f"0 to disable it (default: {ARCHIVE_MAX_BYTES // 2**20}).")
+    parser.add_argument("--plain-log-days", metavar="DAYS", type=int, default=PLAIN_LOG_DAYS,
+                        help="Days of daily track CSV files and log files kept besides the archive, "
+                             f"0 to keep them all (default: {PLAIN_LOG_DAYS}).")
+    parser.add_argument("--record", metavar="CAPTURE", type=Path,
+                        help="Record raw websocket frames to a compressed capture file.")
+    parser.add_argument("--replay", metavar="CAPTURE", type=Path,
+                        help="Replay a capture file instead of connecting to Signal K.")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Replay speed as a multiple of real time; 0 replays as fast as possible.")
+    return parser
+
+
+def create_alerter(args, alert_sink=None):
+    """Returns a GpsAlerter for live operation, configured from the parsed command line."""
+    geofences = load_geofences(args.geofences) if args.geofences else ()
+    recorder = CaptureRecorder(args.record) if args.record else None
+    metrics_address = (METRICS_HOST, args.metrics_port) if args.metrics_port else None
+    nmea_server = None
+    if args.nmea_out_udp or args.nmea_out_tcp:
+        nmea_server = NmeaServer(SystemClock(),
+                                 _host_port(args.nmea_out_udp, "255.255.255.255") if args.nmea_out_udp else None,
+                                 _host_port(args.nmea_out_tcp, "0.0.0.0") if args.nmea_out_tcp else None)
+    log_dir = args.log_dir or LOG_DIR
+    checkpoint_path = None if args.no_checkpoint else Path(log_dir) / CHECKPOINT_FILENAME
+    alerter = GpsAlerter(test_mode=args.test, log_dir=log_dir, recorder=recorder,
+                         signalk_uri=args.uri, config_path=args.config, metrics_address=metrics_address, nmea_server=nmea_server,
+                         geofences=geofences, checkpoint_path=checkpoint_path, alert_sink=alert_sink,
+                         archive_max_bytes=int(args.archive_max_mb * 2**20), plain_log_days=args.plain_log_days)
+    if args.nmea:
+        alerter.disable_route_targets("gps_position", "sog")
+        for url in args.nmea:
+            alerter.add_source(NmeaSource(alerter.clock, url))
+    if args.starlink_dish:
+        alerter.disable_route_targets("starlink_position")
+        try:
+            alerter.add_source(StarlinkDishSource(alerter.clock, args.starlink_dish, args.starlink_dish_interval))
+        except ImportError as e:
+            print(e)
+            sys.exit(1)
+    return alerter
+
+
+async def run_until_sigterm(coro):
+    """Runs `coro` until it returns or the process receives SIGTERM.
 
-    alerter = GpsAlerter(test_mode=args.test)
-    await alerter.run()
+    systemd stops the service with SIGTERM, whose default action ends the
+    process at once, without running finally blocks or atexit handlers, so
+    buffered track rows, queued alerts and the checkpoint would be lost.
+    Instead SIGTERM cancels `coro`, its finally blocks flush and close
+    everything, and this returns normally.
+    """
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        stopping = True
+        task.cancel()
+
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop)
+    except NotImplementedError:
+        pass  # No signal handlers on the Windows event loop
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if not stopping:
+            raise
+        print("Stopped by SIGTERM.")
+    finally:
+        try:
+            loop.remove_signal_handler(signal.SIGTERM)
+        except NotImplementedError:
+            pass
+
+
+async def main():
+    """Main function to run the alerter."""
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.replay:
+        if args.log_dir is None:
+            # The default is the live log directory, whose alerts the sender delivers
+            parser.error("--replay needs --log-dir, so that replayed alerts stay out of the live alerts file")
+        geofences = load_geofences(args.geofences) if args.geofences else ()
+        capture = CaptureReader(args.replay)
+        alerter = GpsAlerter(test_mode=args.test, clock=VirtualClock(capture.start), log_dir=args.log_dir,
+                             config_path=args.config, geofences=geofences, archive_max_bytes=int(args.archive_max_mb * 2**20),
+                             plain_log_days=args.plain_log_days)
+        await alerter.replay(capture, speed=args.speed)
+        return
+    await create_alerter(args).run()
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["analyze"]:
+        # Offline reports on the track CSV files, see track_analysis.py
+        from track_analysis import main as analyze
+        sys.exit(analyze(sys.argv[2:], threshold_nm=DISTANCE_THRESHOLD_NM, log_dir=LOG_DIR))
+    if sys.argv[1:2] == ["archive"]:
+        # Queries of the compressed archive, see track_archive.py
+        from track_archive import main as archive
+        sys.exit(archive(sys.argv[2:], log_dir=LOG_DIR))
     try:
-        asyncio.run(main())
+        asyncio.run(run_until_sigterm(main()))
     except KeyboardInterrupt:
         print("\nProgram interrupted by user. Exiting.")
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Streaming statistics of the GPS/Starlink difference over rolling windows.
+
+For each window (1 minute, 10 minutes, 1 hour by default) this keeps the
+mean, variance, a time-based EWMA, the maximum and an approximate 95th
+percentile, all updated in O(1) amortised time per sample:
+
+- Samples are grouped into time buckets (60 per window). Each bucket keeps a
+  Welford mean/M2 and a small log-scale histogram. Bucket summaries are added
+  to the window totals as samples arrive and subtracted when the bucket
+  expires, using Chan's formula for combining Welford states.
+- The rolling maximum uses a monotonic deque.
+- The 95th percentile is read from the window histogram, which has a fixed
+  number of bins, so it is accurate to about 8% without storing samples. It
+  is never reported above the window's maximum.
+
+The alert decisions need exact answers, so the window they use (1 minute)
+also keeps its samples, in arrival order for expiry and in a sorted list
+kept up to date with bisect. Its percentile is then exact and read by index,
+and percentile_above() counts the samples above a threshold by bisection,
+so neither sorts anything per call.
+"""
+
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+# Rolling windows, in seconds
+STATS_WINDOWS_S = (60, 600, 3600)
+# Time buckets per window
+STATS_BUCKETS = 60
+# Histogram: HIST_BINS_PER_DECADE log-spaced bins from HIST_MIN_NM to 100 NM
+HIST_MIN_NM = 0.001
+HIST_BINS_PER_DECADE = 16
+HIST_BINS = 5 * HIST_BINS_PER_DECADE + 2  # plus underflow and overflow bins
+# Windows up to this long keep their samples for exact answers, in seconds
+STATS_EXACT_MAX_S = 60
+
+
+def _hist_bin(x):
+    if x < HIST_MIN_NM:
+        return 0
+    b = int(math.log10(x / HIST_MIN_NM) * HIST_BINS_PER_DECADE) + 1
+    return min(b, HIST_BINS - 1)
+
+
+def _hist_value(b):
+    """Representative value (geometric middle) of histogram bin b."""
+    if b == 0:
+        return 0.0
+    return HIST_MIN_NM * 10 ** ((b - 0.5) / HIST_BINS_PER_DECADE)
+
+
+class _Bucket:
+    __slots__ = ('index', 'count', 'mean', 'm2', 'hist')
+
+    def __init__(self):
+        self.index = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.hist = {}
+
+
+class WindowStats:
+    """Rolling statistics of a value over the last `seconds` seconds.
+
+    With keep_samples, the samples themselves are kept too, for exact
+    percentiles.
+    """
+
+    def __init__(self, seconds, buckets=STATS_BUCKETS, keep_samples=False):
+        self.seconds = seconds
+        self._bucket_s = seconds / buckets
+        self._buckets = [_Bucket() for _ in range(buckets)]
+        # Buckets holding samples, oldest first
+        self._live = deque()
+        # Window totals: count and Welford mean/M2 of all live buckets
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._hist = [0] * HIST_BINS
+        # (time, value) pairs with decreasing values, for the rolling maximum
+        self._max = deque()
+        self.ewma = None
+        self._last_t = None
+        # (bucket index, value) of every live sample, oldest first, and the
+        # same values sorted; both None without keep_samples
+        self._samples = deque() if keep_samples else None
+        self._sorted = [] if keep_samples else None
+
+    def add(self, t, x):
+        index = int(t // self._bucket_s)
+        bucket = self._buckets[index % len(self._buckets)]
+        if bucket.index != index:
+            self._expire(index)
+            bucket.index = index
+            self._live.append(bucket)
+
+        # Welford update of the bucket and of the window totals
+        bucket.count += 1
+        delta = x - bucket.mean
+        bucket.mean += delta / bucket.count
+        bucket.m2 += delta * (x - bucket.mean)
+        self.count += 1
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+
+        b = _hist_bin(x)
+        bucket.hist[b] = bucket.hist.get(b, 0) + 1
+        self._hist[b] += 1
+        if self._samples is not None:
+            self._samples.append((index, x))
+            insort(self._sorted, x)
+
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((t, x))
+        while self._max[0][0] <= t - self.seconds:
+            self._max.popleft()
+
+        # Time-based EWMA with a time constant equal to the window length
+        if self.ewma is None:
+            self.ewma = x
+        else:
+            alpha = 1.0 - math.exp(-max(t - self._last_t, 0.0) / self.seconds)
+            self.ewma += alpha * (x - self.ewma)
+        self._last_t = t
+
+    def _expire(self, index):
+        """Removes buckets that have fallen out of the window ending in bucket `index`."""
+        oldest_live = index - len(self._buckets) + 1
+        while self._live and self._live[0].index < oldest_live:
+            self._remove(self._live.popleft())
+        samples = self._samples
+        while samples and samples[0][0] < oldest_live:
+            x = samples.popleft()[1]
+            del self._sorted[bisect_left(self._sorted, x)]
+
+    def _remove(self, bucket):
+        # Reverse of Chan's formula for merging two Welford states
+        n = self.count - bucket.count
+        if n <= 0:
+            self.count, self._mean, self._m2 = 0, 0.0, 0.0
+        else:
+            mean = (self.count * self._mean - bucket.count * bucket.mean) / n
+            delta = bucket.mean - mean
+            self._m2 = max(self._m2 - bucket.m2 - delta * delta * n * bucket.count / self.count, 0.0)
+            self._mean = mean
+            self.count = n
+        for b, c in bucket.hist.items():
+            self._hist[b] -= c
+        bucket.index = None
+        bucket.count = 0
+        bucket.mean = 0.0
+        bucket.m2 = 0.0
+        bucket.hist = {}
+
+    @property
+    def mean(self):
+        return self._mean if self.count else None
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stddev(self):
+        v = self.variance
+        return math.sqrt(v) if v is not None else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max and self.count else None
+
+    def percentile(self, p):
+        """p-th percentile (0-100): exact with keep_samples, else approximate from the histogram."""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        if self._sorted is not None:
+            return self._sorted[max(math.ceil(rank), 1) - 1]
+        seen = 0
+        for b, c in enumerate(self._hist):
+            seen += c
+            if seen >= rank:
+                # The middle of a bin can be above every sample in it
+                return min(_hist_value(b), self.max)
+        return self.max
+
+    def count_above(self, threshold):
+        """Number of samples above `threshold`. Needs keep_samples."""
+        return len(self._sorted) - bisect_right(self._sorted, threshold)
+
+    def percentile_above(self, p, threshold):
+        """Exactly whether the p-th percentile is above `threshold`. Needs keep_samples."""
+        # The percentile is above it when fewer than p% of the samples are at or below it
+        return self.count_above(threshold) > (1.0 - p / 100.0) * self.count
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+
+class DivergenceStats:
+    """Rolling statistics of the GPS/Starlink difference over several windows."""
+
+    def __init__(self, clock, windows=STATS_WINDOWS_S):
+        self.clock = clock
+        self.windows = {seconds: WindowStats(seconds, keep_samples=seconds <= STATS_EXACT_MAX_S)
+                        for seconds in windows}
+        # Welford mean/variance since the program started
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, distance_nm):
+        t = self.clock.monotonic()
+        for window in self.windows.values():
+            window.add(t, distance_nm)
+        self.count += 1
+        delta = distance_nm - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (distance_nm - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+    def window(self, seconds):
+        return self.windows[seconds]
+
+    def summary(self):
+        """One-line summary for the periodic log message."""
+        parts = []
+        for seconds, w in self.windows.items():
+            if not w.count:
+                continue
+            label = f"{seconds // 3600}h" if seconds % 3600 == 0 else f"{seconds // 60}m"
+            parts.append(f"{label} mean {w.mean:.3f} sd {w.stddev or 0.0:.3f} "
+                         f"p95 {w.p95:.3f} max {w.max:.3f} ewma {w.ewma:.3f}")
+        return "; ".join(parts)
@@ -0,0 +1,195 @@
+"""Geofences: alerts when a position enters or leaves user-defined zones.
+
+Zones are loaded from a GeoJSON file. Polygon and MultiPolygon features are
+areas such as known GPS jamming zones; Point features with a "radius_nm"
+property are circles, such as an anchor circle. Each feature may have:
+
+- "name": shown in alerts (defaults to the feature's position in the file)
+- "alert": "enter" (the default), "exit" or "both" -- which crossing is an
+  ALERT; the opposite crossing gives an OK message. An anchor circle uses "exit".
+
+Zones are put in a grid of GEOFENCE_CELL_DEG cells by bounding box, so a fix
+is only tested against the few zones whose box overlaps its cell, however
+many zones are loaded. Coordinates are treated as planar within a zone, which
+is fine for zones up to a few hundred miles across; zones must not cross the
+180th meridian.
+"""
+
+import json
+import math
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+# Grid cell size of the spatial index, in degrees
+GEOFENCE_CELL_DEG = 0.25
+ALERT_MODES = ("enter", "exit", "both")
+NM_PER_DEG_LAT = 60.0
+
+
+class Zone(ABC):
+    """Base class of a geofence zone."""
+    __slots__ = ('name', 'alert', 'bbox')
+
+    def __init__(self, name, alert, bbox):
+        if alert not in ALERT_MODES:
+            raise ValueError(f"Geofence {name}: alert must be one of {', '.join(ALERT_MODES)}")
+        self.name = name
+        self.alert = alert
+        # (min_lat, min_lon, max_lat, max_lon)
+        self.bbox = bbox
+
+    @abstractmethod
+    def contains(self, lat, lon):
+        """True if (lat, lon) is inside the zone."""
+
+    def alerts_on(self, entered):
+        """True if entering (or, if entered is False, leaving) the zone is an alert."""
+        return self.alert == "both" or self.alert == ("enter" if entered else "exit")
+
+
+def _in_ring(ring, lat, lon):
+    """Ray casting point-in-polygon test; ring is a list of (lat, lon) pairs."""
+    inside = False
+    lat1, lon1 = ring[-1]
+    for lat2, lon2 in ring:
+        if (lat1 > lat) != (lat2 > lat):
+            if lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                inside = not inside
+        lat1, lon1 = lat2, lon2
+    return inside
+
+
+class PolygonZone(Zone):
+    """One or more polygons, each an outer ring and optional holes."""
+    __slots__ = ('polygons',)
+
+    def __init__(self, name, polygons, alert="enter"):
+        points = [p for polygon in polygons for ring in polygon for p in ring]
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        super().__init__(name, alert, (min(lats), min(lons), max(lats), max(lons)))
+        self.polygons = polygons
+
+    def contains(self, lat, lon):
+        for outer, *holes in self.polygons:
+            if _in_ring(outer, lat, lon) and not any(_in_ring(hole, lat, lon) for hole in holes):
+                return True
+        return False
+
+
+class CircleZone(Zone):
+    """All points within radius_nm of a centre."""
+    __slots__ = ('lat', 'lon', 'radius_nm', '_cos_lat')
+
+    def __init__(self, name, lat, lon, radius_nm, alert="enter"):
+        self._cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlat = radius_nm / NM_PER_DEG_LAT
+        dlon = dlat / self._cos_lat
+        super().__init__(name, alert, (lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+        self.lat = lat
+        self.lon = lon
+        self.radius_nm = radius_nm
+
+    def contains(self, lat, lon):
+        # Equirectangular distance, accurate to well under 1% at these sizes
+        dy = (lat - self.lat) * NM_PER_DEG_LAT
+        dx = (lon - self.lon) * NM_PER_DEG_LAT * self._cos_lat
+        return dx * dx + dy * dy <= self.radius_nm * self.radius_nm
+
+
+class GeofenceIndex:
+    """Uniform grid of zones by bounding box."""
+
+    def __init__(self, zones, cell_deg=GEOFENCE_CELL_DEG):
+        self.zones = list(zones)
+        self.cell_deg = cell_deg
+        self._cells = {}
+        for zone in self.zones:
+            min_lat, min_lon, max_lat, max_lon = zone.bbox
+            for i in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for j in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                    self._cells.setdefault((i, j), []).append(zone)
+
+    def _cell(self, deg):
+        return math.floor(deg / self.cell_deg)
+
+    def candidates(self, lat, lon):
+        """Zones whose bounding box overlaps the grid cell of a position."""
+        return self._cells.get((self._cell(lat), self._cell(lon)), ())
+
+    def containing(self, lat, lon):
+        """The set of zones that contain a position."""
+        result = set()
+        for zone in self.candidates(lat, lon):
+            min_lat, min_lon, max_lat, max_lon = zone.bbox
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and zone.contains(lat, lon):
+                result.add(zone)
+        return result
+
+
+class GeofenceMonitor:
+    """Tracks which zones each position source is in, and reports crossings."""
+
+    def __init__(self, zones, cell_deg=GEOFENCE_CELL_DEG):
+        self.index = GeofenceIndex(zones, cell_deg)
+        # source -> set of zones the source's last position was in
+        self._inside = {}
+
+    def update(self, source, lat, lon):
+        """Returns the (zone, entered) crossings since the previous position of `source`.
+
+        For the first position of a source, only being inside zones that alert
+        on entry is reported, not e.g. starting inside an anchor circle.
+        """
+        inside = self.index.containing(lat, lon)
+        before = self._inside.get(source)
+        if before is None:
+            self._inside[source] = inside
+            return [(zone, True) for zone in inside if zone.alerts_on(True)]
+        if inside == before:
+            return []
+        self._inside[source] = inside
+        return ([(zone, True) for zone in inside - before]
+                + [(zone, False) for zone in before - inside])
+
+
+    def state(self):
+        """Returns {source: [zone names]} for a checkpoint."""
+        return {source: sorted(zone.name for zone in inside) for source, inside in self._inside.items()}
+
+    def restore(self, state):
+        """Restores the zones each source was in, so they aren't reported again."""
+        by_name = {zone.name: zone for zone in self.index.zones}
+        for source, names in state.items():
+            self._inside[source] = {by_name[name] for name in names if name in by_name}
+
+
+def _ring(coordinates):
+    # GeoJSON positions are [lon, lat]
+    return [(float(lat), float(lon)) for lon, lat, *_ in coordinates]
+
+
+def load_geofences(path):
+    """Returns the zones defined in a GeoJSON file."""
+    with open(path) as f:
+        data = json.load(f)
+    features = data.get("features", []) if data.get("type") == "FeatureCollection" else [data]
+    zones = []
+    for n, feature in enumerate(features, 1):
+        props = feature.get("properties") or {}
+        geometry = feature.get("geometry") or {}
+        name = str(props.get("name", f"{Path(path).name} #{n}"))
+        alert = props.get("alert", "enter")
+        kind = geometry.get("type")
+        coordinates = geometry.get("coordinates")
+        if kind == "Polygon":
+            zones.append(PolygonZone(name, [[_ring(r) for r in coordinates]], alert))
+        elif kind == "MultiPolygon":
+            zones.append(PolygonZone(name, [[_ring(r) for r in polygon] for polygon in coordinates], alert))
+        elif kind == "Point" and "radius_nm" in props:
+            lon, lat = coordinates[:2]
+            zones.append(CircleZone(name, float(lat), float(lon), float(props["radius_nm"]), alert))
+        else:
+            raise ValueError(f"Geofence {name}: unsupported geometry {kind} "
+                             f"(use Polygon, MultiPolygon, or Point with a radius_nm property)")
+    return zones
@@ -0,0 +1,382 @@
+"""GPS integrity detectors for spoofing and jamming, run on every fix.
+
+The GPS/Starlink difference alert only fires once the two positions are a
+mile apart. These detectors look for the other signs of an unreliable GPS:
+
+- gps_jump: the GPS position moved further than SOG allows.
+- gps_frozen: the GPS position stopped changing, or keeps repeating a few
+  positions, while SOG says the boat is moving.
+- gps_drift: the GPS/Starlink difference keeps growing, as when a spoofer
+  pulls the position away slowly, long before it reaches the alert threshold.
+- gps_sog_mismatch: the speed of the GPS position over the last minute
+  doesn't match SOG.
+- sog_swing: SOG keeps changing faster than a boat can accelerate.
+
+Each detector keeps a few numbers of state and updates them in O(1) per fix,
+so they keep up with a 10-20 Hz NMEA 2000 GPS on a Raspberry Pi. Each gives
+a confidence between 0 and 1. IntegrityMonitor raises a detector's alert when
+its confidence reaches INTEGRITY_RAISE_CONFIDENCE, and clears it once the
+confidence has stayed below INTEGRITY_CLEAR_CONFIDENCE for
+INTEGRITY_CLEAR_DWELL_S.
+
+Times are monotonic seconds, positions decimal degrees and SOG m/s, as
+elsewhere in diff_starlink_gps.py.
+"""
+
+import math
+from collections import deque
+
+INTEGRITY_RAISE_CONFIDENCE = 0.8
+INTEGRITY_CLEAR_CONFIDENCE = 0.2
+INTEGRITY_CLEAR_DWELL_S = 60.0
+
+MPS_TO_KNOTS = 3600.0 / 1852.0
+NM_PER_DEG_LAT = 60.0
+
+# gps_jump: distance checked over at least this long, so GPS noise between
+# fast fixes doesn't look like speed
+JUMP_BASELINE_S = 1.0
+# Movement beyond SOG that is still GPS noise, and the excess that gives full confidence
+JUMP_TOLERANCE_NM = 0.03
+JUMP_FULL_NM = 0.2
+
+# gps_frozen: distinct recent positions remembered, to catch a short loop
+FROZEN_RECENT_FIXES = 8
+# Below this SOG an unchanging position is normal
+FROZEN_MIN_SOG_KN = 0.5
+# No new position for FROZEN_MIN_S starts to count; FROZEN_FULL_S gives full confidence
+FROZEN_MIN_S = 3.0
+FROZEN_FULL_S = 10.0
+
+# gps_drift: time constant of the exponentially weighted trend of the difference
+DRIFT_TAU_S = 120.0
+# Growth rates of the difference for zero and full confidence
+DRIFT_RATE_NM_H = 1.0
+DRIFT_FULL_RATE_NM_H = 2.0
+# The difference must also have grown this much above its usual level, an
+# average over DRIFT_BASELINE_TAU_S, so the wander of a noisy fix doesn't count
+DRIFT_MIN_GROWTH_NM = 0.1
+DRIFT_BASELINE_TAU_S = 3600.0
+# Weight (roughly the number of recent Starlink fixes) needed for a trend
+DRIFT_MIN_WEIGHT = 10.0
+
+# gps_sog_mismatch: speed of the GPS position measured over this long
+SPEED_BASELINE_S = 60.0
+# Mismatch that starts to count, and the mismatch that gives full confidence
+SPEED_MISMATCH_KN = 2.0
+SPEED_FULL_MISMATCH_KN = 4.0
+# Mismatch allowed as a fraction of SOG, as speed through a turn is less than SOG
+SPEED_MISMATCH_FRACTION = 0.25
+
+# sog_swing: a change of at least SOG_SWING_MIN_KN faster than SOG_MAX_ACCEL_KN_S is a swing
+SOG_SWING_MIN_KN = 2.0
+SOG_MAX_ACCEL_KN_S = 2.0
+# Swings are counted with this time constant; SOG_SWING_FULL_COUNT give full confidence
+SOG_SWING_TAU_S = 30.0
+SOG_SWING_FULL_COUNT = 5.0
+
+
+def _clamp(x):
+    return 0.0 if x <= 0.0 else 1.0 if x >= 1.0 else x
+
+
+def _distance_nm(lat1, lon1, lat2, lon2):
+    """Flat-earth distance, accurate enough (and much cheaper than haversine) for a few miles."""
+    dlat = (lat2 - lat1) * NM_PER_DEG_LAT
+    dlon = (lon2 - lon1) * NM_PER_DEG_LAT * math.cos(math.radians((lat1 + lat2) * 0.5))
+    return math.sqrt(dlat * dlat + dlon * dlon)
+
+
+class Detector:
+    """Base class of a detector. Subclasses override the updates they use.
+
+    Each update returns the detector's confidence (0 to 1) that something is
+    wrong, or None if the update didn't change it. `detail` describes the
+    evidence behind the latest confidence, for the alert message.
+    """
+    name = ""
+
+    def __init__(self):
+        self.detail = ""
+
+    def gps(self, t, lat, lon, sog):
+        return None
+
+    def sog(self, t, sog):
+        return None
+
+    def starlink(self, t, lat, lon):
+        return None
+
+
+class JumpDetector(Detector):
+    """The GPS position moved further than SOG allows."""
+    name = "gps_jump"
+
+    def __init__(self):
+        super().__init__()
+        self._anchor = None  # (t, lat, lon, sog)
+
+    def gps(self, t, lat, lon, sog):
+        anchor = self._anchor
+        if anchor is None:
+            self._anchor = (t, lat, lon, sog)
+            return None
+        dt = t - anchor[0]
+        if dt < JUMP_BASELINE_S:
+            return None
+        self._anchor = (t, lat, lon, sog)
+        moved = _distance_nm(anchor[1], anchor[2], lat, lon)
+        speed_kn = max(sog or 0.0, anchor[3] or 0.0) * MPS_TO_KNOTS
+        excess = moved - speed_kn * dt / 3600.0 - JUMP_TOLERANCE_NM
+        if excess <= 0.0:
+            return 0.0
+        self.detail = (f"GPS moved {moved:.3f} NM in {dt:.1f} s ({moved * 3600.0 / dt:.0f} kn) "
+                       f"at SOG {speed_kn:.1f} kn")
+        return _clamp(excess / JUMP_FULL_NM)
+
+
+class FrozenDetector(Detector):
+    """The GPS position stopped changing or keeps repeating while SOG says the boat moves."""
+    name = "gps_frozen"
+
+    def __init__(self):
+        super().__init__()
+        self._recent = deque(maxlen=FROZEN_RECENT_FIXES)
+        self._new_at = None
+
+    def gps(self, t, lat, lon, sog):
+        position = (lat, lon)
+        if position not in self._recent:
+            self._recent.append(position)
+            self._new_at = t
+            return 0.0
+        sog_kn = (sog or 0.0) * MPS_TO_KNOTS
+        if sog_kn < FROZEN_MIN_SOG_KN:
+            # At rest a repeated position is normal; count from when the boat moves
+            self._new_at = t
+            return 0.0
+        stale_s = t - self._new_at
+        if stale_s < FROZEN_MIN_S:
+            return 0.0
+        repeating = "unchanged" if position == self._recent[-1] else "repeating earlier positions"
+        self.detail = f"GPS position {repeating} for {stale_s:.0f} s at SOG {sog_kn:.1f} kn"
+        return _clamp((stale_s - FROZEN_MIN_S) / (FROZEN_FULL_S - FROZEN_MIN_S))
+
+
+class DriftDetector(Detector):
+    """The GPS/Starlink difference grows steadily.
+
+    Fits an exponentially weighted straight line to the difference against
+    time at each Starlink fix. The sums are kept relative to the latest fix,
+    so they stay small however long it runs.
+    """
+    name = "gps_drift"
+
+    def __init__(self):
+        super().__init__()
+        self._gps = None
+        self._t = None
+        self._baseline = None
+        # Decayed weight, and sums of x, x^2, y and xy with x the time relative to the latest fix
+        self._w = self._sx = self._sxx = self._sy = self._sxy = 0.0
+
+    def gps(self, t, lat, lon, sog):
+        self._gps = (lat, lon)
+        return None
+
+    def starlink(self, t, lat, lon):
+        if self._gps is None:
+            return None
+        y = _distance_nm(self._gps[0], self._gps[1], lat, lon)
+        if self._t is not None:
+            c = t - self._t
+            f = math.exp(-c / DRIFT_TAU_S)
+            # Shift x by -c, then decay
+            self._sxx = f * (self._sxx - 2 * c * self._sx + c * c * self._w)
+            self._sx = f * (self._sx - c * self._w)
+            self._sxy = f * (self._sxy - c * self._sy)
+            self._w *= f
+            self._sy *= f
+            self._baseline += (y - self._baseline) * (1.0 - math.exp(-c / DRIFT_BASELINE_TAU_S))
+        else:
+            self._baseline = y
+        self._t = t
+        # The new fix has x = 0
+        self._w += 1.0
+        self._sy += y
+        if self._w < DRIFT_MIN_WEIGHT:
+            return 0.0
+        denom = self._w * self._sxx - self._sx * self._sx
+        if denom <= 0.0:
+            return 0.0
+        slope = (self._w * self._sxy - self._sx * self._sy) / denom
+        level = (self._sy - slope * self._sx) / self._w
+        rate = slope * 3600.0
+        if level - self._baseline < DRIFT_MIN_GROWTH_NM or rate <= DRIFT_RATE_NM_H:
+            return 0.0
+        self.detail = (f"GPS/Starlink difference {level:.3f} NM, up from {self._baseline:.3f} NM, "
+                       f"growing at {rate:.1f} NM/h")
+        return _clamp((rate - DRIFT_RATE_NM_H) / (DRIFT_FULL_RATE_NM_H - DRIFT_RATE_NM_H))
+
+
+class SpeedMismatchDetector(Detector):
+    """The GPS position moves at a different speed than SOG reports."""
+    name = "gps_sog_mismatch"
+
+    def __init__(self):
+        super().__init__()
+        self._start = None  # (t, lat, lon)
+        # SOG integrated over time since the start, and the time it covers
+        self._sog_sum = 0.0
+        self._sog_s = 0.0
+        self._last = None  # (t, sog)
+
+    def gps(self, t, lat, lon, sog):
+        if self._start is None:
+            self._start = (t, lat, lon)
+            self._last = (t, sog)
+            return None
+        last_t, last_sog = self._last
+        if sog is not None and last_sog is not None:
+            self._sog_sum += (sog + last_sog) * 0.5 * (t - last_t)
+            self._sog_s += t - last_t
+        self._last = (t, sog)
+        dt = t - self._start[0]
+        if dt < SPEED_BASELINE_S:
+            return None
+        moved = _distance_nm(self._start[1], self._start[2], lat, lon)
+        covered = self._sog_s
+        sog_kn = self._sog_sum / covered * MPS_TO_KNOTS if covered > 0 else None
+        self._start = (t, lat, lon)
+        self._sog_sum = self._sog_s = 0.0
+        if sog_kn is None or covered < dt * 0.5:
+            return None
+        speed_kn = moved * 3600.0 / dt
+        # Speed made good is below SOG when turning, so only a speed above SOG
+        # counts fully; below it, allow a fraction of SOG as well
+        mismatch = speed_kn - sog_kn if speed_kn >= sog_kn else sog_kn - speed_kn - sog_kn * SPEED_MISMATCH_FRACTION
+        if mismatch <= SPEED_MISMATCH_KN:
+            return 0.0
+        self.detail = f"GPS position moved at {speed_kn:.1f} kn over {dt:.0f} s, SOG {sog_kn:.1f} kn"
+        return _clamp((mismatch - SPEED_MISMATCH_KN) / (SPEED_FULL_MISMATCH_KN - SPEED_MISMATCH_KN))
+
+
+class SogSwingDetector(Detector):
+    """SOG keeps changing faster than a boat can accelerate."""
+    name = "sog_swing"
+
+    def __init__(self):
+        super().__init__()
+        self._last = None  # (t, sog in knots)
+        self._swings = 0.0
+        self._swings_t = None
+
+    def sog(self, t, sog):
+        if sog is None:
+            return None
+        sog_kn = sog * MPS_TO_KNOTS
+        last = self._last
+        self._last = (t, sog_kn)
+        if last is None:
+            return None
+        change = abs(sog_kn - last[1])
+        if change < SOG_SWING_MIN_KN:
+            return None if self._swings == 0.0 else self._decay(t)
+        dt = t - last[0]
+        if dt > 0 and change / dt <= SOG_MAX_ACCEL_KN_S:
+            return self._decay(t)
+        confidence = self._decay(t, 1.0)
+        self.detail = f"SOG changed from {last[1]:.1f} to {sog_kn:.1f} kn in {dt:.1f} s"
+        return confidence
+
+    def _decay(self, t, swing=0.0):
+        if self._swings_t is not None:
+            self._swings *= math.exp(-(t - self._swings_t) / SOG_SWING_TAU_S)
+        self._swings += swing
+        self._swings_t = t
+        return _clamp(self._swings / SOG_SWING_FULL_COUNT)
+
+
+# Returned by the updates when no alert was raised or cleared
+_NO_CHANGES = ()
+
+
+def default_detectors():
+    return [JumpDetector(), FrozenDetector(), DriftDetector(), SpeedMismatchDetector(), SogSwingDetector()]
+
+
+class IntegrityMonitor:
+    """Feeds each fix to the detectors that use it and reports alerts raised and cleared.
+
+    Each update returns a tuple of (detector, raised, confidence) for the
+    alerts that were raised (raised True) or cleared by it; usually it is empty.
+    """
+
+    def __init__(self, detectors=None):
+        self.detectors = default_detectors() if detectors is None else list(detectors)
+        # Only call the detectors that override an update
+        self._on_gps = [d for d in self.detectors if type(d).gps is not Detector.gps]
+        self._on_sog = [d for d in self.detectors if type(d).sog is not Detector.sog]
+        self._on_starlink = [d for d in self.detectors if type(d).starlink is not Detector.starlink]
+        self.active = {d.name: False for d in self.detectors}
+        self.confidence = {d.name: 0.0 for d in self.detectors}
+        # Alerts raised per detector, for the metrics
+        self.raised = {d.name: 0 for d in self.detectors}
+        self._calm_since = {}
+        self._sog = None
+
+    def gps(self, t, lat, lon):
+        changes = _NO_CHANGES
+        for detector in self._on_gps:
+            confidence = detector.gps(t, lat, lon, self._sog)
+            if confidence is not None:
+                changes = self._update(detector, t, confidence, changes)
+        return changes
+
+    def sog(self, t, sog):
+        self._sog = sog
+        changes = _NO_CHANGES
+        for detector in self._on_sog:
+            confidence = detector.sog(t, sog)
+            if confidence is not None:
+                changes = self._update(detector, t, confidence, changes)
+        return changes
+
+    def starlink(self, t, lat, lon):
+        changes = _NO_CHANGES
+        for detector in self._on_starlink:
+            confidence = detector.starlink(t, lat, lon)
+            if confidence is not None:
+                changes = self._update(detector, t, confidence, changes)
+        return changes
+
+    def _update(self, detector, t, confidence, changes):
+        name = detector.name
+        self.confidence[name] = confidence
+        if not self.active[name]:
+            if confidence < INTEGRITY_RAISE_CONFIDENCE:
+                return changes
+            self.active[name] = True
+            self.raised[name] += 1
+            self._calm_since.pop(name, None)
+            return changes + ((detector, True, confidence),)
+        if confidence >= INTEGRITY_CLEAR_CONFIDENCE:
+            self._calm_since.pop(name, None)
+            return changes
+        calm_since = self._calm_since.setdefault(name, t)
+        if t - calm_since < INTEGRITY_CLEAR_DWELL_S:
+            return changes
+        self.active[name] = False
+        del self._calm_since[name]
+        return changes + ((detector, False, confidence),)
+
+    def state(self):
+        """Returns the names of the detectors with an active alert, for a checkpoint."""
+        return sorted(name for name, active in self.active.items() if active)
+
+    def restore(self, names):
+        """Marks the alerts of the named detectors as active, so they aren't raised again."""
+        for name in names:
+            if name in self.active:
+                self.active[name] = True
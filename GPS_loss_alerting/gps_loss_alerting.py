@@ -0,0 +1,110 @@
+"""Runs diff_starlink_gps.py and starlink_gps_alert.py in one process.
+
+Monitoring and alert delivery share one asyncio event loop and one Python
+interpreter, which saves memory and start-up time on a small computer such as
+a Raspberry Pi. Alerts are still appended to the alerts file, but GpsAlerter
+hands each one straight to the delivery task instead of waking up a second
+process to read it back. Delivery is acknowledged in the same ack file as
+starlink_gps_alert.py uses, so you can switch between this and the two
+separate services at any time; just don't run both.
+
+Takes the same options as diff_starlink_gps.py, except --replay.
+"""
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+
+from alert_channel import AlertFileReader, ALERTS_FILENAME, ACK_FILENAME
+from alert_dispatcher import AlertDispatcher
+from diff_starlink_gps import build_arg_parser, create_alerter, run_until_sigterm, LOG_DIR
+from starlink_gps_alert import (build_channels, start_coalescer, save_state, write_state, SAFETY_POLL_S,
+                                CHECKPOINT_INTERVAL_S, RETRY_DELAY_S)
+
+
+class AlertDelivery:
+    """The alert sender of starlink_gps_alert.py as an asyncio task.
+
+    Only the channels enabled in alerting_secrets.py are set up, and only
+    their client libraries are imported.
+    """
+
+    def __init__(self, log_dir):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(exist_ok=True)
+        self.dispatcher = AlertDispatcher(build_channels())
+        self.coalescer = start_coalescer(self.dispatcher, self.log_dir)
+        self.reader = AlertFileReader(self.log_dir / ALERTS_FILENAME, self.log_dir / ACK_FILENAME)
+        # Alerts written before this start that were never delivered
+        while True:
+            text, token = self.reader.read_pending()
+            if not text:
+                break
+            self.coalescer.add(text, token)
+        self._wake = asyncio.Event()
+        self._saved_at = time.monotonic()
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, line, token):
+        """GpsAlerter's alert_sink: queues an alert that was just written to the alerts file."""
+        self.coalescer.add(line, token)
+        self._wake.set()
+
+    async def run(self):
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    timeout = await self._deliver()
+                except Exception as e:
+                    # E.g. a full disk or an unwritable ack file. Undelivered alerts
+                    # stay queued; at worst some are sent twice.
+                    self.logger.error(f"Alert delivery failed, retrying in {RETRY_DELAY_S} s: {e}", exc_info=True)
+                    timeout = RETRY_DELAY_S
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            save_state(self.coalescer, self.log_dir)
+
+    async def _deliver(self):
+        """Sends the batches that are due, and returns how long to wait before the next round."""
+        # Sending blocks, so it runs in the dispatcher's threads while monitoring carries on
+        batches = self.coalescer.prepare()
+        results = {}
+        if batches:
+            messages = {name: message for name, (_, _, message) in batches.items()}
+            results = await asyncio.to_thread(self.dispatcher.deliver, messages)
+        self.reader.ack(*self.coalescer.complete(batches, results))
+        if batches or time.monotonic() - self._saved_at >= CHECKPOINT_INTERVAL_S:
+            # The state is taken here, on the event loop, and synced to disk in a thread
+            await asyncio.to_thread(write_state, self.coalescer.state(), self.log_dir)
+            self._saved_at = time.monotonic()
+
+        # Tidy up delivered alerts, then wait for the next alert or send
+        self.reader.compact()
+        due = self.coalescer.next_due()
+        return SAFETY_POLL_S if due is None else min(SAFETY_POLL_S, max(due - time.monotonic(), 0.1))
+
+
+async def main():
+    parser = build_arg_parser("Monitor Starlink and GPS position data and send alerts, in one process.")
+    args = parser.parse_args()
+    if args.replay:
+        parser.error("--replay isn't supported here, use diff_starlink_gps.py --replay")
+    delivery = AlertDelivery(args.log_dir or LOG_DIR)
+    alerter = create_alerter(args, alert_sink=delivery.add)
+    delivery_task = asyncio.create_task(delivery.run())
+    try:
+        await alerter.run()
+    finally:
+        delivery_task.cancel()
+        await asyncio.gather(delivery_task, return_exceptions=True)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_until_sigterm(main()))
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Exiting.")
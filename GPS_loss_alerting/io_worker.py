@@ -0,0 +1,150 @@
+"""Blocking file and log I/O moved off the asyncio loop.
+
+A write to the SD card can stall for seconds. Done on the event loop, that
+would hold up websocket.recv() and the data loss timers, and we could report
+our own stall as lost GPS data. Instead, diff_starlink_gps.py hands the alert
+file appends and the console and log file writes to an IoWorker, which runs
+them in order in one background thread.
+
+The queue is bounded at IO_QUEUE_MAX jobs. When it is full:
+
+- Log records below WARNING are dropped and counted.
+- Log records of WARNING and above may use IO_QUEUE_RESERVE more places, so
+  they outlast a burst of information lines, but a storm of errors can't
+  grow the queue without limit either. Beyond that they are dropped and
+  counted too.
+- Essential jobs (the alert file appends) are always queued, so no alert is
+  lost. They are rare and rate limited, so the queue stays small.
+
+Once the queue has emptied, a warning says how many records were dropped.
+
+The thread is a daemon thread, so jobs still queued when the process exits
+are lost unless close() is called: it runs them all first. GpsAlerter calls
+it on shutdown, which includes SIGTERM (see run_until_sigterm() in
+diff_starlink_gps.py). After close() jobs run straight away in the caller's
+thread, so nothing logged during shutdown is lost.
+"""
+
+import logging
+import logging.handlers
+import sys
+import threading
+import traceback
+from collections import deque
+
+IO_QUEUE_MAX = 2000
+# Extra places for priority jobs (warnings and errors) once the queue is full
+IO_QUEUE_RESERVE = 500
+
+
+class IoWorker:
+    """Runs submitted jobs in order in a background thread, from a bounded queue."""
+
+    def __init__(self, maxsize=IO_QUEUE_MAX, reserve=IO_QUEUE_RESERVE, name="io-worker"):
+        self.maxsize = maxsize
+        self.reserve = reserve
+        self._jobs = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._busy = False
+        # Jobs dropped because the queue was full, in total and not yet reported,
+        # and how many of those were priority jobs
+        self.dropped = 0
+        self.dropped_priority = 0
+        self._unreported = 0
+        self._unreported_priority = 0
+        # Most jobs waiting at once
+        self.high_water = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Jobs waiting to run."""
+        return len(self._jobs)
+
+    def submit(self, fn, *args, essential=False, priority=False):
+        """Queues fn(*args). Returns False if the job was dropped because the queue is full.
+
+        Essential jobs are always queued, and priority jobs may use the reserve.
+        """
+        with self._cond:
+            if not self._closed:
+                limit = self.maxsize + self.reserve if priority else self.maxsize
+                if len(self._jobs) >= limit and not essential:
+                    self.dropped += 1
+                    self._unreported += 1
+                    if priority:
+                        self.dropped_priority += 1
+                        self._unreported_priority += 1
+                    return False
+                self._jobs.append((fn, args))
+                self.high_water = max(self.high_water, len(self._jobs))
+                self._cond.notify()
+                return True
+        self._call(fn, args)
+        return True
+
+    def flush(self, timeout=None):
+        """Waits until every job submitted so far has run. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._jobs and not self._busy, timeout)
+
+    def close(self):
+        """Runs the remaining jobs and stops the thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while not self._jobs and not self._closed:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                fn, args = self._jobs.popleft()
+                self._busy = True
+                report = self._unreported if not self._jobs else 0
+                report_priority = self._unreported_priority if report else 0
+                if report:
+                    self._unreported = self._unreported_priority = 0
+            self._call(fn, args)
+            if report:
+                logging.getLogger(__name__).warning(
+                    f"Dropped {report} log records ({report_priority} of them warnings or errors) "
+                    f"while file output was stalled.")
+
+    @staticmethod
+    def _call(fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            # Logging the error could fail the same way, so it goes to stderr
+            traceback.print_exc(file=sys.stderr)
+
+
+class QueuedLogHandler(logging.handlers.QueueHandler):
+    """Passes log records to `handlers` (e.g. the console and log file) through an IoWorker.
+
+    The message is formatted in the caller's thread, as QueueHandler does.
+    Records of WARNING and above are priority jobs of the IoWorker.
+    """
+
+    def __init__(self, worker, handlers):
+        super().__init__(None)
+        self.worker = worker
+        self.handlers = list(handlers)
+
+    def enqueue(self, record):
+        self.worker.submit(self._handle, record, priority=record.levelno >= logging.WARNING)
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
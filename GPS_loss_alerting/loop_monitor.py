@@ -0,0 +1,67 @@
+"""Measures how late the asyncio event loop runs its callbacks.
+
+A task sleeps for LOOP_LAG_INTERVAL_S at a time and records how much later
+than asked it woke up. Near zero means the loop is keeping up. A large lag
+means something blocked the loop (a stalled SD card, a slow callback, CPU
+starvation). During such a stall, messages pile up in the socket and timers
+fire late. Stalls are remembered for a while, so a data loss alert can say
+whether the data may only have been stuck behind our own stall.
+"""
+
+import logging
+from collections import deque
+
+# How often the lag is measured
+LOOP_LAG_INTERVAL_S = 0.5
+# Lags longer than this are remembered as stalls...
+LOOP_STALL_S = 0.25
+# ...and longer than this are logged
+LOOP_STALL_WARN_S = 1.0
+# Most recent stalls remembered
+LOOP_STALL_HISTORY = 64
+
+
+class LoopLagMonitor:
+    """Measures the scheduling delay of the running event loop.
+
+    Only meaningful with a SystemClock: a VirtualClock never runs late.
+    `histogram` is an optional metrics Histogram that receives every lag.
+    """
+
+    def __init__(self, clock, interval_s=LOOP_LAG_INTERVAL_S, histogram=None):
+        self.clock = clock
+        self.interval_s = interval_s
+        self.histogram = histogram
+        self.logger = logging.getLogger(__name__)
+        # Latest and largest lag, in seconds
+        self.lag = 0.0
+        self.max_lag = 0.0
+        # (monotonic time the stall ended, its length)
+        self._stalls = deque(maxlen=LOOP_STALL_HISTORY)
+
+    async def run(self):
+        while True:
+            t0 = self.clock.monotonic()
+            await self.clock.sleep(self.interval_s)
+            now = self.clock.monotonic()
+            self.record(now, now - t0 - self.interval_s)
+
+    def record(self, now, lag):
+        lag = max(lag, 0.0)
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        if self.histogram is not None:
+            self.histogram.observe(lag)
+        if lag >= LOOP_STALL_S:
+            self._stalls.append((now, lag))
+            if lag >= LOOP_STALL_WARN_S:
+                self.logger.warning(f"Event loop stalled for {lag:.2f} s.")
+
+    def stalled_since(self, since):
+        """Longest stall (in seconds) that ended after monotonic time `since`, or 0.0."""
+        longest = 0.0
+        for ended, lag in reversed(self._stalls):
+            if ended < since:
+                break
+            longest = max(longest, lag)
+        return longest
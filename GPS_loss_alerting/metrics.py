@@ -0,0 +1,184 @@
+"""Lightweight in-process metrics, served in Prometheus text format.
+
+Counters and histograms are plain Python objects updated from the asyncio
+thread; an observation is a bisect and a few additions, cheap enough to leave
+on at full message rate. Gauges are callbacks evaluated only when scraped.
+The HTTP server runs in a daemon thread and only reads the values, so a
+scrape can't stall message processing. A scrape may see a histogram mid-update
+(count and sum off by one observation), which is fine for monitoring.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS_S = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 0.1, 1.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count."""
+    __slots__ = ('value',)
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name, labels):
+        # `name` already ends in _total, see MetricsRegistry.render()
+        yield name, labels, self.value
+
+
+class CounterFunc(Counter):
+    """Counter whose value is read from a callback at scrape time."""
+    __slots__ = ('fn',)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    @property
+    def value(self):
+        return self.fn()
+
+
+class Gauge:
+    """Value read from a callback at scrape time; None is reported as NaN."""
+    __slots__ = ('fn',)
+    kind = "gauge"
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def samples(self, name, labels):
+        yield name, labels, self.fn()
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+    kind = "histogram"
+
+    def __init__(self, bounds=LATENCY_BUCKETS_S):
+        self.bounds = tuple(bounds)
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, c in zip(self.bounds + (math.inf,), list(self.counts)):
+            cumulative += c
+            yield name + "_bucket", {**labels, "le": _number(float(bound))}, cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """Named metric families, each with one metric per label set."""
+
+    def __init__(self):
+        # name -> (kind, help, {label items: (labels, metric)})
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _add(self, name, help_text, metric, labels):
+        labels = labels or {}
+        with self._lock:
+            kind, _, children = self._families.setdefault(name, (metric.kind, help_text, {}))
+            if kind != metric.kind:
+                raise ValueError(f"Metric {name} is already registered as a {kind}")
+            return children.setdefault(tuple(sorted(labels.items())), (labels, metric))[1]
+
+    def counter(self, name, help_text, labels=None):
+        return self._add(name, help_text, Counter(), labels)
+
+    def counter_func(self, name, help_text, fn, labels=None):
+        return self._add(name, help_text, CounterFunc(fn), labels)
+
+    def histogram(self, name, help_text, labels=None, bounds=LATENCY_BUCKETS_S):
+        return self._add(name, help_text, Histogram(bounds), labels)
+
+    def gauge(self, name, help_text, fn, labels=None):
+        return self._add(name, help_text, Gauge(fn), labels)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            families = [(name, kind, help_text, list(children.values()))
+                        for name, (kind, help_text, children) in self._families.items()]
+        lines = []
+        for name, kind, help_text, children in families:
+            # In text format 0.0.4 the TYPE line names the counter sample itself
+            if kind == "counter":
+                name += "_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in children:
+                try:
+                    samples = list(metric.samples(name, labels))
+                except Exception:
+                    continue  # A failing gauge callback shouldn't break the scrape
+                for sample_name, sample_labels, value in samples:
+                    lines.append(f"{sample_name}{_labels_text(sample_labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry on http://host:port/metrics from a daemon thread."""
+
+    def __init__(self, registry, host="127.0.0.1", port=9108):
+        # Imported here so the registry alone doesn't pull in the HTTP server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry_.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Don't log every scrape
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
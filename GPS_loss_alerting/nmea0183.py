@@ -0,0 +1,125 @@
+"""Parsing of NMEA 0183 position and speed sentences.
+
+Only what the alerter needs: GGA and RMC positions and RMC/VTG speed over
+ground, from any talker (GP, GN, GL, ...). Sentences with a missing or bad
+checksum, or without a valid fix, are ignored.
+
+format_gga() and format_rmc() produce the same sentences, for re-emitting a
+position to chartplotters.
+"""
+
+from collections import namedtuple
+
+KNOTS_TO_MPS = 1852.0 / 3600.0
+# Sentence types that are parsed; others are skipped before the checksum
+SENTENCE_TYPES = frozenset(('GGA', 'RMC', 'VTG'))
+
+# One parsed sentence. utc is the hhmmss.ss time field as text (None for VTG),
+# lat/lon are decimal degrees (None if the sentence has no position) and
+# sog is in m/s (None if not given).
+NmeaFix = namedtuple('NmeaFix', 'utc lat lon sog')
+
+
+def checksum(body):
+    """XOR of the characters between '$' and '*'."""
+    c = 0
+    for b in body.encode('ascii', errors='replace'):
+        c ^= b
+    return c
+
+
+def _body(sentence):
+    """Returns the stripped sentence without '$' and checksum, or None if the checksum is missing or wrong."""
+    if not sentence.startswith('$'):
+        return None
+    star = sentence.rfind('*')
+    if star < 0:
+        return None
+    try:
+        expected = int(sentence[star + 1:star + 3], 16)
+    except ValueError:
+        return None
+    body = sentence[1:star]
+    return body if checksum(body) == expected else None
+
+
+def _coord(value, hemisphere, degree_digits):
+    """Converts a ddmm.mmmm / dddmm.mmmm field to signed decimal degrees."""
+    if not value or not hemisphere:
+        return None
+    try:
+        degrees = int(value[:degree_digits]) + float(value[degree_digits:]) / 60.0
+    except ValueError:
+        return None
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+
+def _knots(value):
+    try:
+        return float(value) * KNOTS_TO_MPS if value else None
+    except ValueError:
+        return None
+
+
+def parse_sentence(sentence):
+    """Returns an NmeaFix for a valid GGA, RMC or VTG sentence, otherwise None."""
+    sentence = sentence.strip()
+    # "$GPRMC,..." -> "RMC"
+    if sentence[3:6] not in SENTENCE_TYPES:
+        return None
+    body = _body(sentence)
+    if body is None:
+        return None
+    fields = body.split(',')
+    kind = fields[0][-3:]
+    if kind == 'GGA' and len(fields) > 6:
+        if fields[6] in ('', '0'):
+            return None  # No fix
+        lat, lon = _coord(fields[2], fields[3], 2), _coord(fields[4], fields[5], 3)
+        if lat is None or lon is None:
+            return None
+        return NmeaFix(fields[1], lat, lon, None)
+    if kind == 'RMC' and len(fields) > 7:
+        if fields[2] != 'A':
+            return None  # Void, no valid fix
+        lat, lon = _coord(fields[3], fields[4], 2), _coord(fields[5], fields[6], 3)
+        if lat is None or lon is None:
+            return None
+        return NmeaFix(fields[1], lat, lon, _knots(fields[7]))
+    if kind == 'VTG' and len(fields) > 5:
+        sog = _knots(fields[5])
+        return NmeaFix(None, None, None, sog) if sog is not None else None
+    return None
+
+
+def _format_coord(value, degree_digits):
+    """Formats signed decimal degrees as (ddmm.mmmm or dddmm.mmmm, hemisphere index 0/1)."""
+    v = abs(value)
+    degrees = int(v)
+    minutes = (v - degrees) * 60.0
+    if round(minutes, 4) >= 60.0:  # Don't print 60.0000 minutes
+        degrees += 1
+        minutes = 0.0
+    return f"{degrees:0{degree_digits}d}{minutes:07.4f}", 1 if value < 0 else 0
+
+
+def sentence(body):
+    """Adds the '$', checksum and line end to a sentence body."""
+    return f"${body}*{checksum(body):02X}\r\n"
+
+
+def format_gga(lat, lon, when, talker="GP"):
+    """GGA sentence for a position at UTC datetime `when`."""
+    lat_text, s = _format_coord(lat, 2)
+    lon_text, w = _format_coord(lon, 3)
+    return sentence(f"{talker}GGA,{when:%H%M%S}.{when.microsecond // 10000:02d},"
+                    f"{lat_text},{'NS'[s]},{lon_text},{'EW'[w]},1,,,,M,,M,,")
+
+
+def format_rmc(lat, lon, when, sog=None, talker="GP"):
+    """RMC sentence for a position at UTC datetime `when`; sog in m/s, if known."""
+    lat_text, s = _format_coord(lat, 2)
+    lon_text, w = _format_coord(lon, 3)
+    sog_text = f"{sog / KNOTS_TO_MPS:.1f}" if sog is not None else ""
+    return sentence(f"{talker}RMC,{when:%H%M%S}.{when.microsecond // 10000:02d},A,"
+                    f"{lat_text},{'NS'[s]},{lon_text},{'EW'[w]},{sog_text},,{when:%d%m%y},,,A")
@@ -0,0 +1,135 @@
+"""NMEA 0183 output of a position to chartplotters over UDP broadcast and TCP.
+
+Each published position is encoded once, as GGA and RMC sentences, and the
+same bytes are sent to every destination. Sending never waits: UDP datagrams
+that can't be sent right away are dropped, and each TCP client has its own
+transport buffer. A client whose buffer is over CLIENT_BUFFER_LIMIT skips
+positions until it catches up, and is disconnected after CLIENT_STALL_S, so
+a slow or stuck plotter can't hold up the event loop or the other clients.
+"""
+
+import asyncio
+import logging
+import socket
+from datetime import timezone
+
+from nmea0183 import format_gga, format_rmc
+
+# Largest amount of unsent data per TCP client before positions are skipped
+CLIENT_BUFFER_LIMIT = 16 * 1024
+# Disconnect a TCP client that has been over the limit for this long
+CLIENT_STALL_S = 30.0
+NMEA_OUT_TALKER = "GP"
+
+
+class _Client:
+    __slots__ = ('writer', 'peer', 'stalled_since')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.stalled_since = None
+
+
+class NmeaServer:
+    """Sends positions as NMEA 0183 to a UDP address and to TCP clients.
+
+    `udp_target` is a (host, port) pair, e.g. a broadcast address, and
+    `tcp_address` the (host, port) to listen on; either may be None.
+    """
+
+    def __init__(self, clock, udp_target=None, tcp_address=None, talker=NMEA_OUT_TALKER):
+        self.clock = clock
+        self.udp_target = udp_target
+        self.tcp_address = tcp_address
+        self.talker = talker
+        self.logger = logging.getLogger(__name__)
+        self._udp = None
+        self._tcp_server = None
+        self._clients = set()
+        self._client_tasks = set()
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    async def start(self):
+        if self.udp_target is not None:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self._udp.setblocking(False)
+            self.logger.info(f"Sending NMEA 0183 to udp://{self.udp_target[0]}:{self.udp_target[1]}")
+        if self.tcp_address is not None:
+            self._tcp_server = await asyncio.start_server(self._serve_client, *self.tcp_address)
+            host, port = self._tcp_server.sockets[0].getsockname()[:2]
+            self.tcp_address = (host, port)
+            self.logger.info(f"Serving NMEA 0183 on tcp://{host}:{port}")
+
+    async def _serve_client(self, reader, writer):
+        client = _Client(writer)
+        self._clients.add(client)
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        self.logger.info(f"NMEA client {client.peer} connected.")
+        try:
+            # Plotters don't send anything that matters; just wait for the disconnect
+            while await reader.read(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            self._drop_client(client)
+            self._client_tasks.discard(task)
+
+    def _drop_client(self, client):
+        if client in self._clients:
+            self._clients.discard(client)
+            client.writer.close()
+            self.logger.info(f"NMEA client {client.peer} disconnected.")
+
+    def publish(self, lat, lon, when, sog=None):
+        """Sends one position. `when` is a datetime, naive values are taken as local time."""
+        if self._udp is None and not self._clients:
+            return
+        when = when.astimezone(timezone.utc)
+        data = (format_gga(lat, lon, when, self.talker)
+                + format_rmc(lat, lon, when, sog, self.talker)).encode('ascii')
+
+        if self._udp is not None:
+            try:
+                self._udp.sendto(data, self.udp_target)
+                self.sent += 1
+            except OSError:
+                self.dropped += 1  # Includes a full socket buffer; the next position follows soon
+
+        now = self.clock.monotonic()
+        for client in list(self._clients):
+            transport = client.writer.transport
+            if transport.is_closing():
+                self._drop_client(client)
+                continue
+            if transport.get_write_buffer_size() > CLIENT_BUFFER_LIMIT:
+                self.dropped += 1
+                if client.stalled_since is None:
+                    client.stalled_since = now
+                elif now - client.stalled_since >= CLIENT_STALL_S:
+                    self.logger.warning(f"NMEA client {client.peer} is not reading, disconnecting.")
+                    transport.abort()
+                    self._drop_client(client)
+                continue
+            client.stalled_since = None
+            transport.write(data)
+            self.sent += 1
+
+    async def close(self):
+        for client in list(self._clients):
+            self._drop_client(client)
+        # Closing the connections ends the client tasks
+        await asyncio.gather(*self._client_tasks, return_exceptions=True)
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+        if self._udp is not None:
+            self._udp.close()
@@ -0,0 +1,261 @@
+"""Position source adapters that feed GpsAlerter without going through Signal K.
+
+An adapter polls or listens to a device and calls on_fix(PositionFix) for each
+position. GpsAlerter.add_source() routes the fixes of an adapter to one of its
+update paths (see ROUTE_TARGETS in diff_starlink_gps.py), exactly as if they
+had arrived as Signal K deltas.
+
+StarlinkDishSource reads the location straight from the Starlink dish's local
+gRPC API, skipping the signalk-starlink plugin's polling and Signal K itself.
+It needs the optional grpcio and yagrc packages, and "allow access on local
+network" enabled for location in the Starlink app. starlink_dish_standin.py
+serves the same API locally, for tests and trying it out without a dish.
+
+NmeaSource reads GPS positions and SOG from an NMEA 0183 feed over UDP or TCP,
+such as the one a datahub sends to OpenCPN.
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import random
+import socket
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from nmea0183 import parse_sentence
+
+# A position from an adapter. time is the wall-clock time of the fix,
+# accuracy_m its reported 1-sigma accuracy and sog the speed over ground in
+# m/s; both may be None if the device doesn't report them. lat and lon are
+# None for a speed-only update.
+PositionFix = namedtuple('PositionFix', 'lat lon time accuracy_m sog', defaults=(None, None))
+
+# Local gRPC endpoint of the Starlink dish
+STARLINK_DISH_TARGET = "192.168.100.1:9200"
+STARLINK_DISH_POLL_S = 1.0
+STARLINK_DISH_TIMEOUT_S = 2.0
+DISH_SERVICE = "SpaceX.API.Device.Device"
+DISH_REQUEST = "SpaceX.API.Device.Request"
+# Default NMEA 0183 port
+NMEA_PORT = 10110
+# TCP reconnect backoff, as for the Signal K websocket: a random delay between
+# half and all of NMEA_RECONNECT_MIN_S doubled per failed attempt, up to
+# NMEA_RECONNECT_MAX_S. Only a connection that lasted NMEA_RECONNECT_STABLE_S
+# starts again from the minimum, so a server that accepts and drops at once
+# isn't hammered.
+NMEA_RECONNECT_MIN_S = 0.25
+NMEA_RECONNECT_MAX_S = 30.0
+NMEA_RECONNECT_STABLE_S = 10.0
+
+
+class PositionSource(ABC):
+    """Base class for position source adapters."""
+    # Name used in logs and metrics
+    name = "source"
+    # GpsAlerter route target that receives the fixes, e.g. "starlink_position"
+    target = None
+
+    @abstractmethod
+    async def run(self, on_fix):
+        """Calls on_fix(PositionFix) for every new position until cancelled."""
+
+    def close(self):
+        pass
+
+
+class DishLocationClient:
+    """Fetches the dish location over one persistent gRPC channel.
+
+    The dish's protocol definitions are loaded from the dish itself with gRPC
+    server reflection (yagrc), so no generated code is needed. Any server that
+    offers the same service with reflection, e.g. a local stand-in, works too.
+    """
+
+    def __init__(self, target=STARLINK_DISH_TARGET, timeout_s=STARLINK_DISH_TIMEOUT_S):
+        # Imported here so the packages are only needed when the dish is used
+        try:
+            import grpc
+            from yagrc import reflector
+        except ImportError as e:
+            raise ImportError(f"Reading the Starlink dish needs the optional grpcio and yagrc packages "
+                              f"({e.name} is missing). Install them with: python -m pip install grpcio yagrc",
+                              name=e.name) from e
+        self.target = target
+        self.timeout_s = timeout_s
+        self._channel = grpc.insecure_channel(target)
+        self._reflector = reflector.GrpcReflectionClient()
+        self._stub = None
+        self._request = None
+
+    def _resolve(self):
+        self._reflector.load_protocols(self._channel, symbols=[DISH_SERVICE])
+        self._stub = self._reflector.service_stub_class(DISH_SERVICE)(self._channel)
+        self._request = self._reflector.message_class(DISH_REQUEST)(get_location={})
+
+    def __call__(self):
+        """Returns the current PositionFix, or None if the dish has no location."""
+        if self._stub is None:
+            self._resolve()
+        response = self._stub.Handle(self._request, timeout=self.timeout_s)
+        location = response.get_location
+        if not location.HasField("lla"):
+            return None
+        return PositionFix(location.lla.lat, location.lla.lon, datetime.now(),
+                           location.sigma_m or None, None)
+
+    def close(self):
+        self._channel.close()
+
+
+class StarlinkDishSource(PositionSource):
+    """Polls the Starlink dish location on a fixed interval.
+
+    `fetch` is a callable returning a PositionFix or None; it is called in a
+    worker thread. It defaults to a DishLocationClient for `target`, and can be
+    replaced for tests.
+    """
+    name = "starlink_dish"
+    target = "starlink_position"
+
+    def __init__(self, clock, target=STARLINK_DISH_TARGET, interval_s=STARLINK_DISH_POLL_S,
+                 timeout_s=STARLINK_DISH_TIMEOUT_S, fetch=None):
+        self.clock = clock
+        self.interval_s = interval_s
+        self.fetch = fetch or DishLocationClient(target, timeout_s)
+        self.errors = 0
+        self.logger = logging.getLogger(__name__)
+
+    async def run(self, on_fix):
+        failing = False
+        next_poll = self.clock.monotonic()
+        while True:
+            try:
+                fix = await asyncio.to_thread(self.fetch)
+            except Exception as e:
+                self.errors += 1
+                # Log the first failure only, not one per poll
+                if not failing:
+                    self.logger.warning(f"Starlink dish location request failed: {e}. "
+                                        f"Is location access on the local network enabled?")
+                    failing = True
+            else:
+                if failing:
+                    self.logger.info("Starlink dish location requests are working again.")
+                    failing = False
+                if fix is not None:
+                    on_fix(fix)
+            next_poll = max(next_poll + self.interval_s, self.clock.monotonic())
+            await self.clock.sleep(next_poll - self.clock.monotonic())
+
+    def close(self):
+        close = getattr(self.fetch, "close", None)
+        if close is not None:
+            close()
+
+
+class _NmeaDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, source):
+        self.source = source
+
+    def datagram_received(self, data, addr):
+        self.source.feed(data)
+
+
+class NmeaSource(PositionSource):
+    """Reads GGA/RMC/VTG sentences from an NMEA 0183 feed.
+
+    `url` is udp://[host]:port to listen for UDP datagrams (broadcast or
+    unicast), or tcp://host:port to connect to an NMEA TCP server. GGA and RMC
+    of the same epoch (same UTC time field) give one position, not two.
+    Positions are stamped with their arrival time.
+    """
+    target = "gps_position"
+
+    def __init__(self, clock, url):
+        self.clock = clock
+        self.url = url
+        parts = urlsplit(url)
+        if parts.scheme not in ("udp", "tcp"):
+            raise ValueError(f"NMEA source must be udp://host:port or tcp://host:port, not {url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname or ("0.0.0.0" if self.scheme == "udp" else None)
+        self.port = parts.port or NMEA_PORT
+        if self.host is None:
+            raise ValueError(f"NMEA TCP source needs a host: {url}")
+        self.name = f"nmea_{self.scheme}_{self.host}_{self.port}"
+        # Sentences received, and those that were not a valid GGA/RMC/VTG
+        self.sentences = 0
+        self.ignored = 0
+        self.logger = logging.getLogger(__name__)
+        self._on_fix = None
+        self._last_utc = None
+
+    def feed(self, data):
+        """Handles one or more sentences of raw input."""
+        for line in data.decode('ascii', errors='replace').split('\n'):
+            if not line.strip():
+                continue
+            self.sentences += 1
+            fix = parse_sentence(line)
+            if fix is None:
+                self.ignored += 1
+                continue
+            lat, lon = fix.lat, fix.lon
+            if lat is not None and fix.utc and fix.utc == self._last_utc:
+                lat = lon = None  # Already have this epoch's position
+            elif lat is not None:
+                self._last_utc = fix.utc
+            if lat is None and fix.sog is None:
+                continue
+            self._on_fix(PositionFix(lat, lon, self.clock.now(), None, fix.sog))
+
+    async def run(self, on_fix):
+        self._on_fix = on_fix
+        if self.scheme == "udp":
+            await self._run_udp()
+        else:
+            await self._run_tcp()
+
+    async def _run_udp(self):
+        loop = asyncio.get_running_loop()
+        # Share the port with e.g. OpenCPN listening on the same machine
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _NmeaDatagramProtocol(self), local_addr=(self.host, self.port),
+            reuse_port=hasattr(socket, 'SO_REUSEPORT'), allow_broadcast=True)
+        self.logger.info(f"Listening for NMEA 0183 on {self.url}")
+        try:
+            await asyncio.Future()
+        finally:
+            transport.close()
+
+    async def _run_tcp(self):
+        attempt = 0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                reason = f"Could not connect to NMEA source {self.url}: {e}."
+                # Only the first of a run of failed attempts is logged
+                log = attempt == 0
+            else:
+                connected_at = self.clock.monotonic()
+                self.logger.info(f"Connected to NMEA source {self.url}")
+                reason = f"NMEA source {self.url} disconnected."
+                try:
+                    while line := await reader.readline():
+                        self.feed(line)
+                except (OSError, ValueError) as e:
+                    reason = f"NMEA source {self.url} failed: {e}."
+                finally:
+                    writer.close()
+                if self.clock.monotonic() - connected_at >= NMEA_RECONNECT_STABLE_S:
+                    attempt = 0
+                log = True
+            delay = min(NMEA_RECONNECT_MAX_S, NMEA_RECONNECT_MIN_S * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            if log:
+                self.logger.warning(f"{reason} Reconnecting in {delay:.2f} seconds...")
+            await self.clock.sleep(delay)
@@ -0,0 +1,75 @@
+"""Recording and reading of raw Signal K websocket captures.
+
+A capture file is gzip-compressed text. The first line is a JSON header with
+the wall-clock start time. Every following line is a JSON array
+[seconds_since_start, raw_frame] for one websocket frame, in arrival order.
+"""
+
+import gzip
+import json
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+CAPTURE_FORMAT = "signalk-capture/1"
+# Flush the compressed stream this often so a crash loses little data
+CAPTURE_FLUSH_INTERVAL_S = 5.0
+
+
+class CaptureRecorder:
+    """Appends timestamped raw websocket frames to a compressed capture file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._t0 = time.monotonic()
+        self._last_flush = self._t0
+        header = {"format": CAPTURE_FORMAT, "start": datetime.now().isoformat()}
+        self._file.write(json.dumps(header) + '\n')
+
+    def record(self, frame):
+        """Writes one frame, stamped with the time since recording started."""
+        now = time.monotonic()
+        self.record_at(now - self._t0, frame)
+        if now - self._last_flush >= CAPTURE_FLUSH_INTERVAL_S:
+            self._file.flush()
+            self._last_flush = now
+
+    def record_at(self, t, frame):
+        """Writes one frame stamped with t seconds since the start of the capture."""
+        if isinstance(frame, bytes):
+            frame = frame.decode('utf-8', errors='replace')
+        self._file.write(json.dumps([round(t, 4), frame], separators=(',', ':')) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class CaptureReader:
+    """Iterates over the (seconds_since_start, frame) pairs of a capture file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+        if header.get("format") != CAPTURE_FORMAT:
+            raise ValueError(f"{self.path} is not a Signal K capture file")
+        self.start = datetime.fromisoformat(header["start"])
+
+    def __iter__(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            f.readline()  # Skip the header
+            while True:
+                # A capture cut short by a crash ends in a truncated gzip
+                # stream, and can end in a partial line
+                try:
+                    line = f.readline()
+                except (EOFError, zlib.error):
+                    return
+                try:
+                    t, frame = json.loads(line)
+                except ValueError:
+                    return
+                yield t, frame
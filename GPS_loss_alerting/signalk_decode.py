@@ -0,0 +1,178 @@
+"""Pre-filtered decoding of Signal K websocket frames into typed delta records.
+
+A busy Signal K server sends many frames the alerter has no use for: the
+hello message, and updates for paths it didn't ask for or that another
+client's subscription brought along. Those are rejected with a substring
+search on the raw frame, before any JSON parsing. Frames that mention a
+routed path are parsed (with orjson when it is installed, otherwise the
+standard json module) and only the routed values are turned into Delta
+records. Position values become Position records and SOG values floats, so
+the handlers don't have to re-check the shape of the data.
+
+decode_snapshot() does the same for the navigation branch of the Signal K
+REST API, which is used to restore state after (re)connecting.
+"""
+
+import json
+from datetime import datetime, timezone
+
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+POSITION_PATH = "navigation.position"
+SOG_PATH = "navigation.speedOverGround"
+
+
+class FrameDecodeError(ValueError):
+    """A websocket frame that is not valid JSON."""
+
+
+class Position:
+    """A Signal K navigation.position value."""
+    __slots__ = ('latitude', 'longitude')
+
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __repr__(self):
+        return f"Position({self.latitude}, {self.longitude})"
+
+
+class Delta:
+    """One routed value from a Signal K update."""
+    __slots__ = ('sk_source', 'source_type', 'path', 'value')
+
+    def __init__(self, sk_source, source_type, path, value):
+        self.sk_source = sk_source
+        self.source_type = source_type
+        self.path = path
+        self.value = value
+
+
+def _position(value):
+    try:
+        lat, lon = value["latitude"], value["longitude"]
+    except (TypeError, KeyError):
+        return None
+    if lat is None or lon is None:
+        return None
+    return Position(lat, lon)
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+# Converters from the JSON value of a path to its typed value; None drops the value
+VALUE_TYPES = {
+    POSITION_PATH: _position,
+    SOG_PATH: _number,
+}
+
+
+class SignalKDecoder:
+    """Decodes the frames that carry any of `paths` into lists of Delta records."""
+
+    def __init__(self, paths=()):
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        self.paths = frozenset(paths)
+        # The quoted path, as it appears in a frame as text or bytes
+        self._needles = tuple(f'"{p}"' for p in sorted(self.paths))
+        self._byte_needles = tuple(n.encode('utf-8') for n in self._needles)
+
+    def relevant(self, frame):
+        """Cheap check on the raw frame: False if it can't contain a routed value."""
+        needles = self._byte_needles if isinstance(frame, (bytes, bytearray)) else self._needles
+        for needle in needles:
+            if needle in frame:
+                return True
+        return False
+
+    def decode(self, frame):
+        """Returns the routed values of a frame as Delta records.
+
+        Returns None if the frame was rejected by the pre-filter. Raises
+        FrameDecodeError if the frame is not valid JSON.
+        """
+        if not self.relevant(frame):
+            return None
+        try:
+            data = _loads(frame)
+        except ValueError as e:  # json and orjson decode errors are ValueErrors
+            raise FrameDecodeError(str(e)) from None
+        updates = data.get("updates") if isinstance(data, dict) else None
+        if not updates:
+            return []
+        return self.decode_updates(updates)
+
+    def decode_updates(self, updates):
+        """Returns the routed values of a list of parsed Signal K updates as Delta records."""
+        paths = self.paths
+        deltas = []
+        for update in updates:
+            source = update.get("source")
+            source_type = source.get("type") if isinstance(source, dict) else None
+            sk_source = update.get("$source")
+            for entry in update.get("values", ()):
+                path = entry.get("path")
+                if path not in paths:
+                    continue
+                value = entry.get("value")
+                convert = VALUE_TYPES.get(path)
+                if convert is not None:
+                    value = convert(value)
+                    if value is None:
+                        continue
+                deltas.append(Delta(sk_source, source_type, path, value))
+        return deltas
+
+    def decode_snapshot(self, navigation, max_age_s=None):
+        """Returns the routed values of a REST navigation snapshot as Delta records.
+
+        `navigation` is the parsed JSON of /signalk/v1/api/vessels/self/navigation.
+        Every source of a path is returned. Values older than max_age_s seconds
+        are skipped. The REST API doesn't give the source type, so it is
+        inferred: values with a "pgn" are NMEA2000, with a "sentence" NMEA0183.
+        """
+        now = datetime.now(timezone.utc)
+        updates = []
+        for path in self.paths:
+            parts = path.split('.')
+            if parts[0] != "navigation":
+                continue
+            leaf = navigation
+            for part in parts[1:]:
+                leaf = leaf.get(part) if isinstance(leaf, dict) else None
+            if not isinstance(leaf, dict):
+                continue
+            by_source = leaf.get("values") or {leaf.get("$source"): leaf}
+            for sk_source, entry in by_source.items():
+                if not isinstance(entry, dict) or "value" not in entry:
+                    continue
+                if max_age_s is not None and _age_s(entry.get("timestamp"), now) > max_age_s:
+                    continue
+                source_type = "NMEA2000" if "pgn" in entry else "NMEA0183" if "sentence" in entry else None
+                updates.append({"$source": sk_source, "source": {"type": source_type},
+                                "values": [{"path": path, "value": entry["value"]}]})
+        return self.decode_updates(updates)
+
+
+def _age_s(timestamp, now):
+    """Age in seconds of a Signal K ISO 8601 timestamp; infinite if missing or invalid."""
+    try:
+        t = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return float('inf')
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return (now - t).total_seconds()
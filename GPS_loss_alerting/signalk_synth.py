@@ -0,0 +1,132 @@
+"""Synthetic Signal K delta generator.
+
+Produces realistic websocket frames for a boat under way: NMEA2000 GPS
+position and SOG, signalk-starlink positions, and "noise" paths that the
+alerter doesn't subscribe to, at configurable rates. The frames can be used
+directly by the benchmarks, or written to a capture file for --replay.
+
+    python signalk_synth.py passage.capture.gz --duration 3600 --spoof-after 1800
+"""
+
+import argparse
+import json
+import math
+import random
+from datetime import datetime, timezone
+
+from signalk_capture import CaptureRecorder
+
+# Paths that a busy Signal K server sends but the alerter ignores
+NOISE_PATHS = (
+    ("environment.wind.speedApparent", lambda r: round(r.uniform(2, 12), 2)),
+    ("environment.wind.angleApparent", lambda r: round(r.uniform(-math.pi, math.pi), 4)),
+    ("environment.depth.belowTransducer", lambda r: round(r.uniform(5, 80), 2)),
+    ("navigation.headingMagnetic", lambda r: round(r.uniform(0, 2 * math.pi), 4)),
+    ("electrical.batteries.house.voltage", lambda r: round(r.uniform(12.2, 13.8), 2)),
+    ("propulsion.main.revolutions", lambda r: round(r.uniform(0, 40), 1)),
+)
+NM_PER_DEG_LAT = 60.0
+
+
+class DeltaGenerator:
+    """Generates (seconds, frame) pairs for a boat sailing a straight course."""
+
+    def __init__(self, gps_hz=14.0, starlink_hz=1.0, noise_hz=20.0, combined_sog=True,
+                 lat=4.12, lon=73.46, sog_kn=6.0, course_deg=45.0,
+                 starlink_noise_nm=0.003, spoof_after_s=None, spoof_rate_nm_per_min=0.1, seed=1):
+        self.gps_hz = gps_hz
+        self.starlink_hz = starlink_hz
+        self.noise_hz = noise_hz
+        # Send SOG in the same delta as the GPS position, as many gateways do
+        self.combined_sog = combined_sog
+        self.lat = lat
+        self.lon = lon
+        self.sog_kn = sog_kn
+        self.course = math.radians(course_deg)
+        self.starlink_noise_nm = starlink_noise_nm
+        # Optionally make the GPS position drift away from the truth
+        self.spoof_after_s = spoof_after_s
+        self.spoof_rate_nm_per_min = spoof_rate_nm_per_min
+        self.random = random.Random(seed)
+
+    def position_at(self, t):
+        """True position after t seconds."""
+        dist_nm = self.sog_kn * t / 3600.0
+        lat = self.lat + dist_nm * math.cos(self.course) / NM_PER_DEG_LAT
+        lon = self.lon + dist_nm * math.sin(self.course) / (NM_PER_DEG_LAT * math.cos(math.radians(self.lat)))
+        return lat, lon
+
+    def _timestamp(self, t):
+        return datetime.fromtimestamp(1767225600 + t, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+    def gps_frame(self, t):
+        lat, lon = self.position_at(t)
+        if self.spoof_after_s is not None and t > self.spoof_after_s:
+            lat += (t - self.spoof_after_s) / 60.0 * self.spoof_rate_nm_per_min / NM_PER_DEG_LAT
+        values = [{"path": "navigation.position", "value": {"longitude": lon, "latitude": lat}}]
+        if self.combined_sog:
+            values.append({"path": "navigation.speedOverGround", "value": round(self.sog_kn * 0.514444, 3)})
+        return self._delta("can0.3", {"label": "can0", "type": "NMEA2000", "pgn": 129025, "src": "3"}, t, values)
+
+    def starlink_frame(self, t):
+        lat, lon = self.position_at(t)
+        n = self.starlink_noise_nm / NM_PER_DEG_LAT
+        values = [{"path": "navigation.position",
+                   "value": {"longitude": lon + self.random.gauss(0, n), "latitude": lat + self.random.gauss(0, n)}}]
+        return self._delta("signalk-starlink", {"label": "signalk-starlink"}, t, values)
+
+    def noise_frame(self, t):
+        path, value = self.random.choice(NOISE_PATHS)
+        return self._delta("can0.12", {"label": "can0", "type": "NMEA2000", "pgn": 130306, "src": "12"},
+                           t, [{"path": path, "value": value(self.random)}])
+
+    def _delta(self, sk_source, source, t, values):
+        return json.dumps({
+            "context": "vessels.urn:mrn:imo:mmsi:123456789",
+            "updates": [{"source": source, "$source": sk_source,
+                         "timestamp": self._timestamp(t), "values": values}],
+        })
+
+    def frames(self, duration_s):
+        """Yields (seconds, frame) pairs in time order for duration_s seconds."""
+        streams = [(rate, make) for rate, make in ((self.gps_hz, self.gps_frame),
+                                                   (self.starlink_hz, self.starlink_frame),
+                                                   (self.noise_hz, self.noise_frame)) if rate > 0]
+        next_t = [0.0] * len(streams)
+        while True:
+            k = min(range(len(streams)), key=next_t.__getitem__)
+            t = next_t[k]
+            if t >= duration_s:
+                return
+            rate, make = streams[k]
+            yield t, make(t)
+            next_t[k] = t + 1.0 / rate
+
+
+def write_capture(path, generator, duration_s):
+    """Writes generated frames to a capture file usable with --replay."""
+    recorder = CaptureRecorder(path)
+    try:
+        for t, frame in generator.frames(duration_s):
+            recorder.record_at(t, frame)
+    finally:
+        recorder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Signal K capture file.")
+    parser.add_argument("capture", help="Capture file to write.")
+    parser.add_argument("--duration", type=float, default=3600, help="Seconds of data (default: 3600).")
+    parser.add_argument("--gps-hz", type=float, default=14.0)
+    parser.add_argument("--starlink-hz", type=float, default=1.0)
+    parser.add_argument("--noise-hz", type=float, default=20.0)
+    parser.add_argument("--spoof-after", type=float, default=None,
+                        help="Start drifting the GPS position after this many seconds.")
+    args = parser.parse_args()
+    generator = DeltaGenerator(gps_hz=args.gps_hz, starlink_hz=args.starlink_hz,
+                               noise_hz=args.noise_hz, spoof_after_s=args.spoof_after)
+    write_capture(args.capture, generator, args.duration)
+
+
+if __name__ == "__main__":
+    main()
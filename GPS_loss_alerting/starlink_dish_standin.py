@@ -0,0 +1,126 @@
+"""A local stand-in for the Starlink dish's location API.
+
+Serves SpaceX.API.Device.Device/Handle with gRPC server reflection, like the
+dish, and answers get_location requests with a settable position. It is used
+by test_position_sources.py, and lets you try --starlink-dish without a dish:
+
+    python starlink_dish_standin.py --port 9200 --lat 4.12 --lon 73.46
+    python diff_starlink_gps.py --starlink-dish 127.0.0.1:9200
+
+Only the messages and fields that DishLocationClient uses are defined; they
+are built at run time, so no generated protobuf code is needed. Needs the
+grpcio, grpcio-reflection and protobuf packages.
+"""
+
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from grpc_reflection.v1alpha import reflection
+
+from position_sources import DISH_SERVICE, DISH_REQUEST
+
+_PACKAGE = DISH_SERVICE.rpartition('.')[0]
+_DOUBLE = descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE
+_MESSAGE = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+# Field number of get_location in the dish's Request and Response messages
+_GET_LOCATION = 1017
+
+
+def _dish_pool():
+    """Returns a descriptor pool with the dish service and the location messages."""
+    f = descriptor_pb2.FileDescriptorProto(name="spacex/api/device/device_standin.proto", package=_PACKAGE,
+                                           syntax="proto3")
+
+    def message(name, *fields):
+        m = f.message_type.add(name=name)
+        for number, (field, kind, type_name) in enumerate(fields, 1):
+            m.field.add(name=field, number=_GET_LOCATION if field == "get_location" else number,
+                        type=kind, type_name=type_name and f".{_PACKAGE}.{type_name}",
+                        label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+
+    message("LLAPosition", ("lat", _DOUBLE, None), ("lon", _DOUBLE, None), ("alt", _DOUBLE, None))
+    message("GetLocationRequest")
+    message("GetLocationResponse", ("lla", _MESSAGE, "LLAPosition"), ("sigma_m", _DOUBLE, None))
+    message("Request", ("get_location", _MESSAGE, "GetLocationRequest"))
+    message("Response", ("get_location", _MESSAGE, "GetLocationResponse"))
+    service = f.service.add(name=DISH_SERVICE.rpartition('.')[2])
+    service.method.add(name="Handle", input_type=f".{DISH_REQUEST}", output_type=f".{_PACKAGE}.Response")
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(f)
+    return pool
+
+
+class DishStandIn:
+    """Serves the dish location API on 127.0.0.1:port (0 picks a free port).
+
+    set_location(None) makes it answer without a position, like a dish
+    that has no fix, and `requests` counts the requests answered.
+    """
+
+    def __init__(self, port=0, lat=4.12, lon=73.46, sigma_m=4.5, host="127.0.0.1"):
+        self.pool = _dish_pool()
+        self._request = message_factory.GetMessageClass(self.pool.FindMessageTypeByName(DISH_REQUEST))
+        self._response = message_factory.GetMessageClass(self.pool.FindMessageTypeByName(f"{_PACKAGE}.Response"))
+        self._lock = threading.Lock()
+        self._location = None
+        self.set_location(lat, lon, sigma_m)
+        self.requests = 0
+
+        handler = grpc.method_handlers_generic_handler(DISH_SERVICE, {
+            "Handle": grpc.unary_unary_rpc_method_handler(
+                self._handle, request_deserializer=self._request.FromString,
+                response_serializer=self._response.SerializeToString),
+        })
+        self._server = grpc.server(ThreadPoolExecutor(max_workers=4))
+        self._server.add_generic_rpc_handlers((handler,))
+        reflection.enable_server_reflection((DISH_SERVICE, reflection.SERVICE_NAME), self._server, self.pool)
+        self.port = self._server.add_insecure_port(f"{host}:{port}")
+        self.target = f"{host}:{self.port}"
+
+    def set_location(self, lat, lon=None, sigma_m=4.5):
+        with self._lock:
+            self._location = None if lat is None else (lat, lon, sigma_m)
+
+    def _handle(self, request, context):
+        with self._lock:
+            self.requests += 1
+            location = self._location
+        response = self._response()
+        response.get_location.SetInParent()
+        if location is not None:
+            lat, lon, sigma_m = location
+            response.get_location.lla.lat = lat
+            response.get_location.lla.lon = lon
+            response.get_location.sigma_m = sigma_m
+        return response
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def wait(self):
+        self._server.wait_for_termination()
+
+    def close(self):
+        self._server.stop(grace=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fixed position like the Starlink dish's location API.")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--lat", type=float, default=4.12)
+    parser.add_argument("--lon", type=float, default=73.46)
+    args = parser.parse_args()
+    dish = DishStandIn(args.port, args.lat, args.lon).start()
+    print(f"Serving the dish location API on {dish.target}")
+    try:
+        dish.wait()
+    except KeyboardInterrupt:
+        dish.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,153 @@
-from redmail import gmail
 import alerting_secrets
 import os
 import time
-import requests
+from alert_channel import (AlertFileReader, AlertListener, ALERTS_FILENAME,
+                           ACK_FILENAME, NOTIFY_SOCKET_FILENAME)
+from alert_dispatcher import (AlertDispatcher, GmailChannel, TelegramChannel, make_http_session,
+                              CHANNEL_TIMEOUT_S, TELEGRAM_API_URL, GMAIL_RATE_LIMIT,
+                              TELEGRAM_RATE_LIMIT)
+from alert_coalescer import AlertCoalescer, COALESCE_WINDOW_S
+from checkpoint import save_checkpoint, load_checkpoint
 
-# If you don't want to send to both gmail and telegram, you can modify this function
-# to only call one of the two alerting functions.
-def send_alert(message):
+# Build the list of alert channels from alerting_secrets.py. To drop gmail or
+# telegram, set gmail_alert_enabled or telegram_alert_enabled to False there.
+def build_channels():
+    timeout = getattr(alerting_secrets, 'alert_timeout_s', CHANNEL_TIMEOUT_S)
+    channels = []
     if (alerting_secrets.gmail_alert_enabled):
-        send_gmail_alert(message)
+        channels.append(GmailChannel(
+            alerting_secrets.username, alerting_secrets.password,
+            alerting_secrets.receivers, alerting_secrets.subject,
+            host=getattr(alerting_secrets, 'smtp_host', "smtp.gmail.com"),
+            port=getattr(alerting_secrets, 'smtp_port', 587),
+            use_starttls=getattr(alerting_secrets, 'smtp_starttls', True),
+            timeout=timeout,
+            rate_limit=getattr(alerting_secrets, 'gmail_rate_limit', GMAIL_RATE_LIMIT)))
     if (alerting_secrets.telegram_alert_enabled):
-        send_telegram_alert(message)
+        # One pooled session so every bot reuses keep-alive connections to the API
+        bots = alerting_secrets.bots_credentials
+        session = make_http_session(len(bots))
+        api_url = getattr(alerting_secrets, 'telegram_api_url', TELEGRAM_API_URL)
+        rate_limit = getattr(alerting_secrets, 'telegram_rate_limit', TELEGRAM_RATE_LIMIT)
+        for bot in bots:
+            token = bot.get("BOT_TOKEN")
+            chat = bot.get("CHAT_ID")
+            if token and chat:
+                channels.append(TelegramChannel(session, token, chat, api_url=api_url, timeout=timeout,
+                                                rate_limit=rate_limit))
+            else:
+                print("Skipping bot with incomplete credentials:", bot)
+    return channels
+
+# Created in main(), so importing this file (as gps_loss_alerting.py does)
+# doesn't set up any channels
+dispatcher = None
 
-# Send email alert
-def send_gmail_alert(message):
-    gmail.username = alerting_secrets.username
-    gmail.password = alerting_secrets.password
-    receivers = alerting_secrets.receivers
-    subject = alerting_secrets.subject
+# Send a message to all configured channels at once. Raises AlertDeliveryError
+# if no channel could deliver it.
+def send_alert(message):
+    return dispatcher.send(message)
 
-    gmail.send(
-        subject=subject,
-        receivers=receivers,
-        text=message
-    )
+# Expand environment variables for file paths
+log_dir = os.path.expandvars('$HOME/logs')
+alerts_file = os.path.join(log_dir, ALERTS_FILENAME)
+alerts_ack_file = os.path.join(log_dir, ACK_FILENAME)
+alerts_socket = os.path.join(log_dir, NOTIFY_SOCKET_FILENAME)
+# Every message sent, and the rate limit state restored on restart. How far
+# alerts have been delivered is kept in the ack file.
+SENT_ALERTS_FILENAME = 'starlink_gps_sent_alerts.txt'
+STATE_FILENAME = 'starlink_gps_alert.state.json'
 
-# Send Telegram alert
-def send_telegram_alert(message):
-    # send message to all configured bots
-    for bot in alerting_secrets.bots_credentials:
-        token = bot.get("BOT_TOKEN")
-        chat = bot.get("CHAT_ID")
-        if token and chat:
-            send_telegram_message(token, chat, message)
-        else:
-            print("Skipping bot with incomplete credentials:", bot)
+# diff_starlink_gps.py wakes us up when it writes an alert. Check the file
+# this often anyway, in case a wake-up was missed. Without Unix sockets
+# (Windows) we fall back to polling every second.
+SAFETY_POLL_S = 30
+FALLBACK_POLL_S = 1
+# Wait this long before retrying a channel after a failed send
+RETRY_DELAY_S = 30
+# Save the state at most this often while idle
+CHECKPOINT_INTERVAL_S = 30
+# A restart within this long of the last saved state is a warm restart (e.g.
+# by systemd after a crash): no startup message, and the rate limits carry on.
+WARM_RESTART_S = 600
 
-def send_telegram_message(bot_token, chat_id, message):
-    """Sends a message to a specified Telegram chat."""
-    api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    
+# Create the coalescer, which merges bursts of alerts and keeps each channel
+# within its rate limit. After a warm restart its saved state is restored,
+# otherwise a startup message is sent. Messages sent are appended to the sent
+# alerts log in log_dir.
+def start_coalescer(dispatcher, log_dir):
+    sent_alerts_log = os.path.join(log_dir, SENT_ALERTS_FILENAME)
+
+    def log_sent_alert(channel_name, message):
+        with open(sent_alerts_log, 'a') as f:
+            f.write(f"[{channel_name}] {message}\n")
+
+    window_s = getattr(alerting_secrets, 'alert_coalesce_window_s', COALESCE_WINDOW_S)
+    coalescer = AlertCoalescer(dispatcher, window_s=window_s, retry_s=RETRY_DELAY_S,
+                               on_sent=log_sent_alert)
+    state, age = load_checkpoint(os.path.join(log_dir, STATE_FILENAME), WARM_RESTART_S)
+    if state is not None:
+        try:
+            coalescer.restore(state["channels"], age)
+            print(f"Warm restart: restored state saved {age:.1f} s ago")
+            return coalescer
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Ignoring saved state: {e}")
     try:
-        response = requests.post(api_url, json={'chat_id': chat_id, 'text': message})
-        response.raise_for_status()  # Raise an exception for bad status codes
-        print("Message sent successfully!")
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
+        dispatcher.send('Starlink GPS alert: started alerting service')
+    except Exception as e:
+        print(f"Could not send startup message: {e}")
+    return coalescer
 
-# Expand environment variables for file paths
-alerts_file = os.path.expandvars('$HOME/logs/starlink_gps_alerts.txt')
-sent_alerts_log = os.path.expandvars('$HOME/logs/starlink_gps_sent_alerts.txt')
+def save_state(coalescer, log_dir):
+    write_state(coalescer.state(), log_dir)
+
+# Write the coalescer state taken with coalescer.state(). This syncs the file
+# to disk, so gps_loss_alerting.py runs it in a thread.
+def write_state(channels, log_dir):
+    state_file = os.path.join(log_dir, STATE_FILENAME)
+    try:
+        save_checkpoint(state_file, {"channels": channels})
+    except Exception as e:
+        print(f"Could not save state to {state_file}: {e}")
 
 def main():
+    global dispatcher
     print("starting starlink_gps_alert")
-    send_alert('Starlink GPS alert: started alerting service')
-
+    dispatcher = AlertDispatcher(build_channels())
+    coalescer = start_coalescer(dispatcher, log_dir)
+    reader = AlertFileReader(alerts_file, alerts_ack_file)
+    listener = AlertListener(alerts_socket)
+    saved_at = time.monotonic()
+    poll_s = SAFETY_POLL_S if listener.push_enabled else FALLBACK_POLL_S
     try:
         while True:
-            # Check if the alerts file exists and has content
-            if os.path.exists(alerts_file) and os.path.getsize(alerts_file) > 0:
-                # Read the file contents
-                with open(alerts_file, 'r') as f:
-                    message = f.read()
-                
-                # Send the alert
-                send_alert(message)
-                
-                # Append the message to the sent alerts log
-                with open(sent_alerts_log, 'a') as f:
-                    f.write(message + '\n')
-                
-                # Truncate the alerts file to zero length
-                with open(alerts_file, 'w') as f:
-                    f.write('')
-            
-            # Poll once each minute
-            time.sleep(60)
+            message, token = reader.read_pending()
+            if message:
+                coalescer.add(message, token)
+                continue
+
+            # Send to the channels that are due. Alerts are only marked as
+            # delivered once every channel has sent them.
+            sent = coalescer.sent
+            reader.ack(*coalescer.flush())
+            if coalescer.sent != sent or time.monotonic() - saved_at >= CHECKPOINT_INTERVAL_S:
+                save_state(coalescer, log_dir)
+                saved_at = time.monotonic()
+
+            # Tidy up delivered alerts, then wait for the next alert or send
+            reader.compact()
+            due = coalescer.next_due()
+            timeout = poll_s if due is None else min(poll_s, max(due - time.monotonic(), 0.1))
+            listener.wait(timeout)
 
     except Exception as e:
         error_message = f'starlink_gps_alert: Exception occurred: {str(e)}'
         send_alert(error_message)
         # exit(1)
+    finally:
+        save_state(coalescer, log_dir)
+        listener.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+"""Tests of the alerts file reader in alert_channel.py. Run with `python -m pytest test_alert_channel.py`."""
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from alert_channel import ACK_FILENAME, ALERTS_FILENAME, AlertFileReader
+
+
+class AlertFileReaderTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.alerts = self.dir / ALERTS_FILENAME
+        self.drain = self.dir / (ALERTS_FILENAME + ".drain")
+        self.ack_file = self.dir / ACK_FILENAME
+
+    def reader(self):
+        return AlertFileReader(self.alerts, self.ack_file)
+
+    def append(self, text, path=None):
+        with open(path or self.alerts, 'a') as f:
+            f.write(text)
+
+    def deliver_all(self, reader):
+        """Reads and acknowledges everything pending, and returns the text."""
+        texts = []
+        while True:
+            text, token = reader.read_pending()
+            if not text:
+                return "".join(texts)
+            texts.append(text)
+            reader.ack(token)
+
+    def test_acknowledged_offset_survives_a_restart(self):
+        self.append("ALERT: one\n")
+        reader = self.reader()
+        self.assertEqual(self.deliver_all(reader), "ALERT: one\n")
+        self.append("ALERT: two\n")
+        # The second alert was read but never acknowledged, so it is read again
+        self.assertEqual(reader.read_pending()[0], "ALERT: two\n")
+        self.assertEqual(self.reader().read_pending()[0], "ALERT: two\n")
+
+    def test_partial_line_waits(self):
+        self.append("ALERT: one\nALERT: tw")
+        reader = self.reader()
+        self.assertEqual(self.deliver_all(reader), "ALERT: one\n")
+        self.append("o\n")
+        self.assertEqual(self.deliver_all(reader), "ALERT: two\n")
+
+    def test_append_ack_compact_append(self):
+        self.append("ALERT: one\n")
+        reader = self.reader()
+        self.deliver_all(reader)
+        reader.compact()
+        self.assertFalse(self.alerts.exists())
+        self.assertTrue(self.drain.exists())
+
+        # A writer that opened the file before the rename still appends to it,
+        # and the writer starts a new alerts file
+        self.append("ALERT: late\n", self.drain)
+        self.append("ALERT: two\n")
+        self.assertEqual(self.deliver_all(reader), "ALERT: late\nALERT: two\n")
+
+        # The drained file is kept during the grace period, then deleted, and
+        # the delivered alerts file is moved aside in its place
+        reader.compact()
+        self.assertEqual(self.drain.read_text(), "ALERT: one\nALERT: late\n")
+        with mock.patch("alert_channel.DRAIN_GRACE_S", 0.0):
+            reader.compact()
+        self.assertEqual(self.drain.read_text(), "ALERT: two\n")
+        self.assertFalse(self.alerts.exists())
+        offsets = json.loads(self.ack_file.read_text())["offsets"]
+        self.assertEqual(offsets, {str(self.drain.stat().st_ino): len("ALERT: two\n")})
+        with mock.patch("alert_channel.DRAIN_GRACE_S", 0.0):
+            reader.compact()
+        self.assertFalse(self.drain.exists())
+        self.assertEqual(json.loads(self.ack_file.read_text())["offsets"], {})
+
+        # Everything so far stays delivered after a restart, and the next
+        # alerts file is read from the start, whatever inode it gets
+        self.append("ALERT: three\n")
+        self.assertEqual(self.deliver_all(self.reader()), "ALERT: three\n")
+
+    def test_reused_inode_is_read_from_the_start(self):
+        self.append("2026-02-03T02:10:00 - ALERT: new file\n")
+        inode = self.alerts.stat().st_ino
+        # The ack file of a deleted file that had the same inode
+        self.ack_file.write_text(json.dumps({"offsets": {str(inode): 20},
+                                             "heads": {str(inode): b"2026-02-01T09:00:00 - ALERT: old".hex()}}))
+        self.assertEqual(self.reader().read_pending()[0], "2026-02-03T02:10:00 - ALERT: new file\n")
+
+    def test_file_shorter_than_its_offset_is_read_from_the_start(self):
+        self.append("ALERT: new\n")
+        # An ack file from before heads were kept
+        self.ack_file.write_text(json.dumps({"offsets": {str(self.alerts.stat().st_ino): 1000}}))
+        self.assertEqual(self.reader().read_pending()[0], "ALERT: new\n")
+
+    def test_old_ack_file_without_heads_is_trusted(self):
+        self.append("ALERT: one\nALERT: two\n")
+        self.ack_file.write_text(json.dumps({"offsets": {str(self.alerts.stat().st_ino): len("ALERT: one\n")}}))
+        reader = self.reader()
+        self.assertEqual(self.deliver_all(reader), "ALERT: two\n")
+        self.assertIn("heads", json.loads(self.ack_file.read_text()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""Tests of alert coalescing and rate limiting in alert_coalescer.py, on a VirtualClock.
+
+Run with `python -m pytest test_alert_coalescer.py`.
+"""
+
+import asyncio
+import unittest
+
+from alert_coalescer import AlertCoalescer
+from alert_dispatcher import AlertDispatcher
+from clock import VirtualClock
+
+
+class RecordingChannel:
+    """Stands in for a Telegram or Gmail channel and keeps what it was sent."""
+
+    def __init__(self, name, rate_limit):
+        self.name = name
+        self.rate_limit = rate_limit
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+def alert(second, text="ALERT: GPS and Starlink positions differ by 1.02 NM"):
+    return f"2026-02-03T02:10:{second:02d} - {text}"
+
+
+class AlertCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.telegram = RecordingChannel("telegram", (2, 100.0))
+        self.gmail = RecordingChannel("gmail", (1, 1000.0))
+        self.dispatcher = AlertDispatcher([self.telegram, self.gmail], max_attempts=1)
+        self.addCleanup(self.dispatcher.close)
+        self.coalescer = AlertCoalescer(self.dispatcher, window_s=10.0, clock=self.clock.monotonic)
+        self.tokens = 0
+
+    def advance_to(self, t):
+        asyncio.run(self.clock.advance_to(t))
+
+    def add(self, *lines):
+        self.tokens += 1
+        self.coalescer.add("\n".join(lines) + "\n", self.tokens)
+
+    def test_first_alert_is_sent_at_once(self):
+        self.add(alert(0))
+        self.assertEqual(self.coalescer.next_due(), 0.0)
+        self.assertEqual(self.coalescer.flush(), [1])
+        self.assertEqual(self.telegram.messages, [alert(0)])
+        self.assertEqual(self.gmail.messages, [alert(0)])
+        self.assertIsNone(self.coalescer.next_due())
+
+    def test_burst_limit(self):
+        # Telegram may send two messages at once, then one every 100 s
+        self.add(alert(0))
+        self.coalescer.flush()
+        self.advance_to(10.0)
+        self.add(alert(10))
+        self.coalescer.flush()
+        self.assertEqual(len(self.telegram.messages), 2)
+
+        self.advance_to(20.0)
+        self.add(alert(20))
+        # The window has passed, but the bucket only holds 0.2 tokens by now
+        self.assertAlmostEqual(self.coalescer.next_due(), 100.0)
+        self.advance_to(99.0)
+        self.coalescer.flush()
+        self.assertEqual(len(self.telegram.messages), 2)
+        self.advance_to(100.0)
+        self.coalescer.flush()
+        self.assertEqual(self.telegram.messages[-1], alert(20))
+
+    def test_refill_stops_at_the_burst(self):
+        self.add(alert(0))
+        self.coalescer.flush()
+        self.advance_to(10.0)
+        self.add(alert(10))
+        self.coalescer.flush()
+        self.assertAlmostEqual(self.coalescer.state()["telegram"]["tokens"], 0.1)
+
+        # One token per 100 s, never more than the burst
+        self.advance_to(60.0)
+        self.assertAlmostEqual(self.coalescer.state()["telegram"]["tokens"], 0.6)
+        self.advance_to(10000.0)
+        self.assertEqual(self.coalescer.state()["telegram"]["tokens"], 2.0)
+
+        # So a full bucket again allows two messages, a window apart
+        self.add(alert(30))
+        self.coalescer.flush()
+        self.advance_to(10010.0)
+        self.add(alert(40))
+        self.coalescer.flush()
+        self.assertEqual(self.telegram.messages[-2:], [alert(30), alert(40)])
+
+    def test_alerts_within_the_window_are_sent_as_one_summary(self):
+        self.add(alert(0))
+        self.coalescer.flush()
+        for second in range(1, 6):
+            self.advance_to(float(second))
+            self.add(alert(second, f"ALERT: GPS and Starlink positions differ by 1.{second}0 NM"))
+            self.assertEqual(self.coalescer.flush(), [])
+        self.add(alert(6, "ALERT: GPS SOG 12.3 kn doesn't match Starlink SOG 4.5 kn"))
+
+        self.assertEqual(self.coalescer.next_due(), 10.0)
+        self.advance_to(10.0)
+        self.coalescer.flush()
+        self.assertEqual(self.telegram.messages[1], "\n".join([
+            "6 alerts from 2026-02-03T02:10:01 to 2026-02-03T02:10:06:",
+            "5 x ALERT: GPS and Starlink positions differ by 1.50 NM (last at 2026-02-03T02:10:05)",
+            "1 x ALERT: GPS SOG 12.3 kn doesn't match Starlink SOG 4.5 kn",
+            "Latest: " + alert(6, "ALERT: GPS SOG 12.3 kn doesn't match Starlink SOG 4.5 kn"),
+        ]))
+        self.assertEqual(self.coalescer.channels[0].alerts, 7)
+        self.assertEqual(self.coalescer.channels[0].messages, 2)
+
+    def test_channels_are_limited_independently(self):
+        self.add(alert(0))
+        self.coalescer.flush()
+        self.advance_to(10.0)
+        self.add(alert(10))
+        # Telegram sends again; Gmail's single token lasts 1000 s, so the
+        # alert isn't acknowledged until Gmail has sent it too
+        self.assertEqual(self.coalescer.flush(), [])
+        self.assertEqual(len(self.telegram.messages), 2)
+        self.assertEqual(len(self.gmail.messages), 1)
+        self.assertEqual(self.coalescer.next_due(), 1000.0)
+        self.advance_to(1000.0)
+        self.assertEqual(self.coalescer.flush(), [2])
+        self.assertEqual(self.gmail.messages[-1], alert(10))
+        self.assertEqual(len(self.telegram.messages), 2)
+
+    def test_restore_keeps_the_rate_limit_across_a_restart(self):
+        self.add(alert(0))
+        self.coalescer.flush()
+        self.advance_to(10.0)
+        self.add(alert(10))
+        self.coalescer.flush()
+        saved = self.coalescer.state()
+
+        # Restarted 20 s later with an empty bucket, not a full one
+        restarted = AlertCoalescer(self.dispatcher, window_s=10.0, clock=self.clock.monotonic)
+        restarted.restore(saved, 20.0)
+        restarted.add(alert(30), 1)
+        self.assertAlmostEqual(restarted.next_due(), 10.0 + 70.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Tests of alert_dispatcher.py against local stand-ins for Telegram and an SMTP server.
+
+Run with `python -m pytest test_alert_dispatcher.py` or `python -m unittest test_alert_dispatcher`.
+No network access or credentials are needed.
+"""
+
+import json
+import socketserver
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from alert_dispatcher import (AlertDispatcher, AlertDeliveryError, GmailChannel, PermanentDeliveryError,
+                              TelegramChannel, make_http_session)
+
+
+class TelegramStandIn:
+    """Answers POST /bot<token>/sendMessage like the Telegram bot API.
+
+    `replies` is a list of (delay_s, status) used for successive requests;
+    after the last one it keeps answering 200 at once.
+    """
+
+    def __init__(self, replies=()):
+        self.replies = list(replies)
+        self.requests = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stand_in.lock:
+                    stand_in.requests.append((self.path, body))
+                    delay, status = stand_in.replies.pop(0) if stand_in.replies else (0.0, 200)
+                time.sleep(delay)
+                payload = json.dumps({"ok": status == 200}).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    pass  # The client timed out and went away
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SmtpStandIn:
+    """A minimal SMTP server with AUTH, which accepts or rejects every login."""
+
+    def __init__(self, accept_login=True):
+        self.messages = []
+        self.logins = 0
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                self.reply("220 stand-in ESMTP")
+                while True:
+                    line = self.rfile.readline().decode().strip()
+                    command = line.split(" ")[0].upper()
+                    if not line or command == "QUIT":
+                        self.reply("221 bye")
+                        return
+                    if command == "EHLO":
+                        self.reply("250-stand-in")
+                        self.reply("250 AUTH PLAIN")
+                    elif command == "AUTH":
+                        stand_in.logins += 1
+                        self.reply("235 ok" if accept_login else "535 5.7.8 credentials rejected")
+                    elif command == "DATA":
+                        self.reply("354 go ahead")
+                        data = []
+                        while (part := self.rfile.readline()) not in (b".\r\n", b""):
+                            data.append(part.decode())
+                        stand_in.messages.append("".join(data))
+                        self.reply("250 queued")
+                    else:
+                        self.reply("250 ok")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AlertDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.session = make_http_session(4)
+
+    def telegram(self, stand_in, chat_id, timeout=2.0):
+        return TelegramChannel(self.session, "TOKEN", chat_id, api_url=stand_in.url, timeout=timeout)
+
+    def dispatcher(self, channels):
+        dispatcher = AlertDispatcher(channels, max_attempts=3, backoff_s=0.05)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def stand_in(self, cls, *args, **kwargs):
+        stand_in = cls(*args, **kwargs)
+        self.addCleanup(stand_in.close)
+        return stand_in
+
+    def test_channels_are_sent_to_concurrently(self):
+        telegram = self.stand_in(TelegramStandIn, [(0.5, 200), (0.5, 200), (0.5, 200)])
+        dispatcher = self.dispatcher([self.telegram(telegram, n) for n in (1, 2, 3)])
+        start = time.monotonic()
+        results = dispatcher.send("ALERT: test")
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(results, {"telegram:1": None, "telegram:2": None, "telegram:3": None})
+        self.assertEqual(sorted(telegram.requests, key=lambda request: request[1]["chat_id"]),
+                         [("/botTOKEN/sendMessage", {"chat_id": n, "text": "ALERT: test"}) for n in (1, 2, 3)])
+
+    def test_hung_attempt_times_out_and_is_retried(self):
+        telegram = self.stand_in(TelegramStandIn, [(2.0, 200)])
+        dispatcher = self.dispatcher([self.telegram(telegram, 1, timeout=0.3)])
+        start = time.monotonic()
+        self.assertEqual(dispatcher.send("ALERT: test"), {"telegram:1": None})
+        self.assertLess(time.monotonic() - start, 1.5)
+        stats = dispatcher.stats["telegram:1"]
+        self.assertEqual((stats.delivered, stats.retries, stats.failed), (1, 1, 0))
+
+    def test_server_errors_are_retried_with_backoff(self):
+        telegram = self.stand_in(TelegramStandIn, [(0.0, 500), (0.0, 429)])
+        dispatcher = self.dispatcher([self.telegram(telegram, 1)])
+        start = time.monotonic()
+        self.assertEqual(dispatcher.send("ALERT: test"), {"telegram:1": None})
+        # Backoff of 0.05 s, then 0.1 s, each with +-20% jitter
+        self.assertGreaterEqual(time.monotonic() - start, 0.12)
+        self.assertEqual(len(telegram.requests), 3)
+        self.assertEqual(dispatcher.stats["telegram:1"].retries, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        telegram = self.stand_in(TelegramStandIn, [(0.0, 503)] * 3)
+        dispatcher = self.dispatcher([self.telegram(telegram, 1)])
+        with self.assertRaises(AlertDeliveryError):
+            dispatcher.send("ALERT: test")
+        self.assertEqual(len(telegram.requests), 3)
+        self.assertEqual(dispatcher.stats["telegram:1"].failed, 1)
+
+    def test_permanent_error_is_not_retried(self):
+        telegram = self.stand_in(TelegramStandIn, [(0.0, 401)])
+        dispatcher = self.dispatcher([self.telegram(telegram, 1)])
+        with self.assertRaises(AlertDeliveryError):
+            dispatcher.send("ALERT: test")
+        self.assertEqual(len(telegram.requests), 1)
+
+    def test_one_failing_channel_does_not_fail_the_others(self):
+        good = self.stand_in(TelegramStandIn)
+        bad = self.stand_in(TelegramStandIn, [(0.0, 400)])
+        dispatcher = self.dispatcher([self.telegram(good, 1), self.telegram(bad, 2)])
+        results = dispatcher.send("ALERT: test")
+        self.assertIsNone(results["telegram:1"])
+        self.assertIsInstance(results["telegram:2"], PermanentDeliveryError)
+
+    def test_email_is_delivered(self):
+        smtp = self.stand_in(SmtpStandIn)
+        gmail = GmailChannel("alerts@example.com", "secret", ["crew@example.com"], "Boat - GPS Alert",
+                             host="127.0.0.1", port=smtp.port, use_starttls=False, timeout=2.0)
+        self.assertEqual(self.dispatcher([gmail]).send("ALERT: test"), {"gmail": None})
+        self.assertEqual(len(smtp.messages), 1)
+        self.assertIn("ALERT: test", smtp.messages[0])
+        self.assertIn("Subject: Boat - GPS Alert", smtp.messages[0])
+
+    def test_rejected_email_login_is_permanent(self):
+        smtp = self.stand_in(SmtpStandIn, accept_login=False)
+        gmail = GmailChannel("alerts@example.com", "wrong", ["crew@example.com"], "Boat - GPS Alert",
+                             host="127.0.0.1", port=smtp.port, use_starttls=False, timeout=2.0)
+        results = self.dispatcher([gmail]).deliver({"gmail": "ALERT: test"})
+        self.assertIsInstance(results["gmail"], PermanentDeliveryError)
+        self.assertEqual(smtp.logins, 1)
+        self.assertEqual(smtp.messages, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
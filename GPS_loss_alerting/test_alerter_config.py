@@ -0,0 +1,40 @@
+"""Tests of alerter_config.py. Run with `python -m pytest test_alerter_config.py`."""
+
+import unittest
+
+from alerter_config import ConfigError, parse_config
+from diff_starlink_gps import ROUTE_TARGETS, SOURCE_LABELS, default_config
+
+
+def parse(data):
+    return parse_config(data, default_config(), ROUTE_TARGETS, SOURCE_LABELS)
+
+
+class ParseConfigTest(unittest.TestCase):
+    def test_empty_file_keeps_the_defaults(self):
+        self.assertEqual(parse(None), default_config())
+
+    def test_clear_distance_scales_with_the_threshold(self):
+        config = parse({"distance_threshold_nm": 2.0})
+        self.assertEqual(config.distance_threshold_nm, 2.0)
+        self.assertAlmostEqual(config.distance_clear_nm, 1.6)
+        self.assertAlmostEqual(parse({"distance_threshold_nm": 0.5}).distance_clear_nm, 0.4)
+
+    def test_given_clear_distance_is_kept(self):
+        config = parse({"distance_threshold_nm": 2.0, "distance_clear_nm": 1.9})
+        self.assertEqual((config.distance_threshold_nm, config.distance_clear_nm), (2.0, 1.9))
+        self.assertEqual(parse({"distance_clear_nm": 0.5}).distance_threshold_nm,
+                         default_config().distance_threshold_nm)
+
+    def test_clear_distance_above_threshold_is_rejected(self):
+        with self.assertRaises(ConfigError):
+            parse({"distance_threshold_nm": 0.5, "distance_clear_nm": 0.6})
+
+    def test_invalid_numbers_are_rejected(self):
+        for value in ("1", True, -1):
+            with self.assertRaises(ConfigError):
+                parse({"alert_raise_dwell_s": value})
+
+
+if __name__ == "__main__":
+    unittest.main()
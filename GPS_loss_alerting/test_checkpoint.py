@@ -0,0 +1,53 @@
+"""Tests of checkpoint.py. Run with `python -m pytest test_checkpoint.py`."""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from checkpoint import load_checkpoint, save_checkpoint
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "state.json"
+
+    def test_round_trip(self):
+        save_checkpoint(self.path, {"alert": True})
+        state, age = load_checkpoint(self.path)
+        self.assertEqual(state, {"alert": True})
+        self.assertLess(age, 5)
+        self.assertEqual([p.name for p in self.path.parent.iterdir()], ["state.json"])
+
+    def test_file_and_rename_are_synced(self):
+        synced = []
+        real_fsync = os.fsync
+
+        def fsync(fd):
+            # The data must be complete before the rename makes it the checkpoint
+            synced.append((os.fstat(fd).st_size, self.path.exists()))
+            real_fsync(fd)
+
+        with mock.patch("os.fsync", fsync):
+            save_checkpoint(self.path, {"alert": True})
+        file_size, renamed = synced[0]
+        self.assertEqual(file_size, self.path.stat().st_size)
+        self.assertFalse(renamed)
+        if os.name == "posix":
+            # Then the directory, so the rename survives a power cut
+            self.assertEqual(len(synced), 2)
+            self.assertTrue(synced[1][1])
+
+    def test_failed_write_keeps_the_previous_checkpoint(self):
+        save_checkpoint(self.path, {"n": 1})
+        with mock.patch("os.fsync", side_effect=OSError(5, "Input/output error")):
+            with self.assertRaises(OSError):
+                save_checkpoint(self.path, {"n": 2})
+        self.assertEqual(load_checkpoint(self.path)[0], {"n": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
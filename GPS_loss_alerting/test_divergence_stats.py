@@ -0,0 +1,40 @@
+"""Tests of divergence_stats.py. Run with `python -m pytest test_divergence_stats.py`."""
+
+import math
+import random
+import unittest
+
+from divergence_stats import WindowStats
+
+
+class ExactWindowTest(unittest.TestCase):
+    def test_matches_a_sorted_copy_of_the_window(self):
+        rng = random.Random(1)
+        window = WindowStats(60, keep_samples=True)
+        samples = []
+        t = 0.0
+        for _ in range(3000):
+            t += rng.expovariate(rng.choice((0.2, 1.0, 5.0)))
+            x = rng.choice((rng.random() * 2, round(rng.random(), 1), 1.0))
+            window.add(t, x)
+            samples.append((t, x))
+            # The window holds the samples of its 60 one-second buckets
+            live = sorted(x for st, x in samples if st // 1 > t // 1 - 60)
+            self.assertEqual(window.count, len(live))
+            for p in (50, 95, 100):
+                self.assertEqual(window.percentile(p), live[max(math.ceil(p / 100 * len(live)), 1) - 1])
+            for threshold in (0.5, 0.9, 1.0):
+                above = sum(1 for x in live if x > threshold)
+                self.assertEqual(window.count_above(threshold), above)
+                self.assertEqual(window.percentile_above(95, threshold),
+                                 live[max(math.ceil(0.95 * len(live)), 1) - 1] > threshold)
+
+    def test_approximate_percentile_is_not_above_the_max(self):
+        window = WindowStats(600)
+        for t in range(100):
+            window.add(t, 0.5)
+        self.assertLessEqual(window.p95, window.max)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tests of io_worker.py. Run with `python -m pytest test_io_worker.py`."""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from io_worker import IoWorker, QueuedLogHandler
+
+
+class IoWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.worker = IoWorker(maxsize=3, reserve=2)
+        self.addCleanup(self.worker.close)
+        # Stall the worker thread until the test lets it go
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        started = threading.Event()
+        self.worker.submit(lambda: (started.set(), self.release.wait()))
+        started.wait()
+        self.done = []
+
+    def submit(self, name, **kwargs):
+        return self.worker.submit(self.done.append, name, **kwargs)
+
+    def test_full_queue_drops_ordinary_then_priority_jobs(self):
+        self.assertEqual([self.submit(f"info{n}") for n in range(4)], [True, True, True, False])
+        self.assertEqual([self.submit(f"warning{n}", priority=True) for n in range(3)], [True, True, False])
+        self.assertEqual((self.worker.dropped, self.worker.dropped_priority), (2, 1))
+
+    def test_essential_jobs_are_never_dropped(self):
+        for n in range(5):
+            self.submit(f"info{n}", priority=True)
+        self.assertTrue(self.submit("alert", essential=True))
+        self.release.set()
+        self.worker.flush()
+        self.assertEqual(self.done[-1], "alert")
+
+    def test_drops_are_reported_once_the_queue_empties(self):
+        for n in range(4):
+            self.submit(f"info{n}")
+        self.submit("warning", priority=True)
+        self.submit("warning", priority=True)
+        self.submit("warning", priority=True)
+        with self.assertLogs("io_worker", "WARNING") as logs:
+            self.release.set()
+            self.worker.flush()
+        self.assertEqual(logs.output, ["WARNING:io_worker:Dropped 2 log records (1 of them warnings or errors) "
+                                       "while file output was stalled."])
+
+    def test_log_handler_queues_warnings_as_priority_jobs(self):
+        records = []
+        sink = logging.Handler()
+        sink.emit = records.append
+        handler = QueuedLogHandler(self.worker, [sink])
+        logger = logging.getLogger("test_io_worker")
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        for n in range(4):
+            logger.warning("warning %d", n)
+        logger.info("dropped")
+        self.release.set()
+        self.worker.flush()
+        self.assertEqual([record.getMessage() for record in records], [f"warning {n}" for n in range(4)])
+
+
+# Queues an alert behind a slow write, then waits to be stopped
+_STALLED_ALERT = """
+import asyncio, sys, time
+from diff_starlink_gps import run_until_sigterm
+from io_worker import IoWorker
+
+def append(path, line):
+    with open(path, "a") as f:
+        f.write(line)
+
+async def main():
+    worker = IoWorker()
+    try:
+        worker.submit(time.sleep, 1.0)
+        worker.submit(append, sys.argv[1], "ALERT: queued\\n", essential=True)
+        print("queued", flush=True)
+        await asyncio.Event().wait()
+    finally:
+        worker.close()
+
+asyncio.run(run_until_sigterm(main()))
+"""
+
+
+@unittest.skipIf(os.name != "posix", "needs SIGTERM")
+class SigtermTest(unittest.TestCase):
+    def test_queued_alert_is_written_on_sigterm(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            alerts = Path(tmp) / "alerts.txt"
+            process = subprocess.Popen([sys.executable, "-c", _STALLED_ALERT, str(alerts)],
+                                       cwd=Path(__file__).resolve().parent, stdout=subprocess.PIPE, text=True)
+            self.addCleanup(process.kill)
+            self.assertEqual(process.stdout.readline(), "queued\n")
+            process.send_signal(signal.SIGTERM)
+            process.communicate(timeout=20)
+            self.assertEqual(process.returncode, 0)
+            self.assertEqual(alerts.read_text(), "ALERT: queued\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""Tests of position_sources.py against local stand-ins for the Starlink dish and an NMEA server.
+
+Run with `python -m pytest test_position_sources.py`. The dish tests need
+grpcio, grpcio-reflection and yagrc, and are skipped without them.
+"""
+
+import asyncio
+import sys
+import unittest
+from unittest import mock
+
+from clock import SystemClock
+from position_sources import (NMEA_RECONNECT_MIN_S, DishLocationClient, NmeaSource, PositionSource,
+                              StarlinkDishSource)
+
+try:
+    from starlink_dish_standin import DishStandIn
+    import yagrc  # noqa: F401
+except ImportError:
+    DishStandIn = None
+
+
+async def _collect(source, count, timeout_s=5.0):
+    """Runs `source` until it has produced `count` fixes, and returns them."""
+    fixes = []
+    done = asyncio.Event()
+
+    def on_fix(fix):
+        fixes.append(fix)
+        if len(fixes) >= count:
+            done.set()
+
+    task = asyncio.create_task(source.run(on_fix))
+    try:
+        await asyncio.wait_for(done.wait(), timeout_s)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return fixes
+
+
+class PositionSourceTest(unittest.TestCase):
+    def test_run_is_abstract(self):
+        with self.assertRaises(TypeError):
+            PositionSource()
+
+    def test_missing_grpc_is_reported_clearly(self):
+        with mock.patch.dict(sys.modules, {"yagrc": None}):
+            with self.assertRaises(ImportError) as raised:
+                DishLocationClient("127.0.0.1:1")
+        self.assertIn("python -m pip install grpcio yagrc", str(raised.exception))
+        self.assertEqual(raised.exception.name, "yagrc")
+
+
+@unittest.skipIf(DishStandIn is None, "needs grpcio, grpcio-reflection and yagrc")
+class StarlinkDishSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.dish = DishStandIn(lat=4.12, lon=73.46, sigma_m=4.5).start()
+        self.addCleanup(self.dish.close)
+
+    def test_client_reads_the_location(self):
+        client = DishLocationClient(self.dish.target, timeout_s=2.0)
+        self.addCleanup(client.close)
+        fix = client()
+        self.assertEqual((fix.lat, fix.lon, fix.accuracy_m, fix.sog), (4.12, 73.46, 4.5, None))
+        self.dish.set_location(None)
+        self.assertIsNone(client())
+
+    def test_source_polls_on_its_interval(self):
+        source = StarlinkDishSource(SystemClock(), self.dish.target, interval_s=0.05)
+        self.addCleanup(source.close)
+        fixes = asyncio.run(_collect(source, 3))
+        self.assertEqual([(fix.lat, fix.lon) for fix in fixes], [(4.12, 73.46)] * 3)
+
+    def test_source_carries_on_after_the_dish_fails(self):
+        source = StarlinkDishSource(SystemClock(), self.dish.target, interval_s=0.05, timeout_s=0.5)
+        self.addCleanup(source.close)
+        self.dish.close()
+        with self.assertLogs("position_sources", "WARNING") as logs:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(_collect(source, 1, timeout_s=1.0))
+        self.assertGreater(source.errors, 1)
+        # Only the first of the failures is logged
+        self.assertEqual(len(logs.records), 1)
+
+
+class RecordingClock(SystemClock):
+    """A SystemClock whose sleeps return at once and are recorded."""
+
+    def __init__(self):
+        self.sleeps = []
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        await asyncio.sleep(0)
+
+
+class NmeaSourceTest(unittest.TestCase):
+    def test_name_includes_the_host(self):
+        self.assertEqual(NmeaSource(SystemClock(), "tcp://192.168.1.1:10110").name, "nmea_tcp_192.168.1.1_10110")
+        self.assertNotEqual(NmeaSource(SystemClock(), "tcp://10.0.0.1:10110").name,
+                            NmeaSource(SystemClock(), "tcp://10.0.0.2:10110").name)
+
+    def test_dropped_connections_back_off(self):
+        async def run():
+            connections = 0
+
+            def drop(reader, writer):
+                nonlocal connections
+                connections += 1
+                if connections == 1:
+                    writer.write(b"$GPGGA,120000.00,0407.200,N,07327.600,E,1,08,0.9,5.0,M,,M,,*73\r\n")
+                writer.close()
+
+            server = await asyncio.start_server(drop, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            clock = RecordingClock()
+            source = NmeaSource(clock, f"tcp://127.0.0.1:{port}")
+            fixes = []
+            task = asyncio.create_task(source.run(fixes.append))
+            while len(clock.sleeps) < 5:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+            return clock.sleeps, fixes
+
+        with self.assertLogs("position_sources", "WARNING") as logs:
+            sleeps, fixes = asyncio.run(run())
+        self.assertEqual([(round(fix.lat, 2), round(fix.lon, 2)) for fix in fixes], [(4.12, 73.46)])
+        # A connection that is dropped at once doesn't reset the backoff
+        for attempt, delay in enumerate(sleeps[:5]):
+            self.assertGreaterEqual(delay, NMEA_RECONNECT_MIN_S * 2 ** attempt / 2)
+            self.assertLessEqual(delay, NMEA_RECONNECT_MIN_S * 2 ** attempt)
+        # One warning per dropped connection
+        self.assertEqual(len(logs.records), len(sleeps))
+        self.assertIn("disconnected. Reconnecting in", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Tests of replaying a capture with diff_starlink_gps.py --replay.
+
+Run with `python -m pytest test_replay.py`.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from alert_channel import ALERTS_FILENAME, NOTIFY_SOCKET_FILENAME
+from signalk_synth import DeltaGenerator, write_capture
+
+HERE = Path(__file__).resolve().parent
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.capture = self.tmp / "passage.capture.gz"
+        # The GPS drifts away from Starlink after a minute, which raises alerts
+        write_capture(self.capture, DeltaGenerator(spoof_after_s=60), 300)
+
+    def replay(self, *args):
+        return subprocess.run([sys.executable, str(HERE / "diff_starlink_gps.py"), "--replay", str(self.capture),
+                               "--config", str(self.tmp / "none.yaml"), *args],
+                              cwd=HERE, capture_output=True, text=True, timeout=120)
+
+    def test_replay_needs_a_log_dir(self):
+        result = self.replay()
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--replay needs --log-dir", result.stderr)
+
+    @unittest.skipIf(not hasattr(socket, "AF_UNIX"), "needs Unix sockets")
+    def test_replay_does_not_wake_the_sender(self):
+        log_dir = self.tmp / "logs"
+        log_dir.mkdir()
+        # Stands in for a running starlink_gps_alert.py
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.addCleanup(listener.close)
+        listener.bind(str(log_dir / NOTIFY_SOCKET_FILENAME))
+        listener.setblocking(False)
+
+        result = self.replay("--log-dir", str(log_dir))
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("ALERT", (log_dir / ALERTS_FILENAME).read_text())
+        with self.assertRaises(BlockingIOError):
+            listener.recv(16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Tests that diff_starlink_gps.py keeps its buffered output when systemd stops it.
+
+Runs the monitor in a subprocess, with no Signal K server to connect to, and
+sends it SIGTERM as `systemctl stop` does. Run with `python -m pytest test_shutdown.py`.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+
+@unittest.skipIf(os.name != "posix", "needs SIGTERM")
+class SigtermTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log_dir = Path(tmp.name)
+        # Every source is lost after 1 s, giving data loss alerts without any data
+        self.config = self.log_dir / "config.yaml"
+        self.config.write_text("data_loss_timeout_s: 1\n")
+
+    def start(self):
+        process = subprocess.Popen(
+            [sys.executable, str(HERE / "diff_starlink_gps.py"), "--log-dir", str(self.log_dir),
+             "--config", str(self.config), "--uri", "ws://127.0.0.1:9/signalk/v1/stream?subscribe=none",
+             "--metrics-port", "0"],
+            cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.addCleanup(process.kill)
+        return process
+
+    def test_sigterm_writes_buffered_rows_alerts_and_checkpoint(self):
+        process = self.start()
+        alerts = self.log_dir / "starlink_gps_alerts.txt"
+        deadline = time.monotonic() + 20
+        while not (alerts.exists() and alerts.read_text().count("ALERT") >= 2):
+            self.assertLess(time.monotonic(), deadline, "no data loss alerts")
+            time.sleep(0.1)
+        # The track rows are still buffered: TrackWriter only flushes every 30 s
+        self.assertEqual(list(self.log_dir.glob("starlink_gps_logs_*.csv")), [])
+
+        process.send_signal(signal.SIGTERM)
+        output, _ = process.communicate(timeout=20)
+        self.assertEqual(process.returncode, 0, output)
+        self.assertIn("GpsAlerter shut down.", output)
+        rows = [line for path in self.log_dir.glob("starlink_gps_logs_*.csv")
+                for line in path.read_text().splitlines()[1:]]
+        self.assertGreater(len(rows), 2)
+        self.assertTrue((self.log_dir / "diff_starlink_gps.state.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Tests of track_store.py. Run with `python -m pytest test_track_store.py`."""
+
+import unittest
+
+from clock import VirtualClock
+from track_store import SOURCE_GPS, SOURCE_STARLINK, TrackStore
+
+
+class TrackStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.track = TrackStore(VirtualClock(), capacity=10)
+
+    def test_latest_fix_of_a_quiet_source_survives_a_full_buffer(self):
+        self.track.append(SOURCE_STARLINK, 59.1, 10.2, t=0.0)
+        # GPS keeps coming while Starlink is down, until the buffer has wrapped
+        for n in range(1, 26):
+            self.track.append(SOURCE_GPS, 59.0 + n / 1000, 10.0, sog=5.0, t=float(n))
+        starlink = self.track.latest(SOURCE_STARLINK)
+        self.assertEqual((starlink.time, starlink.lat, starlink.lon, starlink.sog), (0.0, 59.1, 10.2, None))
+        self.assertEqual(self.track.latest_lat(SOURCE_STARLINK), 59.1)
+        self.assertEqual(self.track.latest_lon(SOURCE_STARLINK), 10.2)
+        self.assertEqual(self.track.latest(SOURCE_GPS).time, 25.0)
+        # The history only holds what fits in the buffer
+        self.assertEqual(len(self.track), 10)
+        self.assertEqual(self.track.range(0.0, 100.0, SOURCE_STARLINK), [])
+        self.assertIsNone(self.track.nearest(0.0, SOURCE_STARLINK))
+
+    def test_latest_of_an_unseen_source_is_none(self):
+        self.track.append(SOURCE_GPS, 59.0, 10.0, t=0.0)
+        self.assertIsNone(self.track.latest(SOURCE_STARLINK))
+        self.assertIsNone(self.track.latest_lat(SOURCE_STARLINK))
+        self.assertIsNone(self.track.latest_lon(SOURCE_STARLINK))
+
+    def test_latest_matches_the_stored_fix(self):
+        self.track.append(SOURCE_GPS, 59.0, 10.0, sog=4.5, t=1.0)
+        self.track.append(SOURCE_STARLINK, 59.1, 10.1, t=2.0)
+        self.assertEqual(self.track.latest(SOURCE_GPS), self.track.nearest(1.0, SOURCE_GPS))
+        self.assertEqual(self.track.latest(SOURCE_STARLINK), self.track.nearest(2.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Tests of track_writer.py. Run with `python -m pytest test_track_writer.py`."""
+
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from track_writer import TrackWriter
+
+
+class TrackWriterTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log_dir = Path(tmp.name)
+
+    def test_rows_go_to_the_file_of_their_day(self):
+        writer = TrackWriter(self.log_dir, "track", "h\n")
+        writer.write(datetime(2026, 2, 3, 23, 59), "a\n")
+        writer.write(datetime(2026, 2, 4, 0, 1), "b\n")
+        writer.close()
+        self.assertEqual((self.log_dir / "track_2026-02-03.csv").read_text(), "h\na\n")
+        self.assertEqual((self.log_dir / "track_2026-02-04.csv").read_text(), "h\nb\n")
+
+    def test_old_days_are_deleted(self):
+        today = date(2026, 2, 10)
+        for days_ago in range(6):
+            (self.log_dir / f"track_{today - timedelta(days=days_ago)}.csv").write_text("h\n")
+        (self.log_dir / "track_notes.csv").write_text("kept\n")
+        writer = TrackWriter(self.log_dir, "track", "h\n", keep_days=3)
+        writer.write(datetime(2026, 2, 10, 12, 0), "a\n")
+        writer.close()
+        self.assertEqual(sorted(path.name for path in self.log_dir.iterdir()),
+                         ["track_2026-02-07.csv", "track_2026-02-08.csv", "track_2026-02-09.csv",
+                          "track_2026-02-10.csv", "track_notes.csv"])
+
+    def test_keep_days_0_keeps_every_day(self):
+        (self.log_dir / "track_2020-01-01.csv").write_text("h\n")
+        writer = TrackWriter(self.log_dir, "track", "h\n")
+        writer.write(datetime(2026, 2, 10, 12, 0), "a\n")
+        writer.close()
+        self.assertTrue((self.log_dir / "track_2020-01-01.csv").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,395 @@
+"""Offline analysis of the daily starlink_gps_logs_YYYY-MM-DD.csv track files.
+
+    python diff_starlink_gps.py analyze --from 2026-02-01 --to 2026-02-14
+
+Reports, for the days of a voyage:
+
+- the distribution of the GPS/Starlink difference (percentiles and a table);
+- how long, and in how many episodes, it was above the alert threshold;
+- outages: intervals longer than OUTAGE_GAP_S without both positions, because
+  a fix was missing or nothing was logged at all;
+- how the difference relates to speed over ground.
+
+Each file is loaded into NumPy arrays and the haversine and statistics are
+computed for all of its rows at once. Only one file is held in memory at a
+time; the statistics are carried over from file to file, so a long voyage
+needs no more memory than its busiest day.
+
+Where a row has the full positions in decimal degrees the difference is
+recomputed from them, otherwise the logged diff_nm is used, so files written
+before the degree columns were added can still be analysed.
+
+Needs numpy (python -m pip install numpy), which diff_starlink_gps.py
+itself doesn't.
+"""
+
+import argparse
+import io
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+TRACK_PREFIX = "starlink_gps_logs"
+# No difference for longer than this is an outage, and such gaps don't count
+# towards the time above the threshold
+OUTAGE_GAP_S = 60.0
+# Upper edges of the rows of the distribution table, in NM
+REPORT_BINS_NM = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+REPORT_PERCENTILES = (50, 90, 95, 99, 99.9)
+# Speed bands for the difference by speed table, in knots
+SOG_BANDS_KN = (1.0, 3.0, 6.0, 10.0)
+# Histogram for the percentiles: HIST_BINS_PER_DECADE log-spaced bins from
+# HIST_MIN_NM to HIST_MAX_NM, accurate to about 1%
+HIST_MIN_NM = 1e-4
+HIST_MAX_NM = 1e4
+HIST_BINS_PER_DECADE = 100
+# Earth radius in nautical miles, as in diff_starlink_gps.haversine()
+EARTH_RADIUS_NM = 3440.065
+
+# Columns after date-time, in file order. Older files stop after sog.
+_COLUMNS = ('slat_min', 'slon_min', 'glat_min', 'glon_min', 'diff_nm', 'sog',
+            'slat', 'slon', 'glat', 'glon')
+_SHORT_FIELDS = 7
+_FULL_FIELDS = 1 + len(_COLUMNS)
+# An empty field, which loadtxt won't parse
+_EMPTY_FIELD = re.compile(r',(?=,|$)', re.MULTILINE)
+_FILE_DATE = re.compile(TRACK_PREFIX + r'_(\d{4}-\d{2}-\d{2})\.csv$')
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """diff_starlink_gps.haversine() for arrays of decimal degrees; returns NM."""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def track_files(log_dir, first=None, last=None):
+    """Returns the track CSV files in log_dir dated between first and last
+    (datetime.date, inclusive), in date order."""
+    files = []
+    for path in Path(log_dir).glob(f"{TRACK_PREFIX}_*.csv"):
+        m = _FILE_DATE.search(path.name)
+        if not m:
+            continue
+        day = date.fromisoformat(m.group(1))
+        if (first is None or day >= first) and (last is None or day <= last):
+            files.append((day, path))
+    return [path for _, path in sorted(files)]
+
+
+def _parse_row(line):
+    """Slow path for a file that loadtxt rejects: the values of one row, or None if it is damaged."""
+    fields = line.split(',')[1:]
+    try:
+        values = [float(v) if v else np.nan for v in fields]
+    except ValueError:
+        return None
+    return values + [np.nan] * (len(_COLUMNS) - len(values))
+
+
+def load_track(path):
+    """Loads one track CSV file.
+
+    Returns a dict of arrays: 't' (seconds since the epoch, sorted) and one
+    float array per column name in _COLUMNS, NaN where a value is missing.
+    """
+    rows = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            n = line.count(',') + 1
+            # Skip headers and lines cut short by a power cut
+            if not line[:1].isdigit() or n not in (_SHORT_FIELDS, _FULL_FIELDS):
+                continue
+            rows.append(line if n == _FULL_FIELDS else line + ',' * (_FULL_FIELDS - n))
+    if not rows:
+        return None
+    try:
+        t = np.array([row[:19] for row in rows], dtype='datetime64[s]')
+        text = _EMPTY_FIELD.sub(',nan', '\n'.join(rows))
+        values = np.loadtxt(io.StringIO(text), delimiter=',', usecols=range(1, _FULL_FIELDS),
+                            dtype=np.float64, ndmin=2)
+    except ValueError:
+        parsed = [(row[:19], _parse_row(row)) for row in rows]
+        parsed = [(ts, v) for ts, v in parsed if v is not None]
+        if not parsed:
+            return None
+        t = np.array([ts for ts, _ in parsed], dtype='datetime64[s]')
+        values = np.array([v for _, v in parsed], dtype=np.float64)
+    order = np.argsort(t, kind='stable')
+    track = {'t': t[order].astype(np.int64).astype(np.float64)}
+    for i, name in enumerate(_COLUMNS):
+        track[name] = values[order, i]
+    return track
+
+
+def track_delta(track):
+    """Returns (difference in NM, True where it was recomputed from degrees) for each row."""
+    full = np.isfinite(track['slat']) & np.isfinite(track['slon']) & \
+        np.isfinite(track['glat']) & np.isfinite(track['glon'])
+    delta = track['diff_nm'].copy()
+    delta[full] = haversine(track['slat'][full], track['slon'][full],
+                            track['glat'][full], track['glon'][full])
+    return delta, full
+
+
+class _Moments:
+    """Count, means, variances and covariance of (x, y) pairs, combined chunk by chunk (Chan et al.)."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2x = self.m2y = self.cxy = 0.0
+
+    def add(self, x, y):
+        n = len(x)
+        if n == 0:
+            return
+        mx, my = x.mean(), y.mean()
+        dx, dy = x - mx, y - my
+        m2x, m2y, cxy = (dx * dx).sum(), (dy * dy).sum(), (dx * dy).sum()
+        total = self.n + n
+        ex, ey = mx - self.mean_x, my - self.mean_y
+        self.m2x += m2x + ex * ex * self.n * n / total
+        self.m2y += m2y + ey * ey * self.n * n / total
+        self.cxy += cxy + ex * ey * self.n * n / total
+        self.mean_x += ex * n / total
+        self.mean_y += ey * n / total
+        self.n = total
+
+    def std_x(self):
+        return float(np.sqrt(self.m2x / self.n)) if self.n else float('nan')
+
+    def correlation(self):
+        if self.n < 2 or self.m2x <= 0 or self.m2y <= 0:
+            return float('nan')
+        return float(self.cxy / np.sqrt(self.m2x * self.m2y))
+
+
+class VoyageStats:
+    """Statistics of the difference over any number of track files, added in time order."""
+
+    def __init__(self, threshold_nm, outage_gap_s=OUTAGE_GAP_S):
+        self.threshold_nm = threshold_nm
+        self.outage_gap_s = outage_gap_s
+        self.rows = 0
+        self.recomputed = 0
+        self.delta = _Moments()
+        self.max_nm = float('nan')
+        self.max_t = None
+        self.edges = np.logspace(np.log10(HIST_MIN_NM), np.log10(HIST_MAX_NM),
+                                 int(np.log10(HIST_MAX_NM / HIST_MIN_NM)) * HIST_BINS_PER_DECADE + 1)
+        # Plus underflow and overflow bins
+        self.hist = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        # Rows of the distribution table, counted exactly
+        self.table_counts = np.zeros(len(REPORT_BINS_NM) + 1, dtype=np.int64)
+        self.first_t = self.last_t = None
+        # Seconds covered by consecutive samples, and of those above the threshold
+        self.covered_s = 0.0
+        self.above_s = 0.0
+        self.episodes = 0
+        self.longest_episode_s = 0.0
+        # (start, end) in seconds since the epoch
+        self.outages = []
+        self.sog = _Moments()
+        self.sog_bands = np.zeros((len(SOG_BANDS_KN) + 1, 2))  # [sum of difference, count]
+        # The last sample, and the episode still open at the end of the previous file
+        self._prev_t = None
+        self._prev_d = None
+        self._run_s = None
+
+    def add(self, track):
+        """Adds the rows of one file from load_track(); files must come in time order."""
+        delta, full = track_delta(track)
+        self.rows += len(delta)
+        self.recomputed += int(full.sum())
+        valid = np.isfinite(delta)
+        t, d = track['t'][valid], delta[valid]
+        if len(d) == 0:
+            return
+        if self.first_t is None:
+            self.first_t = t[0]
+        self.last_t = t[-1]
+
+        self.delta.add(d, d)  # Only the x half is reported
+        i = int(np.argmax(d))
+        if self.max_t is None or d[i] > self.max_nm:
+            self.max_nm, self.max_t = float(d[i]), t[i]
+        self.hist += np.bincount(np.searchsorted(self.edges, d, side='right'), minlength=len(self.hist))
+        self.table_counts += np.bincount(np.searchsorted(REPORT_BINS_NM, d, side='right'),
+                                         minlength=len(self.table_counts))
+
+        sog = track['sog'][valid]
+        has_sog = np.isfinite(sog)
+        self.sog.add(sog[has_sog], d[has_sog])
+        band = np.searchsorted(SOG_BANDS_KN, sog[has_sog], side='right')
+        self.sog_bands[:, 0] += np.bincount(band, weights=d[has_sog], minlength=len(self.sog_bands))
+        self.sog_bands[:, 1] += np.bincount(band, minlength=len(self.sog_bands))
+
+        self._add_intervals(t, d)
+
+    def _add_intervals(self, t, d):
+        # Each interval between consecutive samples belongs to the earlier one;
+        # the interval after the last sample is counted with the next file.
+        if self._prev_t is not None:
+            t = np.concatenate(([self._prev_t], t))
+            d = np.concatenate(([self._prev_d], d))
+        self._prev_t, self._prev_d = t[-1], d[-1]
+        if len(t) < 2:
+            return
+        dt = np.diff(t)
+        gap = dt > self.outage_gap_s
+        for start, end in zip(t[:-1][gap], t[1:][gap]):
+            self.outages.append((float(start), float(end)))
+        dt = np.where(gap, 0.0, dt)
+        self.covered_s += dt.sum()
+
+        above = (d[:-1] > self.threshold_nm) & ~gap
+        self.above_s += dt[above].sum()
+        # Episodes are runs of intervals above the threshold. Run 0 is the one
+        # carried over from the previous file, if any.
+        carried = self._run_s is not None
+        starts = above & ~np.concatenate(([carried], above[:-1]))
+        ids = np.cumsum(starts)
+        runs = np.bincount(ids[above], weights=dt[above], minlength=int(ids[-1]) + 1)
+        if carried:
+            runs[0] += self._run_s
+        else:
+            runs = runs[1:]
+        # An episode running at the end stays open for the next file
+        if above[-1]:
+            self._run_s = float(runs[-1])
+            runs = runs[:-1]
+        else:
+            self._run_s = None
+        self._close_runs(runs)
+
+    def _close_runs(self, runs):
+        if len(runs):
+            self.episodes += len(runs)
+            self.longest_episode_s = max(self.longest_episode_s, float(runs.max()))
+
+    def finish(self):
+        """Closes an episode still running at the end of the last file."""
+        if self._run_s is not None:
+            self._close_runs(np.array([self._run_s]))
+            self._run_s = None
+
+    def percentile(self, q):
+        """Approximate q-th percentile of the difference, from the histogram."""
+        n = self.hist.sum()
+        if n == 0:
+            return float('nan')
+        b = int(np.searchsorted(np.cumsum(self.hist), q / 100 * n))
+        if b == 0:
+            return 0.0
+        if b >= len(self.edges):
+            return self.max_nm
+        # Geometric middle of the bin
+        return float(np.sqrt(self.edges[b - 1] * self.edges[b]))
+
+
+def _fmt_time(seconds):
+    return str(np.datetime64(int(seconds), 's')).replace('T', ' ')
+
+
+def _fmt_duration(seconds):
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+def format_report(title, stats, max_outages=20):
+    """Returns the text report of a VoyageStats."""
+    out = [title, "=" * len(title)]
+    n = stats.delta.n
+    out.append(f"Rows: {stats.rows}, with a difference: {n}, recomputed from decimal degrees: {stats.recomputed}")
+    if n == 0:
+        out.append("No rows with both a GPS and a Starlink position.")
+        return "\n".join(out)
+    out.append(f"From {_fmt_time(stats.first_t)} to {_fmt_time(stats.last_t)}, "
+               f"covered: {_fmt_duration(stats.covered_s)}")
+    out.append("")
+    out.append("Difference between GPS and Starlink")
+    out.append(f"  mean {stats.delta.mean_x:.3f} NM, std dev {stats.delta.std_x():.3f} NM, "
+               f"max {stats.max_nm:.3f} NM at {_fmt_time(stats.max_t)}")
+    out.append("  " + ", ".join(f"p{q:g} {stats.percentile(q):.3f} NM" for q in REPORT_PERCENTILES))
+    lower = 0.0
+    for edge, count in zip(REPORT_BINS_NM + (None,), stats.table_counts):
+        label = f"{lower:g} - {edge:g} NM" if edge is not None else f"> {lower:g} NM"
+        out.append(f"  {label:>14}: {int(count):9d} {100 * count / n:6.2f}%")
+        lower = edge
+    out.append("")
+    share = 100 * stats.above_s / stats.covered_s if stats.covered_s else 0.0
+    out.append(f"Above {stats.threshold_nm:g} NM: {_fmt_duration(stats.above_s)} ({share:.2f}% of the time covered) "
+               f"in {stats.episodes} episodes, longest {_fmt_duration(stats.longest_episode_s)}")
+    out.append("")
+    total = sum(end - start for start, end in stats.outages)
+    out.append(f"Outages longer than {stats.outage_gap_s:g} s: {len(stats.outages)}, "
+               f"total {_fmt_duration(total)}")
+    longest = sorted(stats.outages, key=lambda o: o[0] - o[1])[:max_outages]
+    for start, end in sorted(longest):
+        out.append(f"  {_fmt_time(start)} - {_fmt_time(end)}  {_fmt_duration(end - start)}")
+    if len(stats.outages) > max_outages:
+        out.append(f"  ... {len(stats.outages) - max_outages} shorter outages not listed")
+    out.append("")
+    r = stats.sog.correlation()
+    out.append(f"Speed over ground: correlation with the difference {'-' if np.isnan(r) else f'{r:.3f}'} "
+               f"({stats.sog.n} rows with SOG)")
+    lower = 0.0
+    for i, (total_nm, count) in enumerate(stats.sog_bands):
+        upper = SOG_BANDS_KN[i] if i < len(SOG_BANDS_KN) else None
+        label = f"{lower:g} - {upper:g} kn" if upper is not None else f"> {lower:g} kn"
+        mean = f"{total_nm / count:.3f} NM" if count else "-"
+        out.append(f"  {label:>11}: mean difference {mean} ({int(count)} rows)")
+        lower = upper
+    return "\n".join(out)
+
+
+def main(argv=None, threshold_nm=1.0, log_dir=Path.home() / "logs"):
+    """Command line entry point of `diff_starlink_gps.py analyze`."""
+    parser = argparse.ArgumentParser(prog="diff_starlink_gps.py analyze",
+                                     description="Report on the GPS/Starlink difference in the daily track CSV files.")
+    parser.add_argument("files", nargs="*", type=Path,
+                        help="Track CSV files to analyse, in time order (default: those in --log-dir).")
+    parser.add_argument("--log-dir", default=log_dir, type=Path,
+                        help=f"Directory of the {TRACK_PREFIX}_YYYY-MM-DD.csv files (default: {log_dir}).")
+    parser.add_argument("--from", dest="first", metavar="YYYY-MM-DD", type=date.fromisoformat,
+                        help="First day of the voyage.")
+    parser.add_argument("--to", dest="last", metavar="YYYY-MM-DD", type=date.fromisoformat,
+                        help="Last day of the voyage.")
+    parser.add_argument("--threshold", type=float, default=threshold_nm,
+                        help=f"Difference counted as above the threshold, in NM (default: {threshold_nm}).")
+    parser.add_argument("--outage-gap", type=float, default=OUTAGE_GAP_S,
+                        help=f"Seconds without a difference counted as an outage (default: {OUTAGE_GAP_S:g}).")
+    parser.add_argument("--daily", action="store_true",
+                        help="Also print a report for each day.")
+    args = parser.parse_args(argv)
+
+    files = args.files or track_files(args.log_dir, args.first, args.last)
+    if not files:
+        print(f"No {TRACK_PREFIX}_YYYY-MM-DD.csv files found.")
+        return 1
+    voyage = VoyageStats(args.threshold, args.outage_gap)
+    for path in files:
+        track = load_track(path)
+        if track is None:
+            print(f"{path}: no rows\n")
+            continue
+        voyage.add(track)
+        if args.daily:
+            day = VoyageStats(args.threshold, args.outage_gap)
+            day.add(track)
+            day.finish()
+            print(format_report(path.name, day) + "\n")
+    voyage.finish()
+    print(format_report(f"Voyage: {files[0].name} to {files[-1].name} ({len(files)} files)", voyage))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
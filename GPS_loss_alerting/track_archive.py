@@ -0,0 +1,438 @@
+"""Compressed, time-indexed archive of the track, alert and log history.
+
+Besides the plain text files, diff_starlink_gps.py appends every track CSV
+row, alert and log line to an archive in $HOME/logs/track_archive:
+
+- Records are collected per kind (track, alert, log) and written as
+  zlib-compressed blocks of about ARCHIVE_BLOCK_BYTES, or sooner once the
+  oldest record has waited ARCHIVE_BLOCK_MAX_AGE_S. Compression and writing
+  happen in a background thread.
+- Blocks go into segment files of about ARCHIVE_SEGMENT_BYTES. Each segment
+  has a small sidecar index with the time range, kind and offset of every
+  block, so a query for a time range only decompresses the blocks that
+  overlap it.
+- When the archive grows beyond its size limit, the oldest segments are
+  deleted.
+
+A block is indexed only after it has been written in full, and every block
+carries a checksum, so a power cut at worst loses the records still waiting
+in memory; these are also in the plain text files. Export a time range with:
+
+    python diff_starlink_gps.py archive export --from "2026-02-03 02:10" --to "2026-02-03 02:40" --format gpx
+"""
+
+import argparse
+import atexit
+import logging
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+ARCHIVE_DIRNAME = "track_archive"
+# Write a block when this many bytes of records are waiting...
+ARCHIVE_BLOCK_BYTES = 64 * 1024
+# ...or when the oldest waiting record is this many seconds old
+ARCHIVE_BLOCK_MAX_AGE_S = 600.0
+# Start a new segment file once the current one is this big
+ARCHIVE_SEGMENT_BYTES = 8 * 1024 * 1024
+# Delete the oldest segments when the archive is bigger than this
+ARCHIVE_MAX_BYTES = 256 * 1024 * 1024
+ARCHIVE_COMPRESS_LEVEL = 6
+
+KIND_TRACK = 1
+KIND_ALERT = 2
+KIND_LOG = 3
+KIND_NAMES = {KIND_TRACK: "track", KIND_ALERT: "alert", KIND_LOG: "log"}
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+_MAGIC = b'TRKB'
+_VERSION = 1
+# magic, version, kind, record count, first and last time, payload length, payload CRC-32
+_BLOCK_HEADER = struct.Struct('<4sBBIddII')
+# kind, record count, first and last time, offset of the block header, payload length
+_INDEX_ENTRY = struct.Struct('<BIddQI')
+
+
+class Block:
+    """Where a block is and what it holds, from the index."""
+    __slots__ = ('path', 'offset', 'length', 'kind', 'count', 'first_t', 'last_t')
+
+    def __init__(self, path, offset, length, kind, count, first_t, last_t):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.kind = kind
+        self.count = count
+        self.first_t = first_t
+        self.last_t = last_t
+
+
+def _encode(records):
+    """Compresses (t, text) records into a block payload. Records are separated
+    by NUL characters, so text may span several lines (e.g. a traceback)."""
+    text = '\0'.join(f"{t:.3f}\t{line}" for t, line in records)
+    return zlib.compress(text.encode('utf-8'), ARCHIVE_COMPRESS_LEVEL)
+
+
+def _decode(payload):
+    records = []
+    for record in zlib.decompress(payload).decode('utf-8', errors='replace').split('\0'):
+        t, _, text = record.partition('\t')
+        records.append((float(t), text))
+    return records
+
+
+class ArchiveWriter:
+    """Collects records in memory and writes them as compressed blocks from a background thread."""
+
+    def __init__(self, directory, max_bytes=ARCHIVE_MAX_BYTES, block_bytes=ARCHIVE_BLOCK_BYTES,
+                 block_max_age_s=ARCHIVE_BLOCK_MAX_AGE_S, segment_bytes=ARCHIVE_SEGMENT_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.block_bytes = block_bytes
+        self.block_max_age_s = block_max_age_s
+        # Keep segments small enough that retention frees space in reasonable steps
+        self.segment_bytes = max(block_bytes, min(segment_bytes, max_bytes // 8))
+        self.logger = logging.getLogger(__name__)
+
+        # kind -> [records, size in bytes, monotonic time of the oldest record]
+        self._pending = {}
+        # Full blocks of (kind, records) waiting to be written
+        self._full = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._segment = None
+        self._index = None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="track-archive", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, kind, t, text):
+        """Queues one record: `t` in seconds since the epoch, `text` without a trailing newline."""
+        with self._cond:
+            if self._closed:
+                return
+            entry = self._pending.get(kind)
+            if entry is None:
+                entry = self._pending[kind] = [[], 0, time.monotonic()]
+            entry[0].append((t, text))
+            entry[1] += len(text) + 16
+            if entry[1] >= self.block_bytes:
+                # Full: hand it to the worker, so blocks stay small however fast records come
+                self._full.append((kind, entry[0]))
+                del self._pending[kind]
+                self._cond.notify()
+
+    def close(self):
+        """Writes all remaining records and stops the worker thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _take(self, force):
+        """Removes and returns the (kind, records) that are due for writing. Call with the lock held."""
+        now = time.monotonic()
+        ready, self._full = self._full, []
+        for kind, (records, size, oldest) in list(self._pending.items()):
+            if force or now - oldest >= self.block_max_age_s:
+                ready.append((kind, records))
+                del self._pending[kind]
+        return ready
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(min(self.block_max_age_s, 30.0))
+                closed = self._closed
+                ready = self._take(force=closed)
+            self._write_blocks(ready)
+            if closed:
+                self._close_segment()
+                return
+
+    def _write_blocks(self, ready):
+        for kind, records in ready:
+            try:
+                self._write_block(kind, records)
+            except OSError as e:
+                self.logger.error(f"Error writing track archive: {e}")
+                self._close_segment()
+
+    def _write_block(self, kind, records):
+        # A record can arrive slightly out of order, e.g. an alert stamped
+        # before the log line that was queued first
+        first_t = min(t for t, _ in records)
+        last_t = max(t for t, _ in records)
+        payload = _encode(records)
+        if self._segment is None or self._segment.tell() >= self.segment_bytes:
+            self._open_segment()
+        offset = self._segment.tell()
+        self._segment.write(_BLOCK_HEADER.pack(_MAGIC, _VERSION, kind, len(records), first_t, last_t,
+                                               len(payload), zlib.crc32(payload)))
+        self._segment.write(payload)
+        self._segment.flush()
+        # Only index the block once it is on disk in full
+        self._index.write(_INDEX_ENTRY.pack(kind, len(records), first_t, last_t, offset, len(payload)))
+        self._index.flush()
+        self._apply_retention()
+
+    def _open_segment(self):
+        self._close_segment()
+        # Named after the wall-clock time it was started, so names sort oldest first
+        name = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self._segment = open(self.directory / (name + SEGMENT_SUFFIX), 'ab')
+        self._index = open(self.directory / (name + INDEX_SUFFIX), 'ab')
+
+    def _close_segment(self):
+        for f in (self._segment, self._index):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._segment = self._index = None
+
+    def _apply_retention(self):
+        segments = sorted(self.directory.glob('*' + SEGMENT_SUFFIX))
+        sizes = []
+        for path in segments:
+            index = path.with_suffix(INDEX_SUFFIX)
+            size = 0
+            for p in (path, index):
+                try:
+                    size += p.stat().st_size
+                except FileNotFoundError:
+                    pass
+            sizes.append(size)
+        total = sum(sizes)
+        current = Path(self._segment.name) if self._segment is not None else None
+        for path, size in zip(segments, sizes):
+            if total <= self.max_bytes or path == current:
+                break
+            for p in (path, path.with_suffix(INDEX_SUFFIX)):
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.logger.info(f"Track archive over {self.max_bytes} bytes, deleted {path.name}")
+
+
+class ArchiveLogHandler(logging.Handler):
+    """Logging handler that adds each formatted log record to an ArchiveWriter."""
+    def __init__(self, archive, kind=KIND_LOG):
+        super().__init__()
+        self.archive = archive
+        self.kind = kind
+
+    def emit(self, record):
+        try:
+            self.archive.append(self.kind, record.created, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class TrackArchive:
+    """Reads an archive written by ArchiveWriter."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        # Blocks decompressed by query(), to see how much a query had to read
+        self.blocks_read = 0
+
+    def blocks(self):
+        """Returns every complete block in the archive, oldest segment first."""
+        blocks = []
+        for path in sorted(self.directory.glob('*' + SEGMENT_SUFFIX)):
+            try:
+                blocks.extend(self._segment_blocks(path))
+            except OSError:
+                # Deleted by retention while we were reading
+                continue
+        return blocks
+
+    def _segment_blocks(self, path):
+        size = path.stat().st_size
+        blocks = []
+        end = 0
+        try:
+            data = path.with_suffix(INDEX_SUFFIX).read_bytes()
+        except FileNotFoundError:
+            data = b''
+        for i in range(len(data) // _INDEX_ENTRY.size):
+            kind, count, first_t, last_t, offset, length = _INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size)
+            if offset + _BLOCK_HEADER.size + length > size:
+                break
+            blocks.append(Block(path, offset, length, kind, count, first_t, last_t))
+            end = offset + _BLOCK_HEADER.size + length
+        if end < size:
+            # Blocks written after the index was lost or before it was updated
+            blocks.extend(self._scan(path, end, size))
+        return blocks
+
+    def _scan(self, path, offset, size):
+        """Finds complete blocks by reading their headers, from `offset` to the end of the segment."""
+        blocks = []
+        with open(path, 'rb') as f:
+            while offset + _BLOCK_HEADER.size <= size:
+                f.seek(offset)
+                magic, version, kind, count, first_t, last_t, length, crc = \
+                    _BLOCK_HEADER.unpack(f.read(_BLOCK_HEADER.size))
+                if magic != _MAGIC or version != _VERSION or offset + _BLOCK_HEADER.size + length > size:
+                    break
+                if zlib.crc32(f.read(length)) != crc:
+                    break
+                blocks.append(Block(path, offset, length, kind, count, first_t, last_t))
+                offset += _BLOCK_HEADER.size + length
+        return blocks
+
+    def query(self, start_t=None, end_t=None, kinds=None):
+        """Returns the (t, kind, text) records with start_t <= t < end_t, in time order.
+
+        Times are seconds since the epoch; None means unbounded. `kinds` limits
+        the result to those kinds of record.
+        """
+        records = []
+        for block in self.blocks():
+            if kinds is not None and block.kind not in kinds:
+                continue
+            if (start_t is not None and block.last_t < start_t) or (end_t is not None and block.first_t >= end_t):
+                continue
+            try:
+                with open(block.path, 'rb') as f:
+                    f.seek(block.offset + _BLOCK_HEADER.size)
+                    payload = f.read(block.length)
+            except OSError:
+                continue
+            self.blocks_read += 1
+            for t, text in _decode(payload):
+                if (start_t is None or t >= start_t) and (end_t is None or t < end_t):
+                    records.append((t, block.kind, text))
+        records.sort(key=lambda r: r[0])
+        return records
+
+
+def _gpx_time(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _track_point(text, lat_col, lon_col):
+    """Returns (lat, lon) from a track CSV row, or None if that position is missing."""
+    fields = text.split(',')
+    try:
+        return float(fields[lat_col]), float(fields[lon_col])
+    except (IndexError, ValueError):
+        return None
+
+
+def write_gpx(records, out):
+    """Writes track records as GPX tracks of the Starlink and GPS positions, and
+    alerts as waypoints at the Starlink position of the time."""
+    tracks = {"Starlink": (7, 8), "GPS": (9, 10)}
+    points = {name: [] for name in tracks}
+    waypoints = []
+    last = None
+    for t, kind, text in records:
+        if kind == KIND_TRACK:
+            for name, (lat_col, lon_col) in tracks.items():
+                p = _track_point(text, lat_col, lon_col)
+                if p is not None and (not points[name] or points[name][-1][1:] != p):
+                    points[name].append((t,) + p)
+            last = _track_point(text, 7, 8) or last
+        elif kind == KIND_ALERT and last is not None:
+            waypoints.append((t, last, text.partition(' - ')[2] or text))
+
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx version="1.1" creator="diff_starlink_gps.py" xmlns="http://www.topografix.com/GPX/1/1">\n')
+    for t, (lat, lon), text in waypoints:
+        out.write(f'  <wpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{_gpx_time(t)}</time>'
+                  f'<name>{escape(text)}</name></wpt>\n')
+    for name, pts in points.items():
+        if not pts:
+            continue
+        out.write(f'  <trk><name>{escape(name)}</name><trkseg>\n')
+        for t, lat, lon in pts:
+            out.write(f'    <trkpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{_gpx_time(t)}</time></trkpt>\n')
+        out.write('  </trkseg></trk>\n')
+    out.write('</gpx>\n')
+
+
+def _parse_time(value):
+    """Parses a local date or date and time, e.g. 2026-02-03 or "2026-02-03 02:10", to epoch seconds."""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None, log_dir=Path.home() / "logs"):
+    """Command line entry point of `diff_starlink_gps.py archive`."""
+    parser = argparse.ArgumentParser(prog="diff_starlink_gps.py archive",
+                                     description="Query the compressed track, alert and log archive.")
+    parser.add_argument("--archive-dir", type=Path, default=Path(log_dir) / ARCHIVE_DIRNAME,
+                        help=f"Archive directory (default: {Path(log_dir) / ARCHIVE_DIRNAME}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="Show the size and time range of the archive.")
+    export = commands.add_parser("export", help="Export a time range as CSV, GPX or text.")
+    export.add_argument("--from", dest="start", metavar="TIME", type=_parse_time,
+                        help='Local start time, e.g. "2026-02-03 02:10" (default: the beginning).')
+    export.add_argument("--to", dest="end", metavar="TIME", type=_parse_time,
+                        help="Local end time, not included (default: the end).")
+    export.add_argument("--format", choices=("csv", "gpx", "text"), default="csv",
+                        help="csv: track rows as in the daily CSV files; gpx: Starlink and GPS "
+                             "tracks with alerts as waypoints; text: the alert or log lines.")
+    export.add_argument("--kind", choices=("alert", "log"), default="log",
+                        help="Records to export with --format text (default: log).")
+    export.add_argument("-o", "--output", type=Path, help="Output file (default: standard output).")
+    args = parser.parse_args(argv)
+
+    archive = TrackArchive(args.archive_dir)
+    if args.command == "info":
+        blocks = archive.blocks()
+        if not blocks:
+            print(f"No archive in {args.archive_dir}")
+            return 1
+        size = sum(p.stat().st_size for p in args.archive_dir.iterdir() if p.suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX))
+        print(f"{args.archive_dir}: {len({b.path for b in blocks})} segments, {len(blocks)} blocks, "
+              f"{size / 1e6:.1f} MB")
+        for kind, name in KIND_NAMES.items():
+            kind_blocks = [b for b in blocks if b.kind == kind]
+            if kind_blocks:
+                first = datetime.fromtimestamp(min(b.first_t for b in kind_blocks))
+                last = datetime.fromtimestamp(max(b.last_t for b in kind_blocks))
+                print(f"  {name:>5}: {sum(b.count for b in kind_blocks):9d} records from "
+                      f"{first:%Y-%m-%d %H:%M:%S} to {last:%Y-%m-%d %H:%M:%S}")
+        return 0
+
+    kinds = {"csv": {KIND_TRACK}, "gpx": {KIND_TRACK, KIND_ALERT},
+             "text": {KIND_ALERT if args.kind == "alert" else KIND_LOG}}[args.format]
+    records = archive.query(args.start, args.end, kinds)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.format == "gpx":
+            write_gpx(records, out)
+        else:
+            if args.format == "csv":
+                from diff_starlink_gps import CSV_HEADER
+                out.write(CSV_HEADER)
+            for _, _, text in records:
+                out.write(text + '\n')
+    finally:
+        if args.output:
+            out.close()
+    print(f"{len(records)} records from {archive.blocks_read} blocks", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""In-memory ring buffer of recent position fixes.
+
+Fixes are stored column-wise in preallocated arrays, so memory use is fixed
+at about 33 bytes per fix regardless of how long the program runs. Once the
+buffer is full the oldest fixes are overwritten. The latest fix from each
+source is also kept outside the buffer, so a source that has gone quiet is
+still known after the other one has filled the buffer.
+
+Timestamps are clock.monotonic() values, so queries stay correct when the
+wall clock is adjusted (e.g. by NTP after a Raspberry Pi boots without a
+real-time clock). Use wall_time() to convert them for display.
+"""
+
+import math
+from array import array
+from collections import namedtuple
+from datetime import timedelta
+
+SOURCE_GPS = 0
+SOURCE_STARLINK = 1
+SOURCE_NAMES = {SOURCE_GPS: "gps", SOURCE_STARLINK: "starlink"}
+
+# Four hours at 12 fixes a second, about 5.7 MB
+TRACK_STORE_CAPACITY = 4 * 3600 * 12
+
+Fix = namedtuple('Fix', 'time lat lon source sog')
+
+
+class TrackStore:
+    """Fixed-capacity, array-backed store of (time, lat, lon, source, sog) fixes."""
+
+    def __init__(self, clock, capacity=TRACK_STORE_CAPACITY):
+        self.clock = clock
+        self.capacity = capacity
+        self._t = array('d', [0.0]) * capacity
+        self._lat = array('d', [0.0]) * capacity
+        self._lon = array('d', [0.0]) * capacity
+        self._sog = array('d', [0.0]) * capacity
+        self._source = array('B', [0]) * capacity
+        # Total number of fixes ever appended; the next one goes to _count % capacity
+        self._count = 0
+        # Latest Fix from each source, kept even once overwritten in the arrays
+        self._latest = {}
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, source, lat, lon, sog=None, t=None):
+        """Stores a fix taken now, or at monotonic time t, which must not be
+        older than the latest fix. sog may be None if unknown."""
+        i = self._count % self.capacity
+        t = self.clock.monotonic() if t is None else t
+        self._t[i] = t
+        self._lat[i] = lat
+        self._lon[i] = lon
+        self._sog[i] = math.nan if sog is None else sog
+        self._source[i] = source
+        self._latest[source] = Fix(t, lat, lon, source, sog)
+        self._count += 1
+
+    def wall_time(self, t):
+        """Converts a stored timestamp into a datetime."""
+        return self.clock.now() - timedelta(seconds=self.clock.monotonic() - t)
+
+    # --- Latest fix per source, used for the current position state ---
+
+    def latest(self, source):
+        """Returns the most recent Fix from `source`, or None."""
+        return self._latest.get(source)
+
+    def latest_lat(self, source):
+        fix = self._latest.get(source)
+        return None if fix is None else fix.lat
+
+    def latest_lon(self, source):
+        fix = self._latest.get(source)
+        return None if fix is None else fix.lon
+
+    # --- History queries ---
+
+    def _slot(self, n):
+        """Array slot of the n-th oldest fix still held (0 = oldest)."""
+        return (self._count - len(self) + n) % self.capacity
+
+    def _bisect(self, t):
+        """Returns the logical index of the first fix at or after time t."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._t[self._slot(mid)] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _fix(self, i):
+        sog = self._sog[i]
+        return Fix(self._t[i], self._lat[i], self._lon[i], self._source[i],
+                   None if math.isnan(sog) else sog)
+
+    def range(self, t0, t1, source=None):
+        """Returns the fixes with t0 <= time <= t1, oldest first."""
+        fixes = []
+        for n in range(self._bisect(t0), len(self)):
+            i = self._slot(n)
+            if self._t[i] > t1:
+                break
+            if source is None or self._source[i] == source:
+                fixes.append(self._fix(i))
+        return fixes
+
+    def nearest(self, t, source=None):
+        """Returns the fix closest in time to t, or None."""
+        n = self._bisect(t)
+        candidates = []
+        # The closest matching fix before t...
+        for k in range(n - 1, -1, -1):
+            i = self._slot(k)
+            if source is None or self._source[i] == source:
+                candidates.append(i)
+                break
+        # ...and the closest one at or after it
+        for k in range(n, len(self)):
+            i = self._slot(k)
+            if source is None or self._source[i] == source:
+                candidates.append(i)
+                break
+        if not candidates:
+            return None
+        return self._fix(min(candidates, key=lambda i: abs(self._t[i] - t)))
+
+    def downsample(self, t0, t1, step_s, source=None):
+        """Returns at most one fix (the last) per step_s interval between t0 and t1."""
+        fixes = []
+        bucket = None
+        for fix in self.range(t0, t1, source):
+            b = int((fix.time - t0) // step_s)
+            if b == bucket:
+                fixes[-1] = fix
+            else:
+                fixes.append(fix)
+                bucket = b
+        return fixes
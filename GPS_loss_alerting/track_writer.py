@@ -0,0 +1,138 @@
+"""Buffered, background CSV writer for the daily position track files.
+
+Rows are collected in memory and written in batches by a worker thread, so
+the asyncio loop never waits on the SD card and each batch costs one write
+instead of an open/write/close per row. Files rotate at midnight to
+<prefix>_YYYY-MM-DD.csv, based on the timestamp of each row. With keep_days,
+the files of days more than keep_days before the current one are deleted
+whenever a new day's file is started.
+"""
+
+import atexit
+import logging
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+
+from track_archive import KIND_TRACK
+
+# Flush when this many rows are waiting...
+TRACK_FLUSH_ROWS = 500
+# ...or when the oldest waiting row is this many seconds old
+TRACK_FLUSH_INTERVAL_S = 30.0
+
+
+class TrackWriter:
+    """Batches CSV rows in memory and writes them from a background thread."""
+
+    def __init__(self, log_dir, prefix, header,
+                 flush_rows=TRACK_FLUSH_ROWS, flush_interval_s=TRACK_FLUSH_INTERVAL_S, archive=None, keep_days=0):
+        self.log_dir = Path(log_dir)
+        self.prefix = prefix
+        self.header = header
+        # Days of files kept, or 0 to keep them all
+        self.keep_days = keep_days
+        # Optional ArchiveWriter that also receives every row
+        self.archive = archive
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.logger = logging.getLogger(__name__)
+
+        self._rows = []
+        self._cond = threading.Condition()
+        self._closed = False
+        # The file currently open for appending, and the day it belongs to
+        self._file = None
+        self._file_date = None
+
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="track-writer", daemon=True)
+        self._thread.start()
+        # Don't lose buffered rows if the process exits without calling close()
+        atexit.register(self.close)
+
+    def path_for(self, day):
+        """Returns the CSV path for a datetime.date."""
+        return self.log_dir / f"{self.prefix}_{day.isoformat()}.csv"
+
+    def write(self, when, line):
+        """Queues one CSV line (with trailing newline) stamped with datetime `when`."""
+        with self._cond:
+            self._rows.append((when.date(), line))
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify()
+        if self.archive is not None:
+            self.archive.append(KIND_TRACK, when.timestamp(), line.rstrip('\n'))
+
+    def flush(self):
+        """Asks the worker thread to write out everything queued so far."""
+        with self._cond:
+            self._cond.notify()
+
+    def close(self):
+        """Writes all remaining rows and stops the worker thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._rows) < self.flush_rows:
+                    self._cond.wait(self.flush_interval_s)
+                rows, self._rows = self._rows, []
+                closed = self._closed
+            if rows:
+                self._write_rows(rows)
+            if closed:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _write_rows(self, rows):
+        """Writes a batch, switching files whenever the day changes."""
+        try:
+            start = 0
+            for i in range(1, len(rows) + 1):
+                if i == len(rows) or rows[i][0] != rows[start][0]:
+                    self._open_for(rows[start][0])
+                    self._file.write(''.join(line for _, line in rows[start:i]))
+                    start = i
+            self._file.flush()
+        except OSError as e:
+            self.logger.error(f"Error writing track CSV: {e}")
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._file_date = None
+
+    def _open_for(self, day):
+        if day == self._file_date and self._file is not None:
+            return
+        if self._file is not None:
+            self._file.close()
+        path = self.path_for(day)
+        is_new = not path.exists() or path.stat().st_size == 0
+        self._file = open(path, 'a')
+        self._file_date = day
+        if is_new:
+            self._file.write(self.header)
+        if self.keep_days > 0:
+            self._prune(day - timedelta(days=self.keep_days))
+
+    def _prune(self, before):
+        """Deletes the files of days before datetime.date `before`."""
+        for path in self.log_dir.glob(f"{self.prefix}_????-??-??.csv"):
+            try:
+                day = date.fromisoformat(path.stem[len(self.prefix) + 1:])
+            except ValueError:
+                continue
+            if day < before:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    self.logger.error(f"Error deleting old track CSV {path}: {e}")